@@ -12,10 +12,14 @@ app = Flask(__name__)
 CORS(app)
 
 from apis.auth_api import auth_bp
-from apis.scholar_api import scholar
+from apis.scholar_api import scholar, start_dedup_index_loader
+from crawler.get_scholar import scholar_health
+from crawler.proxy_pool import proxy_pool
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(scholar)
+# 启动时在后台加载近似重复索引，加载完成前的请求只做精确去重
+start_dedup_index_loader()
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +29,8 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'message': 'Welcome to EasyRef API',
+        'scholar': scholar_health.snapshot(),
+        'proxies': proxy_pool.snapshot(),
         'timestamp': datetime.now().isoformat()
     })
 
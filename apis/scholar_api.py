@@ -1,14 +1,22 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import io
+import json
+import time
 import uuid
 import logging
+import threading
 
-from apis.auth_api import get_authenticated_client
+from apis.auth_api import get_authenticated_client, supabase_client as public_client
 from crawler.get_scholar import get_google_scholar
 from crawler.enhance_paper_info import enhance_paper_info
-from db.paper_operations import PaperOperations, PDFStorage
+from db.knowledge_base_operations import KnowledgeBaseOperations
+from db.paper_operations import PaperOperations, PDFStorage, normalize_keyword
 from db.supabase_client import SupabaseInitializer
+from db.task_tracker import TaskTracker
 from schemas import SearchTask, SearchResult
-from crawler.bib2text import bibtex_to_text
+from crawler.bib2text import cache_reference, format_references, get_cached_reference, iter_bib_entries, normalize_title
+from crawler.single_flight import SingleFlight
+from paper_utils.dedup_index import NearDuplicateIndex
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +27,64 @@ scholar = Blueprint('scholar', __name__, url_prefix='/api')
 DEFAULT_USER_EMAIL = "jinhanlei@mail.easyref.tech"
 DEFAULT_USER_PASSWORD = "2GHLMCL"
 
+# 相同条件搜索结果的默认复用有效期（秒）
+SEARCH_CACHE_MAX_AGE = 24 * 3600
+
+# 合并并发的相同搜索，以及不同搜索中对同一篇论文的增强
+_search_flight = SingleFlight()
+_paper_flight = SingleFlight()
+
+# 进程内共享的近似重复索引，启动时在后台线程中从数据库加载，之后随入库增量更新
+_dedup_index = None
+_dedup_index_loader = None
+_dedup_index_failed_at = None
+_dedup_index_lock = threading.Lock()
+# 近似重复索引加载失败后重新加载的最小间隔（秒）
+DEDUP_INDEX_RETRY_INTERVAL = 300
+
+
+def _load_dedup_index():
+    global _dedup_index, _dedup_index_loader, _dedup_index_failed_at
+    index = NearDuplicateIndex()
+    try:
+        count = PaperOperations(public_client).load_dedup_index(index)
+    except Exception as e:
+        logger.warning(f"加载近似重复索引失败: {e}")
+        with _dedup_index_lock:
+            _dedup_index_loader = None
+            _dedup_index_failed_at = time.monotonic()
+        return
+    logger.info(f"近似重复索引加载完成，共 {count} 篇论文")
+    with _dedup_index_lock:
+        _dedup_index = index
+        _dedup_index_loader = None
+
+
+def start_dedup_index_loader():
+    """在后台线程中加载近似重复索引；已加载、正在加载或距上次失败不足DEDUP_INDEX_RETRY_INTERVAL时不启动"""
+    global _dedup_index_loader
+    with _dedup_index_lock:
+        if _dedup_index is not None or _dedup_index_loader is not None:
+            return
+        if _dedup_index_failed_at is not None and \
+                time.monotonic() - _dedup_index_failed_at < DEDUP_INDEX_RETRY_INTERVAL:
+            return
+        _dedup_index_loader = threading.Thread(target=_load_dedup_index, name='dedup-index-loader', daemon=True)
+        _dedup_index_loader.start()
+
+
+def get_dedup_index():
+    """
+    获取共享的近似重复索引，不等待加载：索引尚未加载完成或加载失败时返回None（并在后台开始加载），
+    此时只按标题和年份（BibTeX导入时按DOI和规范化标题）精确去重
+
+    Returns:
+        NearDuplicateIndex: 近似重复索引
+    """
+    if _dedup_index is None:
+        start_dedup_index_loader()
+    return _dedup_index
+
 def get_default_user_client():
     """
     获取默认用户的Supabase客户端
@@ -54,6 +120,224 @@ def get_default_user_client():
         logger.error(f"获取默认用户客户端时出错: {e}")
         return None, None
 
+def ensure_paper(paper_ops, pdf_storage, paper_data):
+    """
+    获取或创建论文：数据库中已有则直接返回，否则增强信息、上传PDF并入库
+    不同搜索并发处理同一篇论文时只执行一次，其余等待并共享结果
+    
+    Args:
+        paper_ops: PaperOperations实例
+        pdf_storage: PDFStorage实例
+        paper_data: get_google_scholar返回的论文基础信息
+    
+    Returns:
+        tuple: (论文ID, 新入库的论文信息，已存在时为None)，入库失败时为(None, None)
+    """
+    key = (normalize_title(paper_data['title']), paper_data['pub_year'])
+    return _paper_flight.do(key, _ensure_paper, paper_ops, pdf_storage, paper_data)
+
+
+def _ensure_paper(paper_ops, pdf_storage, paper_data):
+    # 检查数据库中是否已存在相同标题和年份的论文
+    existing_paper = paper_ops.get_paper_by_title_year(
+        paper_data['title'], 
+        paper_data['pub_year']
+    )
+    if existing_paper:
+        return existing_paper['id'], None
+    # 标题略有不同的同一篇论文（如预印本与正式版本）：补充已有论文缺失的信息后直接复用
+    duplicate_id = paper_ops.find_near_duplicate(paper_data)
+    if duplicate_id:
+        paper_ops.merge_paper_info(duplicate_id, paper_data)
+        return duplicate_id, None
+
+    # 如果论文不存在，则调用enhance_paper_info获取更多信息
+    enhanced_paper = enhance_paper_info(paper_data)
+    if 'pdf_content' in enhanced_paper:
+        pdf_content = enhanced_paper.pop('pdf_content')
+        # 存在pdf则上传到bucket
+        if pdf_content:
+            pdf_result = pdf_storage.upload_pdf_from_bytes(pdf_content)
+            if pdf_result and pdf_result.get('success'):
+                enhanced_paper['pdf_url'] = pdf_result.get('pdf_url')
+                enhanced_paper['file_size'] = pdf_result.get('file_size', 0)
+                enhanced_paper['file_hash'] = pdf_result.get('file_hash', 0)
+
+    # 立即入库，等待同一篇论文的其他搜索可以直接引用其ID
+    inserted = paper_ops.batch_insert_papers([enhanced_paper])
+    if not inserted:
+        # 入库失败时不返回ID，避免搜索结果引用不存在的论文；等待的其他搜索共享这一结果
+        logger.error(f"论文入库失败: {enhanced_paper['title']}")
+        return None, None
+    return inserted[0]['id'], enhanced_paper
+
+
+def crawl_papers(paper_ops, pdf_storage, keyword, year_low, year_high, limit_num, start_index=0, on_progress=None):
+    """
+    爬取论文并增强、入库，不涉及具体的搜索会话，可被相同条件的并发搜索共享
+    
+    Args:
+        on_progress: 可选的进度回调，以fetched_num/processed_num关键字参数调用
+    
+    Returns:
+        dict: success、message、papers_id（按结果顺序的论文ID）、data（返回给前端的文本）、cursor
+    """
+    # 调用get_scholar爬取论文
+    papers_data = []
+    cursor = start_index
+    search_generator = get_google_scholar(
+        keyword=keyword,
+        year_low=year_low,
+        year_high=year_high,
+        limit_num=limit_num,
+        start_index=start_index
+    )
+    
+    for item in search_generator:
+        if item.get('completed'):
+            # 得到所有论文
+            papers_data = item.get('data', [])
+            cursor = item.get('cursor', start_index)
+            break
+        if not item.get('success'):
+            return {'success': False, 'message': item.get('message', None)}
+        if on_progress:
+            on_progress(fetched_num=item.get('progress', 0))
+    
+    # 处理每篇论文：增强信息并保存到数据库
+    enhanced_papers = []
+    search_results = []
+    for i, paper_data in enumerate(papers_data):
+        paper_id, enhanced_paper = ensure_paper(paper_ops, pdf_storage, paper_data)
+        if enhanced_paper:
+            enhanced_papers.append(enhanced_paper)
+        # 入库失败的论文不计入搜索结果
+        if paper_id is not None:
+            search_results.append(paper_id)
+        if on_progress:
+            on_progress(processed_num=i + 1)
+
+    title_and_abstracts = ""
+    titles = ""
+    if enhanced_papers:
+        title_and_abstracts = "\n\n".join(["标题：" + paper['title'] + "\n" + "摘要：" + paper['abstract']
+                                         for paper in enhanced_papers])
+    else:
+        titles = "\n".join(["标题：" + paper['title'] for paper in papers_data])
+
+    return {
+        'success': True,
+        'message': f'搜索完成，共处理{len(search_results)}篇论文',
+        'papers_id': search_results,
+        'data': title_and_abstracts if title_and_abstracts else titles,
+        'cursor': cursor,
+    }
+
+
+def run_scholar_search(paper_ops, pdf_storage, task, prior=None):
+    """
+    执行一次完整搜索：爬取论文、增强信息、保存论文与搜索结果，并更新任务状态
+    相同条件的并发搜索共享同一次爬取，各自保存自己的搜索结果
+    
+    Args:
+        paper_ops: PaperOperations实例
+        pdf_storage: PDFStorage实例
+        task: 尚未开始的搜索任务，开始时保存为running
+        prior: 可扩展的已完成搜索（find_expandable_session的结果），传入时复用其结果，
+            只从其谷歌学术游标处继续爬取不足的部分
+    
+    Returns:
+        dict: success、message、papers_id（按结果顺序的论文ID）、data（返回给前端的文本）
+    """
+    tracker = TaskTracker(paper_ops, task)
+    tracker.start()
+    try:
+        prior_papers_id = []
+        start_index = 0
+        limit_num = task.limit_num
+        if prior:
+            prior_papers_id = paper_ops.get_session_paper_ids(prior['session_id'])
+            start_index = prior['scholar_cursor']
+            limit_num = max(task.limit_num - start_index, 0)
+            logger.info(f"扩展已有搜索: {task.keyword}，从第 {start_index} 条继续爬取 {limit_num} 条")
+
+        key = (normalize_keyword(task.keyword), task.year_low, task.year_high, limit_num, start_index)
+        if _search_flight.in_flight(key):
+            logger.info(f"相同的搜索正在进行，等待其结果: {task.keyword}")
+        # 进度只由实际执行爬取的任务记录，合并后定时写库
+        result = _search_flight.do(
+            key, crawl_papers, paper_ops, pdf_storage,
+            task.keyword, task.year_low, task.year_high, limit_num, start_index, tracker.update
+        )
+        if not result['success']:
+            # 搜索出错，更新任务状态
+            tracker.fail(result['message'])
+            logger.error(f"搜索过程中发生错误: {result['message']}")
+            return result
+
+        # 先前的结果在前，增量结果接着编号，跳过已有的论文
+        prior_set = set(prior_papers_id)
+        search_results = prior_papers_id + [paper_id for paper_id in result['papers_id'] if paper_id not in prior_set]
+        paper_ops.insert_search_results(
+            papers_id=search_results,
+            session_id=task.session_id,
+        )
+
+        # 搜索结果全部保存后才标记完成，之后相同的搜索可以复用本次结果
+        tracker.complete(scholar_cursor=result['cursor'], processed_num=len(search_results))
+    except Exception as e:
+        if not tracker.finished:
+            tracker.fail(str(e))
+        raise
+
+    return {**result, 'papers_id': search_results}
+
+
+def load_cached_search(paper_ops, task, max_age):
+    """
+    查找相同条件、在有效期内实际爬取完成的搜索，并将其结果复制到当前会话
+    
+    Args:
+        paper_ops: PaperOperations实例
+        task: 当前搜索任务（尚未保存）
+        max_age: 缓存有效期（秒）
+    
+    Returns:
+        dict: 与run_scholar_search相同的结构，未命中时返回None
+    """
+    cached_session_id = paper_ops.find_cached_session(
+        task.keyword, task.year_low, task.year_high, task.limit_num, max_age
+    )
+    if not cached_session_id:
+        return None
+    papers_id = paper_ops.get_session_paper_ids(cached_session_id, limit=task.limit_num)
+    if not papers_id:
+        return None
+    logger.info(f"命中搜索缓存: {task.keyword} -> {cached_session_id}")
+
+    # 与run_scholar_search相同：搜索结果全部保存后才标记完成，轮询方不会看到没有结果的已完成会话
+    tracker = TaskTracker(paper_ops, task)
+    tracker.start()
+    try:
+        paper_ops.insert_search_results(papers_id=papers_id, session_id=task.session_id)
+        # scholar_cursor保持为0：复制的会话不能作为之后查找缓存的来源，否则每次命中都会延长缓存的有效期
+        tracker.complete(processed_num=len(papers_id))
+    except Exception as e:
+        if not tracker.finished:
+            tracker.fail(str(e))
+        raise
+
+    papers = {paper['id']: paper for paper in paper_ops.get_papers_by_ids(papers_id, columns='id,title,abstract')}
+    text = "\n\n".join(["标题：" + papers[paper_id]['title'] + "\n" + "摘要：" + (papers[paper_id]['abstract'] or '')
+                         for paper_id in papers_id if paper_id in papers])
+    return {
+        'success': True,
+        'message': f'搜索完成（使用缓存结果），共处理{len(papers_id)}篇论文',
+        'papers_id': papers_id,
+        'data': text,
+    }
+
+
 @scholar.route('/scholar_real', methods=['POST'])
 def search_scholar():
     """
@@ -61,11 +345,17 @@ def search_scholar():
     
     1. 接收用户输入的关键词和约束条件
     2. 创建搜索任务并生成session_id
-    3. 调用get_scholar爬取论文
-    4. 对每篇论文进行信息增强处理
-    5. 将论文信息存入数据库
-    6. 将搜索结果分页存入user_search_results表
-    7. 返回session_id给前端
+    3. 相同条件的搜索在有效期内已完成时，直接复用其结果（可选后台刷新）
+    4. 否则调用get_scholar爬取论文
+    5. 对每篇论文进行信息增强处理
+    6. 将论文信息存入数据库
+    7. 将搜索结果分页存入user_search_results表
+    8. 返回session_id给前端
+    
+    可选请求参数:
+        use_cache (bool): 是否复用已完成的相同搜索，默认True
+        max_age (int): 缓存有效期（秒），默认SEARCH_CACHE_MAX_AGE
+        refresh (bool): 命中缓存时是否在后台重新爬取以刷新缓存，默认False
     """
     try:
         # 获取请求数据
@@ -74,6 +364,9 @@ def search_scholar():
         year_low = data.get('year_low')
         year_high = data.get('year_high')
         limit_num = data.get('limit_num', 50)
+        use_cache = data.get('use_cache', True)
+        max_age = data.get('max_age', SEARCH_CACHE_MAX_AGE)
+        refresh = data.get('refresh', False)
         
         # 尝试获取认证用户，如果没有则使用默认用户
         user_id, supabase_client = get_authenticated_client()
@@ -89,10 +382,10 @@ def search_scholar():
         
         # 创建session_id
         session_id = str(uuid.uuid4())
-        paper_ops = PaperOperations(supabase_client)
+        paper_ops = PaperOperations(supabase_client, dedup_index=get_dedup_index())
         pdf_storage = PDFStorage(supabase_client)
 
-        # 创建搜索任务并保存到数据库
+        # 创建搜索任务
         task = SearchTask(
             session_id=session_id,
             user_id=user_id,
@@ -100,81 +393,42 @@ def search_scholar():
             year_low=year_low,
             year_high=year_high,
             limit_num=limit_num,
-            status='running',
         )
-        paper_ops.save_task_to_db(task)
-        
-        # 调用get_scholar爬取论文
-        papers_data = []
-        search_generator = get_google_scholar(
-            keyword=keyword,
-            year_low=year_low,
-            year_high=year_high,
-            limit_num=limit_num
-        )
-        
-        for item in search_generator:
-            if item.get('completed'):
-                # 搜索完成，更新任务状态
-                task.status = 'completed'
-                paper_ops.save_task_to_db(task)
-                # 得到所有论文
-                papers_data = item.get('data', [])
-                break
-            if not item.get('success'):
-                # 搜索出错，更新任务状态
-                task.status = 'error'
-                paper_ops.save_task_to_db(task)
-                logger.error(f"搜索过程中发生错误: {item.get('message', None)}")
-                return jsonify({'error': item.get('message', None)}), 500
-        
-        # 处理每篇论文：增强信息并保存到数据库
-        enhanced_papers = []
-        search_results = []
-        for i, paper_data in enumerate(papers_data):
-            # 检查数据库中是否已存在相同标题和年份的论文
-            existing_paper = paper_ops.get_paper_by_title_year(
-                paper_data['title'], 
-                paper_data['pub_year']
-            )
-            
-            # 如果论文不存在，则调用enhance_paper_info获取更多信息
-            if not existing_paper:
-                enhanced_paper = enhance_paper_info(paper_data)
-                if 'pdf_content' in enhanced_paper:
-                    pdf_content = enhanced_paper.pop('pdf_content')
-                    # 存在pdf则上传到bucket
-                    if pdf_content:
-                        pdf_result = pdf_storage.upload_pdf_from_bytes(pdf_content)
-                        if pdf_result and pdf_result.get('success'):
-                            enhanced_paper['pdf_url'] = pdf_result.get('pdf_url')
-                            enhanced_paper['file_size'] = pdf_result.get('file_size', 0)
-                            enhanced_paper['file_hash'] = pdf_result.get('file_hash', 0)
-
-                enhanced_papers.append(enhanced_paper)
-                search_results.append(enhanced_paper['id'])
-            else:
-                search_results.append(existing_paper['id'])
-
-        title_and_abstracts = ""
-        titles = ""
-        if enhanced_papers:
-            paper_ops.batch_insert_papers(enhanced_papers)
-            title_and_abstracts = "\n\n".join(["标题：" + paper['title'] + "\n" + "摘要：" + paper['abstract']
-                                             for paper in enhanced_papers])
-        else:
-            titles = "\n".join(["标题：" + paper['title'] for paper in papers_data])
 
-        paper_ops.insert_search_results(
-            papers_id=search_results,
-            session_id=session_id,
-        )
+        result = None
+        if use_cache:
+            result = load_cached_search(paper_ops, task, max_age)
+            if result and refresh:
+                # 后台重新爬取，完成后成为该查询最新的缓存
+                refresh_task = SearchTask(
+                    session_id=str(uuid.uuid4()),
+                    user_id=user_id,
+                    keyword=keyword,
+                    year_low=year_low,
+                    year_high=year_high,
+                    limit_num=limit_num,
+                )
+                threading.Thread(
+                    target=run_scholar_search,
+                    args=(paper_ops, pdf_storage, refresh_task),
+                    daemon=True
+                ).start()
+
+        if result is None:
+            # 相同条件的搜索已有部分结果时，只爬取增量部分
+            prior = paper_ops.find_expandable_session(
+                keyword, year_low, year_high, limit_num, max_age
+            ) if use_cache else None
+            # 保存搜索任务到数据库并爬取
+            result = run_scholar_search(paper_ops, pdf_storage, task, prior)
+            if not result['success']:
+                return jsonify({'error': result['message']}), 500
 
         # 返回session_id
         return jsonify({
             'session_id': session_id,
-            'data': title_and_abstracts if title_and_abstracts else titles,
-            'message': f'搜索完成，共处理{len(search_results)}篇论文'
+            'data': result['data'],
+            'message': result['message']
         }), 200
         
     except Exception as e:
@@ -204,10 +458,14 @@ def search_scholar_fake():
         return jsonify({'error': '用户认证失败'}), 401
 
     paper_ops = PaperOperations(supabase_client)
-    papers = paper_ops.search_papers_by_keyword(keyword=keyword)
+    papers = paper_ops.search_papers_by_keyword(keyword=keyword, limit=limit_num)
+    # 优先使用入库时生成的引用，缺失时再格式化bib
+    references = [paper_data.get(f'ref_{style}') for paper_data in papers]
+    missing = [i for i, ref in enumerate(references) if not ref]
+    for i, ref in zip(missing, format_references([papers[i]['bib'] for i in missing], style)):
+        references[i] = ref
     res_text = ""
-    for i, paper_data in enumerate(papers):
-        bib = bibtex_to_text(paper_data['bib'], style)
+    for i, (paper_data, bib) in enumerate(zip(papers, references)):
         res_text += f"{i+1}. {paper_data['title']} \n  摘要：{paper_data['abstract']} \n 引用格式：{bib} \n "
 
     return jsonify({
@@ -216,6 +474,55 @@ def search_scholar_fake():
         'message': f'搜索完成，共处理{len(papers)}篇论文'
     }), 200
 
+@scholar.route('/semantic_search', methods=['POST'])
+def semantic_search():
+    """
+    按语义相似度检索论文：输入一段文字，返回最相关的论文
+    
+    请求参数:
+        text (str): 查询文本，如一段论文内容
+        limit (int): 返回数量，默认20
+        year_low (int): 最早年份，可选
+        year_high (int): 最晚年份，可选
+        kb_id (str): 只在该知识库的论文中检索，可选
+    
+    返回:
+        JSON: 按相似度降序的论文列表
+    """
+    try:
+        data = request.get_json()
+        text = data.get('text')
+        limit = data.get('limit', 20)
+        kb_id = data.get('kb_id')
+        if not text:
+            return jsonify({'error': '缺少text参数'}), 400
+
+        user_id, supabase_client = get_authenticated_client()
+        paper_ops = PaperOperations(supabase_client or public_client)
+        if paper_ops.embedder is None:
+            return jsonify({'error': '未配置向量模型，无法进行语义检索'}), 501
+        paper_ids = None
+        if kb_id:
+            # 使用请求用户的客户端读取知识库，私有知识库只有所有者和成员可以检索
+            kb_ops = KnowledgeBaseOperations(supabase_client or public_client)
+            if not kb_ops.can_read_knowledge_base(kb_id, user_id):
+                return jsonify({'error': '知识库不存在或无权访问'}), 403
+            paper_ids = kb_ops.get_knowledge_base_paper_ids(kb_id)
+        if paper_ids is not None and not paper_ids:
+            papers = []
+        else:
+            papers = paper_ops.semantic_search(
+                text, limit=limit, year_low=data.get('year_low'), year_high=data.get('year_high'),
+                paper_ids=paper_ids
+            )
+        return jsonify({
+            'data': papers,
+            'message': f'检索完成，共找到{len(papers)}篇论文'
+        }), 200
+    except Exception as e:
+        logger.error(f"语义检索时发生错误: {e}", exc_info=True)
+        return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
+
 @scholar.route('/bib2text', methods=['POST'])
 def convert_bib2text():
     """
@@ -241,8 +548,16 @@ def convert_bib2text():
         if style not in ['apa', 'mla', 'gb7714']:
             return jsonify({'error': '不支持的格式，支持的格式: apa, mla, gb7714'}), 400
         
-        # 调用bibtex_to_text函数进行转换
-        converted_text = bibtex_to_text(bib_str, style)
+        # 先查内存缓存，未命中时已入库的论文直接返回预先生成的引用（papers表公开可读，无需认证）
+        converted_text = get_cached_reference(bib_str, style)
+        if converted_text is None:
+            stored = PaperOperations(public_client).get_references_by_bib(bib_str)
+            converted_text = stored.get(f'ref_{style}') if stored else None
+            if converted_text:
+                cache_reference(bib_str, style, converted_text)
+            else:
+                # 转换为文本引用并写入缓存
+                converted_text = format_references([bib_str], style)[0]
         
         # 返回结果
         return jsonify({
@@ -254,3 +569,74 @@ def convert_bib2text():
     except Exception as e:
         logger.error(f"BibTeX转换过程中发生错误: {e}", exc_info=True)
         return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
+
+@scholar.route('/bib_import', methods=['POST'])
+def import_bib_file():
+    """
+    导入BibTeX文件：逐条流式解析，按DOI/规范化标题去重，新论文分块入库
+    
+    请求参数(multipart/form-data):
+        file: .bib文件
+        style (str): 引用格式，可选值: 'apa'(默认), 'mla', 'gb7714'
+        chunk_size (int): 每块处理的条目数，默认200
+    
+    返回:
+        NDJSON流: 每块一行，包含该块的格式化引用、新入库数、重复数和缺少DOI与标题而跳过的条目数；
+        最后一行为汇总，查询已有论文失败或有论文入库失败时最后一行为error
+    """
+    bib_file = request.files.get('file')
+    style = request.form.get('style', 'apa')
+    chunk_size = request.form.get('chunk_size', 200, type=int)
+
+    if not bib_file:
+        return jsonify({'error': '缺少file参数'}), 400
+
+    if style not in ['apa', 'mla', 'gb7714']:
+        return jsonify({'error': '不支持的格式，支持的格式: apa, mla, gb7714'}), 400
+
+    # 尝试获取认证用户，如果没有则使用默认用户
+    user_id, supabase_client = get_authenticated_client()
+    if not user_id or not supabase_client:
+        logger.info("未检测到认证用户，使用默认用户")
+        user_id, supabase_client = get_default_user_client()
+
+    if not user_id:
+        return jsonify({'error': '用户认证失败'}), 401
+
+    paper_ops = PaperOperations(supabase_client, dedup_index=get_dedup_index())
+
+    def generate():
+        total = inserted = duplicates = skipped = failed = 0
+        try:
+            fp = io.TextIOWrapper(bib_file.stream, encoding='utf-8', errors='replace')
+            for chunk in paper_ops.import_bib_entries(iter_bib_entries(fp), style, max(chunk_size, 1)):
+                total += len(chunk['references'])
+                inserted += chunk['inserted']
+                duplicates += chunk['duplicates']
+                skipped += chunk['skipped']
+                failed += chunk.get('failed', 0)
+                yield json.dumps(chunk, ensure_ascii=False) + '\n'
+            if failed:
+                yield json.dumps({
+                    'completed': True,
+                    'total': total,
+                    'inserted': inserted,
+                    'duplicates': duplicates,
+                    'skipped': skipped,
+                    'failed': failed,
+                    'error': f'导入论文失败: 共处理{total}条，新增{inserted}篇论文，{failed}篇论文入库失败'
+                }, ensure_ascii=False) + '\n'
+                return
+            yield json.dumps({
+                'completed': True,
+                'total': total,
+                'inserted': inserted,
+                'duplicates': duplicates,
+                'skipped': skipped,
+                'message': f'导入完成，共处理{total}条，新增{inserted}篇论文，跳过缺少DOI和标题的{skipped}条'
+            }, ensure_ascii=False) + '\n'
+        except Exception as e:
+            logger.error(f"BibTeX导入过程中发生错误: {e}", exc_info=True)
+            yield json.dumps({'completed': True, 'error': f'服务器内部错误: {str(e)}'}, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
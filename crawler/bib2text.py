@@ -1,8 +1,264 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
 import bibtexparser
 from apiModels import DBLPBibTeX
 from bibtexparser.bparser import BibTexParser
+from bibtexparser.bibdatabase import BibDatabase, STANDARD_TYPES
 from bibtexparser.customization import convert_to_unicode
 
+# DBLP单条记录的快速解析：@type{key, field = {value}, ... }
+_ENTRY_HEAD_RE = re.compile(r'\s*@(\w+)\s*\{\s*([^,\s{}]+)\s*,')
+_FIELD_NAME_RE = re.compile(r'\s*([\w\-]+)\s*=\s*')
+_NUMBER_RE = re.compile(r'\d+')
+_COMMA_RE = re.compile(r'\s*,')
+_ENTRY_END_RE = re.compile(r'\s*\}\s*')
+# 流式切分条目时关注的记号：转义字符、行首的@、@和括号
+_BLOCK_TOKEN_RE = re.compile(r'\\[\\{}]|\n[ \t]*@|[@{}()]')
+# 未读完文件时，最后这些字符中的记号可能不完整（如行首@前的缩进），留到下次读取后再扫描
+_BLOCK_TOKEN_MAX_LEN = 64
+_NON_ENTRY_TYPES = ('string', 'preamble', 'comment')
+
+# 格式化引用的LRU缓存：(bib哈希, 格式) -> 引用文本
+REFERENCE_STYLES = ('apa', 'mla', 'gb7714')
+REFERENCE_CACHE_SIZE = 8192
+_reference_cache = OrderedDict()
+_reference_cache_lock = threading.Lock()
+
+
+def _fast_parse_entry(bib):
+    """
+    快速解析只包含一个标准类型条目、字段值均为{...}或数字的BibTeX（如DBLP返回的记录）
+
+    Args:
+        bib (str): BibTeX字符串
+
+    Returns:
+        dict: 与bibtexparser+convert_to_unicode一致的条目，格式不符合时返回None
+    """
+    head = _ENTRY_HEAD_RE.match(bib)
+    # bibtexparser默认忽略非标准类型（如@software），这些条目交给bibtexparser处理以保证结果一致
+    if not head or head.group(1).lower() not in STANDARD_TYPES:
+        return None
+    entry = {}
+    pos = head.end()
+    while True:
+        name = _FIELD_NAME_RE.match(bib, pos)
+        if not name:
+            break
+        pos = name.end()
+        if bib.startswith('{', pos):
+            # 找到与之配对的右括号
+            depth = 0
+            for end in range(pos, len(bib)):
+                if bib[end] == '{':
+                    depth += 1
+                elif bib[end] == '}':
+                    depth -= 1
+                    if depth == 0:
+                        break
+            else:
+                return None
+            value = bib[pos + 1:end]
+            pos = end + 1
+        else:
+            number = _NUMBER_RE.match(bib, pos)
+            if not number:
+                return None
+            value = number.group()
+            pos = number.end()
+        # 与bibtexparser一致：去掉续行的行首空白，空值记为''，重复的字段保留第一个值
+        lines = value.split('\n')
+        value = '\n'.join([lines[0]] + [line.lstrip() for line in lines[1:]])
+        entry.setdefault(name.group(1).lower(), '' if value == '{}' else value)
+        comma = _COMMA_RE.match(bib, pos)
+        if not comma:
+            break
+        pos = comma.end()
+    # 必须恰好在条目结尾处结束，否则交给bibtexparser处理；没有字段的条目bibtexparser不返回，同样交给它处理
+    if not entry or not _ENTRY_END_RE.fullmatch(bib, pos):
+        return None
+    entry['ENTRYTYPE'] = head.group(1).lower()
+    entry['ID'] = head.group(2)
+    return convert_to_unicode(entry)
+
+
+def extract_bib_field(bib, field):
+    """
+    不做完整解析，直接取出BibTeX中某个{...}字段的原始值，用于快速比对标题等
+
+    Args:
+        bib (str): BibTeX字符串
+        field (str): 字段名
+
+    Returns:
+        str: 字段原始值，找不到时返回None
+    """
+    if not bib:
+        return None
+    match = re.search(r'[,\s]' + re.escape(field) + r'\s*=\s*\{', bib, re.I)
+    if not match:
+        return None
+    depth = 1
+    for end in range(match.end(), len(bib)):
+        if bib[end] == '{':
+            depth += 1
+        elif bib[end] == '}':
+            depth -= 1
+            if depth == 0:
+                return bib[match.end():end]
+    return None
+
+
+def parse_bib(bib):
+    """
+    解析BibTeX字符串为条目列表，单条DBLP记录走快速路径，其余使用bibtexparser
+
+    Args:
+        bib (str): 原始BibTeX字符串
+
+    Returns:
+        list: 条目字典列表
+    """
+    if not bib or not isinstance(bib, str):
+        return []
+    entry = _fast_parse_entry(bib)
+    if entry is not None:
+        return [entry]
+    parser = BibTexParser()
+    parser.customization = convert_to_unicode  # 处理特殊字符
+    return bibtexparser.loads(bib, parser=parser).entries
+
+
+def iter_bib_blocks(fp, read_size=1 << 16):
+    """
+    从文件流中逐条切分BibTeX条目，只在内存中保留当前条目。
+    支持@type{...}和@type(...)两种写法，忽略转义的\\{和\\}；
+    括号没有闭合的条目在下一个行首的@处丢弃，从该处重新开始切分
+
+    Args:
+        fp: 文本文件对象
+        read_size (int): 每次读取的字符数
+
+    Yields:
+        str: 单个条目的原始文本
+    """
+    buf = ''
+    pos = 0  # buf中下一个待扫描的位置
+    begin = None  # 当前条目在buf中的起点
+    opener = None  # 当前条目的左括号，尚未读到时为None
+    depth = 0  # 花括号深度
+    eof = False
+    while not eof:
+        data = fp.read(read_size)
+        eof = not data
+        buf += data
+        end = len(buf) if eof else max(pos, len(buf) - _BLOCK_TOKEN_MAX_LEN)
+        for token in _BLOCK_TOKEN_RE.finditer(buf, pos, end):
+            pos = token.end()
+            char = token.group()
+            if char[0] == '\\':
+                continue
+            if char[-1] == '@':
+                # 行首的@总是开始新条目；行中的@只在条目之外开始新条目（如字段值中的邮箱）
+                if begin is None or opener is None or char[0] == '\n':
+                    begin = token.end() - 1
+                    opener = None
+                    depth = 0
+                continue
+            if begin is None:
+                continue
+            if opener is None:
+                if char in '{(':
+                    opener = char
+                    depth = 1 if char == '{' else 0
+                else:
+                    begin = None
+            elif char == '{':
+                depth += 1
+            elif char == '}' and depth > 0:
+                depth -= 1
+                if depth == 0 and opener == '{':
+                    yield buf[begin:pos]
+                    begin = None
+            elif char == ')' and opener == '(' and depth == 0:
+                yield buf[begin:pos]
+                begin = None
+        pos = max(pos, end - _BLOCK_TOKEN_MAX_LEN) if not eof else pos
+        # 丢弃已处理的文本
+        cut = begin if begin is not None else min(pos, len(buf))
+        buf = buf[cut:]
+        pos -= cut
+        if begin is not None:
+            begin = 0
+
+
+def iter_bib_entries(fp):
+    """
+    流式解析BibTeX文件，逐条返回原始文本与解析结果，无法解析的条目会被跳过
+
+    Args:
+        fp: 文本文件对象
+
+    Yields:
+        tuple: (条目原始文本, 条目字典)
+    """
+    for block in iter_bib_blocks(fp):
+        head = _ENTRY_HEAD_RE.match(block)
+        if head and head.group(1).lower() in _NON_ENTRY_TYPES:
+            continue
+        try:
+            entries = parse_bib(block)
+        except Exception:
+            print(f"处理BibTeX条目时出错：{block}")
+            continue
+        for entry in entries:
+            yield block, entry
+
+
+def normalize_title(title):
+    """规范化标题用于去重：转小写并去掉空白和标点，与papers表的title_norm列一致"""
+    if not title:
+        return ''
+    return re.sub(r'[\W_]+', '', title.lower())
+
+
+def normalize_doi(doi):
+    """规范化DOI：转小写并去掉https://doi.org/等前缀，与papers表的doi_norm列一致"""
+    if not doi:
+        return ''
+    doi = doi.strip().lower()
+    return re.sub(r'^(https?://)?(dx\.)?doi\.org/|^doi:\s*', '', doi)
+
+
+def clean_entries(entries):
+    """
+    去除标题重复的条目
+
+    Args:
+        entries (list): 已解析的条目列表
+
+    Returns:
+        list: 清理后的条目列表
+    """
+    # 跟踪已处理的标题以避免重复
+    processed_titles = set()
+    cleaned_entries = []
+    for entry in entries:
+        # 获取标题并标准化
+        title = entry.get('title', '').strip().lower()
+        # 如果标题已存在，则跳过该条目
+        if title and title in processed_titles:
+            continue
+        # 添加标题到已处理集合
+        if title:
+            processed_titles.add(title)
+        # 将条目添加到清理后的列表中
+        cleaned_entries.append(entry)
+    return cleaned_entries
+
+
 def clean_bib(bib):
     """
     清理并规范化BibTeX条目，去除重复项并修复格式问题
@@ -16,29 +272,10 @@ def clean_bib(bib):
     if not bib or not isinstance(bib, str):
         return ""
     
-    # 使用bibtexparser解析BibTeX，这比手动解析更健壮
     try:
-        parser = BibTexParser()
-        parser.customization = convert_to_unicode
-        bib_database = bibtexparser.loads(bib, parser=parser)
-        # 跟踪已处理的标题以避免重复
-        processed_titles = set()
-        cleaned_entries = []
-        # 处理每个条目
-        for entry in bib_database.entries:
-            # 获取标题并标准化
-            title = entry.get('title', '').strip().lower()
-            # 如果标题已存在，则跳过该条目
-            if title and title in processed_titles:
-                continue
-            # 添加标题到已处理集合
-            if title:
-                processed_titles.add(title)
-            # 将条目添加到清理后的列表中
-            cleaned_entries.append(entry)
         # 创建新的BibDatabase并写回字符串
-        cleaned_database = bibtexparser.bibdatabase.BibDatabase()
-        cleaned_database.entries = cleaned_entries
+        cleaned_database = BibDatabase()
+        cleaned_database.entries = clean_entries(parse_bib(bib))
         return bibtexparser.dumps(cleaned_database)
     except Exception:
         print(f"处理BibTeX条目时出错：{bib}")
@@ -225,24 +462,105 @@ def remove_trailing_punctuation(text):
     return text.strip()
 
 
+def entry_to_text(entry, style='apa'):
+    """将单个已解析条目转换为格式化文本"""
+    real_ref = format_reference(entry, style)
+    # 去除末尾的逗号和冒号
+    real_ref = remove_trailing_punctuation(real_ref)
+    return real_ref.strip() + '.'
+
+
+def entries_to_text(entries, style='apa'):
+    """将已解析的条目列表转换为格式化文本，清理与格式化共用同一次解析结果"""
+    return '\n'.join(entry_to_text(entry, style) for entry in clean_entries(entries))
+
+
 def bibtex_to_text(bibtex_str, style='apa'):
     """主函数：将BibTeX字符串转换为格式化文本"""
-    # 先清理BibTeX数据
-    cleaned_bibtex = clean_bib(bibtex_str)
-    
-    parser = BibTexParser()
-    parser.customization = convert_to_unicode  # 处理特殊字符
-    bib_db = bibtexparser.loads(cleaned_bibtex, parser=parser)
+    return entries_to_text(parse_bib(bibtex_str), style)
+
+def bib_hash(bib):
+    """计算bib的哈希，用于缓存以及papers表的bib_hash列"""
+    return hashlib.sha1(bib.encode('utf-8')).hexdigest()
 
-    output = []
-    for entry in bib_db.entries:
-        real_ref = format_reference(entry, style)
-        # 去除末尾的逗号和冒号
-        real_ref = remove_trailing_punctuation(real_ref)
 
-        output.append(real_ref.strip() + '.')
+def get_cached_reference(bib, style='apa'):
+    """
+    只查询格式化引用的缓存，不做转换
+
+    Returns:
+        str: 缓存的引用文本，未命中时为None
+    """
+    key = (bib_hash(bib), style)
+    with _reference_cache_lock:
+        text = _reference_cache.get(key)
+        if text is not None:
+            _reference_cache.move_to_end(key)
+    return text
+
+
+def cache_reference(bib, style, text):
+    """将格式化引用写入缓存，如从papers表读取的预先生成的引用"""
+    with _reference_cache_lock:
+        _reference_cache[(bib_hash(bib), style)] = text
+        if len(_reference_cache) > REFERENCE_CACHE_SIZE:
+            _reference_cache.popitem(last=False)
+
+
+def format_references(bibs, style='apa'):
+    """
+    批量将BibTeX转换为格式化引用，结果按(bib哈希, 格式)缓存，重复渲染同一篇论文时直接命中
+
+    Args:
+        bibs (list): BibTeX字符串列表，可包含None
+        style (str): 引用格式，可选值: 'apa', 'mla', 'gb7714'
+
+    Returns:
+        list: 与输入一一对应的引用文本，bib为空时为''
+    """
+    results = []
+    batch = {}
+    for bib in bibs:
+        if not bib or not isinstance(bib, str):
+            results.append('')
+            continue
+        key = (bib_hash(bib), style)
+        if key not in batch:
+            text = get_cached_reference(bib, style)
+            if text is None:
+                text = bibtex_to_text(bib, style)
+                cache_reference(bib, style, text)
+            batch[key] = text
+        results.append(batch[key])
+    return results
+
+
+def reference_fields(bib, entries=None):
+    """
+    解析一次bib并生成所有格式的引用，用于在入库时写入papers表
+
+    Args:
+        bib (str): BibTeX字符串
+        entries (list, optional): 已解析的条目，传入时不再重复解析
+
+    Returns:
+        dict: bib_hash及ref_apa、ref_mla、ref_gb7714字段，bib为空或解析失败时均为None
+    """
+    fields = {'bib_hash': None}
+    fields.update({f'ref_{style}': None for style in REFERENCE_STYLES})
+    if not bib or not isinstance(bib, str):
+        return fields
+    fields['bib_hash'] = bib_hash(bib)
+    if entries is None:
+        try:
+            entries = parse_bib(bib)
+        except Exception:
+            print(f"处理BibTeX条目时出错：{bib}")
+            return fields
+    for style in REFERENCE_STYLES:
+        fields[f'ref_{style}'] = entries_to_text(entries, style) or None
+    return fields
 
-    return '\n'.join(output)
 
 if __name__ == '__main__':
     fetcher = DBLPBibTeX()
@@ -250,7 +568,6 @@ if __name__ == '__main__':
     print(bibtex_data)
 
     print("APA格式:")
-    bibtex_data = clean_bib(bibtex_data)
     print(bibtex_to_text(bibtex_data, 'apa'))
 
     print("\nMLA格式:")
@@ -2,12 +2,15 @@ import re
 import bs4
 from playwright.sync_api import sync_playwright
 from semanticscholar import SemanticScholar
+from crawler.rate_limiter import rate_limiter
+from crawler.proxy_pool import proxy_pool, playwright_launch_options
 
 abs_len = 30
 
 def get_abstract_from_semanticscholar(title):
     sch = SemanticScholar(timeout=10, retry=False)
-    results = sch.search_paper(title, fields=["title", "abstract"], limit=1)
+    with rate_limiter.slot('api.semanticscholar.org'):
+        results = sch.search_paper(title, fields=["title", "abstract"], limit=1)
     if results[0]["abstract"]:
         return re.sub(r"\s+", " ", results[0]["abstract"].strip())
     else:
@@ -15,10 +18,18 @@ def get_abstract_from_semanticscholar(title):
 
 
 def abstract_scraper(url):
+    proxy = proxy_pool.acquire()
     with sync_playwright() as p:
-        browser = p.firefox.launch()
+        browser = p.firefox.launch(**playwright_launch_options(proxy))
         page = browser.new_page()
-        page.goto(url, timeout=300000)
+        try:
+            with rate_limiter.slot(url):
+                response = page.goto(url, timeout=300000)
+        except Exception:
+            proxy_pool.report_failure(proxy)
+            raise
+        if response is not None:
+            proxy_pool.report_status(proxy, response.status)
         html = page.content()
     html = re.sub("<br>", "\n", html)
     soup = convert_html2soup(html)
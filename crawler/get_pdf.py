@@ -3,6 +3,8 @@ from playwright.sync_api import sync_playwright
 import ssl
 from typing import Dict, List, Optional, Tuple
 
+from crawler.rate_limiter import rate_limiter, rate_limited_get
+from crawler.proxy_pool import proxy_pool, playwright_launch_options
 from paper_utils.pdf_fast_reader import PDFFastReader
 
 ssl._create_default_https_context = ssl._create_unverified_context
@@ -50,7 +52,7 @@ def download_single_pdf_content(url: str) -> Optional[bytes]:
         bytes: PDF文件的字节内容，下载失败时返回None
     """
     try:
-        response = requests.get(url, timeout=30)
+        response = rate_limited_get(url, timeout=30, pool=proxy_pool)
         if response.status_code == 200 and is_pdf_response(response):
             content = response.content
             # 双重检查确保内容确实是PDF格式
@@ -69,11 +71,15 @@ def download_from_weburl_content(url: str) -> Optional[bytes]:
     在网页中查找PDF链接并下载内容，返回PDF字节数据，找不到则返回None。
     """
     pdf_url = None
+    proxy = proxy_pool.acquire()
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
+        browser = p.chromium.launch(headless=True, **playwright_launch_options(proxy))
         page = browser.new_page()
         try:
-            page.goto(url, timeout=15000)
+            with rate_limiter.slot(url):
+                response = page.goto(url, timeout=15000)
+            if response is not None:
+                proxy_pool.report_status(proxy, response.status)
             links = page.query_selector_all('a')
             for link in links:
                 href = link.get_attribute('href')
@@ -84,7 +90,7 @@ def download_from_weburl_content(url: str) -> Optional[bytes]:
                     pdf_url = href
                     break
         except Exception:
-            pass
+            proxy_pool.report_failure(proxy)
         browser.close()
     if pdf_url:
         return download_single_pdf_content(pdf_url)
@@ -94,22 +100,24 @@ def download_from_weburl_content(url: str) -> Optional[bytes]:
 def get_bing_search_results(question: str) -> List[dict]:
     """获取Bing搜索结果"""
     results = []
+    proxy = proxy_pool.acquire()
     try:
         with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
+            browser = p.chromium.launch(headless=True, **playwright_launch_options(proxy))
             context = browser.new_context()
             page = context.new_page()
             page.set_default_timeout(10000)
-            try:
-                page.goto(f"https://www.bing.com/search?q={question}")
-            except:
-                page.goto("https://www.bing.com")
-                page.fill('input[name="q"]', question)
-                page.press('input[name="q"]', 'Enter')
-            try:
-                page.wait_for_load_state('networkidle', timeout=5000)
-            except:
-                pass
+            with rate_limiter.slot('bing.com'):
+                try:
+                    page.goto(f"https://www.bing.com/search?q={question}")
+                except:
+                    page.goto("https://www.bing.com")
+                    page.fill('input[name="q"]', question)
+                    page.press('input[name="q"]', 'Enter')
+                try:
+                    page.wait_for_load_state('networkidle', timeout=5000)
+                except:
+                    pass
             search_results = page.query_selector_all('.b_algo h2')
             for result in search_results:
                 title = result.inner_text()
@@ -121,8 +129,9 @@ def get_bing_search_results(question: str) -> List[dict]:
                     continue
                 results.append({'title': title, 'url': url})
             browser.close()
+        proxy_pool.report_success(proxy)
     except Exception:
-        pass
+        proxy_pool.report_failure(proxy)
     return results
 
 def download_from_bing_single_content(title: str) -> Optional[bytes]:
@@ -1,21 +1,80 @@
-import time
 import uuid
-import re
-import bibtexparser
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from apiModels import DBLPBibTeX
-from bibtexparser.bparser import BibTexParser
 from scholarly import scholarly, ProxyGenerator
-from config import PROXY_CONFIG
+from crawler.bib2text import extract_bib_field, normalize_title
+from crawler.proxy_pool import proxy_pool
+from crawler.rate_limiter import rate_limiter
+from crawler.service_health import ServiceHealth
+from paper_utils.dedup_index import NearDuplicateIndex
 from schemas import Paper
 import logging
 logger = logging.getLogger(__name__)
 
-if PROXY_CONFIG['enabled']:
-    pg = ProxyGenerator()
-    success = pg.SingleProxy(PROXY_CONFIG['http'])
+# DBLP BibTeX缓存：(规范化标题, 年份) -> bibtex，查不到时为''
+BIBTEX_CACHE_SIZE = 4096
+_bibtex_cache = OrderedDict()
+_bibtex_cache_lock = threading.Lock()
 
-    # 第二个参数ProxyGenerator()代表强制使用代理
-    scholarly.use_proxy(pg, ProxyGenerator())
+SCHOLAR_HOST = 'scholar.google.com'
+
+# 谷歌学术的共享健康状态：由真实搜索结果更新，连续失败后熔断，熔断冷却结束后由后台探测恢复
+scholar_health = ServiceHealth('谷歌学术', ttl=300, failure_threshold=3, reset_timeout=60)
+
+# 被封禁或出现验证码时最多切换几次代理，切换后从中断处继续爬取
+MAX_PROXY_ROTATIONS = 3
+# scholarly全局只能使用一个代理，这里记录当前使用的代理
+_scholar_proxy = None
+_scholar_proxy_lock = threading.Lock()
+
+
+class ScholarRequestError(Exception):
+    """请求谷歌学术失败（不可达、被封禁或出现验证码），与处理结果时的程序错误区分，只有这类错误计入健康状态"""
+
+
+def use_scholar_proxy(exclude=None):
+    """
+    从代理池选取一个可用的代理供scholarly使用，代理池为空时不做任何事
+
+    Args:
+        exclude: 需要换掉的代理，如刚被封禁的代理；若其他线程已经换过则直接返回当前代理
+
+    Returns:
+        Proxy: scholarly当前使用的代理
+    """
+    global _scholar_proxy
+    if not proxy_pool.enabled:
+        return None
+    with _scholar_proxy_lock:
+        if exclude is not None and _scholar_proxy is not exclude:
+            return _scholar_proxy
+        for _ in range(len(proxy_pool.proxies)):
+            proxy = proxy_pool.acquire(exclude=exclude)
+            pg = ProxyGenerator()
+            if pg.SingleProxy(http=proxy.url, https=proxy.url):
+                # 第二个参数ProxyGenerator()代表强制使用代理
+                scholarly.use_proxy(pg, ProxyGenerator())
+                _scholar_proxy = proxy
+                return proxy
+            proxy_pool.report_failure(proxy)
+            exclude = proxy
+        logger.warning("代理池中没有可用的代理，继续使用当前代理")
+        return _scholar_proxy
+
+
+def throttle_scholar():
+    """请求谷歌学术前等待：使用代理时按该代理的预算，否则按谷歌学术站点的预算"""
+    proxy = _scholar_proxy
+    if proxy is not None:
+        proxy.throttle()
+    else:
+        rate_limiter.acquire(SCHOLAR_HOST)
+
+
+if proxy_pool.enabled:
+    use_scholar_proxy()
 
 def check_scholar_availability():
     """
@@ -25,14 +84,96 @@ def check_scholar_availability():
     """
     try:
         # 尝试一个简单的查询
+        throttle_scholar()
         next(scholarly.search_pubs('test', year_low=2023, year_high=2023))
+        proxy_pool.report_success(_scholar_proxy)
         return True
     except Exception as e:
         logger.warning(f"谷歌学术不可达: {e}")
+        # 可能是当前代理被封禁，换一个代理供下次使用
+        if _scholar_proxy is not None:
+            proxy = _scholar_proxy
+            proxy_pool.report_failure(proxy, blocked=True)
+            use_scholar_proxy(exclude=proxy)
         return False
 
 
-def get_google_scholar(keyword, year_low=None, year_high=None, limit_num=5):
+def iter_scholar_pubs(keyword, year_low=None, year_high=None, start_index=0):
+    """
+    逐条返回谷歌学术的搜索结果；当前代理被封禁或出现验证码时切换代理，并从中断处继续
+
+    Args:
+        keyword (str): 搜索关键词
+        year_low (int, optional): 最早年份
+        year_high (int, optional): 最晚年份
+        start_index (int, optional): 从谷歌学术结果的第几条开始
+
+    Yields:
+        dict: scholarly返回的论文信息
+
+    Raises:
+        ScholarRequestError: 请求失败且不能再切换代理时抛出
+    """
+    consumed = 0
+    rotations = 0
+    while True:
+        proxy = _scholar_proxy
+        try:
+            throttle_scholar()
+            searched_scholar = scholarly.search_pubs(query=keyword, year_low=year_low, year_high=year_high,
+                                                     start_index=start_index + consumed)
+            # 第一页已返回，说明谷歌学术可达
+            scholar_health.record_success()
+            proxy_pool.report_success(proxy)
+            for pub in searched_scholar:
+                consumed += 1
+                yield pub
+            return
+        except Exception as e:
+            if proxy is None or rotations >= MAX_PROXY_ROTATIONS:
+                raise ScholarRequestError(f"谷歌学术请求失败: {e}") from e
+            rotations += 1
+            logger.warning(f"谷歌学术请求失败，切换代理后从第 {start_index + consumed} 条继续: {e}")
+            proxy_pool.report_failure(proxy, blocked=True)
+            use_scholar_proxy(exclude=proxy)
+
+
+def resolve_bibtex(title, pub_year):
+    """
+    从DBLP获取论文的BibTeX，只有标题一致时才返回，结果按规范化标题+年份缓存
+
+    Args:
+        title (str): 论文标题
+        pub_year: 发表年份
+
+    Returns:
+        str: BibTeX字符串，找不到或标题不一致时返回None
+    """
+    key = (normalize_title(title), str(pub_year))
+    with _bibtex_cache_lock:
+        if key in _bibtex_cache:
+            _bibtex_cache.move_to_end(key)
+            return _bibtex_cache[key] or None
+
+    try:
+        with rate_limiter.slot('dblp.org'):
+            bibtex = DBLPBibTeX().get_bibtex(f"title:{title} year:{pub_year}")
+    except Exception as e:
+        logger.warning(f"从DBLP获取BibTeX失败: {title}, 错误: {e}")
+        return None
+
+    real_bibtex = ''
+    # 只有标题存在且两个标题相同才赋值，直接取title字段比对，无需完整解析
+    if bibtex and normalize_title(extract_bib_field(bibtex, 'title')) == key[0]:
+        real_bibtex = bibtex
+    with _bibtex_cache_lock:
+        _bibtex_cache[key] = real_bibtex
+        if len(_bibtex_cache) > BIBTEX_CACHE_SIZE:
+            _bibtex_cache.popitem(last=False)
+    return real_bibtex or None
+
+
+def get_google_scholar(keyword, year_low=None, year_high=None, limit_num=5, bib_workers=4, start_index=0):
     """
     使用scholarly查询论文
     
@@ -41,11 +182,14 @@ def get_google_scholar(keyword, year_low=None, year_high=None, limit_num=5):
         year_low (int, optional): 最早年份
         year_high (int, optional): 最晚年份
         limit (int, optional): 爬取到的论文数量限制
+        bib_workers (int, optional): 并发获取DBLP BibTeX的线程数，与谷歌学术翻页同时进行
+        start_index (int, optional): 从谷歌学术结果的第几条开始，用于接着之前的搜索继续爬取
     Yields:
-        dict: 每篇论文的基础信息或最终结果
+        dict: 每篇论文的基础信息或最终结果，最终结果中的cursor为下次继续爬取的起点
     """
-    # 先检查谷歌学术是否可达
-    if not check_scholar_availability():
+    # 已知不可达时直接失败；已知可达时不再额外发起探测请求
+    scholar_health.start_probe(check_scholar_availability)
+    if not scholar_health.allow_request():
         yield {
             'success': False,
             'message': '谷歌学术不可达，无法获取论文',
@@ -56,72 +200,80 @@ def get_google_scholar(keyword, year_low=None, year_high=None, limit_num=5):
 
     papers = []
     scholarly.set_timeout(100)
-    searched_scholar = scholarly.search_pubs(query=keyword, year_low=year_low, year_high=year_high)
     count = 0
-    fetcher = DBLPBibTeX()
+    # 同一次搜索中的重复结果，如同一篇论文的预印本和正式版本
+    seen_papers = NearDuplicateIndex()
+    # 等待BibTeX的论文，按获取顺序返回
+    pending = deque()
+
+    def finish(paper_info, future, progress):
+        paper_info.bib = future.result()
+        papers.append(paper_info.__dict__)
+        return {
+            'success': True,
+            'message': f'已获取第 {progress} 篇论文',
+            'data': paper_info.__dict__,  # 转换为字典以便序列化
+            'completed': False,
+            'progress': progress
+        }
 
     try:
-        for pub in searched_scholar:
-            filled_pub = pub
-            if count >= limit_num:
-                break
-            count += 1
-            title = filled_pub['bib']['title']
-            if title.startswith("\"") and title.endswith("\""):
-                title = title[1:-1]
-            title = title.strip()
-            if papers and any(p['title'].lower() == title.lower() for p in papers):
-                continue
-            # 构建基础论文信息，使用Paper schema约束数据结构
-            paper_id = str(uuid.uuid4())
-
-            # dblp获取bib
-            bibtex = fetcher.get_bibtex(f"title:{title} year:{filled_pub['bib'].get('pub_year')}")
-            real_bibtex = None
-            if bibtex:
-                bib_db = bibtexparser.loads(bibtex, parser=BibTexParser())
-                bib_title = bib_db.entries[0].get('title')
-                # 只有标题存在且两个标题相同才赋值
-                if bib_title:
-                    if re.sub("\s", "", bib_title.lower()) == re.sub("\s", "", title.lower()):
-                        real_bibtex = bibtex
-
-            paper_info = Paper(
-                id=paper_id,
-                title=title,
-                pub_year=filled_pub['bib'].get('pub_year'),
-                num_citations=filled_pub.get('num_citations', 0),
-                bib=real_bibtex,
-                pub_url=filled_pub.get('pub_url', None),
-                bib_url=filled_pub.get('url_scholarbib', None),
-                citedby_url=filled_pub.get('citedby_url', None),
-                authors=filled_pub['bib'].get('author', None)
-            )
-
-            papers.append(paper_info.__dict__)
-            # 实时返回每篇论文的信息
-            yield {
-                'success': True,
-                'message': f'已获取第 {count} 篇论文',
-                'data': paper_info.__dict__,  # 转换为字典以便序列化
-                'completed': False,
-                'progress': count
-            }
-            
-            if count % 10 == 0:
-                time.sleep(0.08)
-                
+        searched_scholar = iter_scholar_pubs(keyword, year_low, year_high, start_index)
+        with ThreadPoolExecutor(max_workers=bib_workers) as executor:
+            for pub in searched_scholar:
+                filled_pub = pub
+                if count >= limit_num:
+                    break
+                count += 1
+                title = filled_pub['bib']['title']
+                if title.startswith("\"") and title.endswith("\""):
+                    title = title[1:-1]
+                title = title.strip()
+                # 构建基础论文信息，使用Paper schema约束数据结构
+                paper_id = str(uuid.uuid4())
+                paper_info = Paper(
+                    id=paper_id,
+                    title=title,
+                    pub_year=filled_pub['bib'].get('pub_year'),
+                    num_citations=filled_pub.get('num_citations', 0),
+                    pub_url=filled_pub.get('pub_url', None),
+                    bib_url=filled_pub.get('url_scholarbib', None),
+                    citedby_url=filled_pub.get('citedby_url', None),
+                    authors=filled_pub['bib'].get('author', None)
+                )
+                if seen_papers.find_duplicate(paper_info):
+                    continue
+                seen_papers.add_papers([paper_info])
+                # dblp获取bib，在后台线程中与谷歌学术翻页同时进行
+                future = executor.submit(resolve_bibtex, title, paper_info.pub_year)
+                pending.append((paper_info, future, count))
+
+                # 实时返回已获取到BibTeX的论文信息
+                while pending and pending[0][1].done():
+                    yield finish(*pending.popleft())
+
+                # 每10条结果为一页，翻页前按谷歌学术（或当前代理）的预算等待
+                if count % 10 == 0:
+                    throttle_scholar()
+
+            while pending:
+                yield finish(*pending.popleft())
+
         # 完成所有爬取
         yield {
             'success': True,
             'message': f'成功获取 {count} 篇论文',
             'data':papers,
             'completed': True,
-            'total': count
+            'total': count,
+            'cursor': start_index + count
         }
         
     except Exception as e:
         logger.error(f"爬取过程中断: {e}")
+        # 只有请求谷歌学术失败才计入健康状态，处理结果时的程序错误不触发熔断
+        if isinstance(e, ScholarRequestError):
+            scholar_health.record_failure()
         yield {
             'success': False,
             'message': f'爬取过程中断: {str(e)}',
@@ -0,0 +1,175 @@
+import random
+import time
+import threading
+import logging
+from urllib.parse import urlparse
+
+from config import PROXY_CONFIG
+from crawler.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# 每个代理自己的访问预算：(每秒请求数, 突发请求数)
+PROXY_LIMIT = (1, 2)
+# 被封禁（验证码、403、429）后的冷却时间，连续封禁时翻倍，不超过上限
+BLOCK_COOLDOWN = 60
+MAX_BLOCK_COOLDOWN = 1800
+# 健康分数低于该值的代理只有在没有其他可用代理时才会被选中
+MIN_SCORE = 0.2
+# 这些状态码说明当前出口IP被目标站点拒绝
+BLOCK_STATUS = (403, 429)
+
+
+def normalize_proxy_url(url):
+    """补全代理地址的协议，如 127.0.0.1:7890 -> http://127.0.0.1:7890"""
+    url = url.strip()
+    return url if '://' in url else f'http://{url}'
+
+
+class Proxy:
+    """单个代理：健康分数、访问预算以及被封禁后的冷却时间"""
+
+    def __init__(self, url, rate=PROXY_LIMIT[0], burst=PROXY_LIMIT[1]):
+        self.url = normalize_proxy_url(url)
+        self.bucket = TokenBucket(rate, burst)
+        self.score = 1.0
+        self.successes = 0
+        self.failures = 0
+        self.blocks = 0
+        self.cooldown_until = 0.0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def throttle(self):
+        """按该代理的预算等待，取得一次请求名额"""
+        self.bucket.acquire()
+
+    @property
+    def requests_proxies(self):
+        """requests使用的代理参数"""
+        return {'http': self.url, 'https': self.url}
+
+    @property
+    def playwright_proxy(self):
+        """Playwright使用的代理参数，账号密码需要单独传入"""
+        parsed = urlparse(self.url)
+        proxy = {'server': f'{parsed.scheme}://{parsed.hostname}:{parsed.port}' if parsed.port
+                 else f'{parsed.scheme}://{parsed.hostname}'}
+        if parsed.username:
+            proxy['username'] = parsed.username
+            proxy['password'] = parsed.password or ''
+        return proxy
+
+    def __repr__(self):
+        parsed = urlparse(self.url)
+        return f'Proxy({parsed.hostname}:{parsed.port}, score={self.score:.2f})'
+
+
+class ProxyPool:
+    """代理池：按健康分数选择代理，被封禁的代理冷却后再用，所有爬虫共享"""
+
+    def __init__(self, urls=None, rate=PROXY_LIMIT[0], burst=PROXY_LIMIT[1]):
+        self.proxies = [Proxy(url, rate, burst) for url in dict.fromkeys(urls or []) if url.strip()]
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.proxies)
+
+    def acquire(self, exclude=None):
+        """
+        选择一个代理并按其预算等待；健康分数越高被选中的概率越大，冷却中的代理不参与选择
+
+        Args:
+            exclude: 不希望选中的代理，如刚被封禁的代理
+
+        Returns:
+            Proxy: 选中的代理，代理池为空时返回None
+        """
+        if not self.proxies:
+            return None
+        with self._lock:
+            candidates = [p for p in self.proxies if p is not exclude] or self.proxies
+            available = [p for p in candidates if p.available]
+            healthy = [p for p in available if p.score >= MIN_SCORE]
+            if healthy:
+                proxy = random.choices(healthy, weights=[p.score for p in healthy])[0]
+            elif available:
+                proxy = max(available, key=lambda p: p.score)
+            else:
+                # 全部在冷却中时使用最早结束冷却的代理
+                proxy = min(candidates, key=lambda p: p.cooldown_until)
+        proxy.throttle()
+        return proxy
+
+    def report_success(self, proxy):
+        """记录一次成功请求，提高健康分数"""
+        if proxy is None:
+            return
+        with self._lock:
+            proxy.successes += 1
+            proxy.blocks = 0
+            proxy.score = proxy.score * 0.8 + 0.2
+
+    def report_failure(self, proxy, blocked=False):
+        """
+        记录一次失败请求，降低健康分数；被封禁时让该代理冷却一段时间
+
+        Args:
+            proxy: 出错的代理
+            blocked: 是否被目标站点封禁（验证码、403、429等）
+        """
+        if proxy is None:
+            return
+        with self._lock:
+            proxy.failures += 1
+            proxy.score *= 0.5
+            if blocked:
+                cooldown = min(BLOCK_COOLDOWN * 2 ** proxy.blocks, MAX_BLOCK_COOLDOWN)
+                proxy.blocks += 1
+                proxy.cooldown_until = time.monotonic() + cooldown
+        if blocked:
+            logger.warning(f"代理 {proxy} 被封禁，冷却 {cooldown} 秒")
+
+    def report_status(self, proxy, status_code):
+        """根据响应状态码更新代理状态"""
+        if status_code in BLOCK_STATUS:
+            self.report_failure(proxy, blocked=True)
+        else:
+            self.report_success(proxy)
+
+    def snapshot(self):
+        """返回各代理的状态，便于健康检查接口展示"""
+        with self._lock:
+            return [{
+                'proxy': repr(p),
+                'score': round(p.score, 3),
+                'available': p.available,
+                'successes': p.successes,
+                'failures': p.failures,
+            } for p in self.proxies]
+
+
+def load_proxy_urls(config=PROXY_CONFIG):
+    """从配置读取代理列表：优先使用pool，未配置时退回单个https/http代理"""
+    if not config.get('enabled'):
+        return []
+    pool = config.get('pool') or []
+    if isinstance(pool, str):
+        pool = pool.split(',')
+    pool = [url for url in pool if url and url.strip()]
+    if pool:
+        return pool
+    single = config.get('https') or config.get('http')
+    return [single] if single else []
+
+
+def playwright_launch_options(proxy):
+    """启动Playwright浏览器时的代理参数，未使用代理时为空"""
+    return {'proxy': proxy.playwright_proxy} if proxy is not None else {}
+
+
+# 进程内共享的代理池
+proxy_pool = ProxyPool(load_proxy_urls())
@@ -0,0 +1,180 @@
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 每个站点的访问预算：(每秒请求数, 突发请求数, 最大并发数)，子域名按后缀匹配
+HOST_LIMITS = {
+    'scholar.google.com': (0.5, 2, 1),
+    'dblp.org': (2, 4, 2),
+    'api.semanticscholar.org': (1, 1, 1),
+    'arxiv.org': (1, 4, 2),
+    'aclanthology.org': (2, 4, 4),
+    'bing.com': (1, 2, 2),
+}
+DEFAULT_HOST_LIMIT = (2, 4, 4)
+# 所有站点合计的请求速率：(每秒请求数, 突发请求数)
+GLOBAL_LIMIT = (20, 40)
+# 这些状态码表示被限流，会读取Retry-After并暂停访问该站点
+THROTTLE_STATUS = (429, 503)
+DEFAULT_RETRY_AFTER = 30
+
+
+class TokenBucket:
+    """令牌桶：平均每秒rate个请求，最多允许burst个突发请求"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，不足时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostBudget:
+    """单个站点的访问预算：令牌桶、并发上限以及被限流后的暂停时间"""
+
+    def __init__(self, host, rate, burst, concurrency):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def block(self, seconds):
+        """暂停访问该站点seconds秒"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        logger.warning(f"{self.host} 被限流，暂停访问 {seconds:.0f} 秒")
+
+    def wait_unblocked(self):
+        with self._lock:
+            wait = self.blocked_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """全局请求调度器：所有爬虫共享的总速率、按站点的速率与并发上限，并遵守429/Retry-After"""
+
+    def __init__(self, host_limits=None, default_limit=DEFAULT_HOST_LIMIT, global_limit=GLOBAL_LIMIT):
+        self.host_limits = host_limits if host_limits is not None else HOST_LIMITS
+        self.default_limit = default_limit
+        self.global_bucket = TokenBucket(*global_limit)
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def budget(self, url_or_host):
+        """获取网址或域名对应的站点预算"""
+        host = urlparse(url_or_host).hostname if '//' in url_or_host else url_or_host
+        host = (host or '').lower()
+        key = next((name for name in self.host_limits if host == name or host.endswith('.' + name)), host)
+        with self._lock:
+            budget = self._budgets.get(key)
+            if budget is None:
+                budget = HostBudget(key, *self.host_limits.get(key, self.default_limit))
+                self._budgets[key] = budget
+            return budget
+
+    def acquire(self, url_or_host):
+        """等待直到可以向该站点发起一次请求（不占用并发名额）"""
+        budget = self.budget(url_or_host)
+        budget.wait_unblocked()
+        self.global_bucket.acquire()
+        budget.bucket.acquire()
+        return budget
+
+    @contextmanager
+    def slot(self, url_or_host):
+        """占用该站点的一个并发名额并取得令牌，适用于浏览器打开页面等持续一段时间的访问"""
+        budget = self.budget(url_or_host)
+        budget.semaphore.acquire()
+        try:
+            self.acquire(url_or_host)
+            yield budget
+        finally:
+            budget.semaphore.release()
+
+    def report(self, url_or_host, status_code, retry_after=None):
+        """根据响应状态码更新站点状态，被限流时按Retry-After暂停"""
+        if status_code in THROTTLE_STATUS:
+            self.budget(url_or_host).block(parse_retry_after(retry_after))
+
+
+def parse_retry_after(value):
+    """解析Retry-After头（秒数或HTTP日期），缺失时使用默认值"""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+# 进程内共享的调度器
+rate_limiter = RateLimiter()
+
+
+def rate_limited_get(url, max_retries=2, session=None, pool=None, **kwargs):
+    """
+    经过调度器的requests.get，被限流时等待Retry-After后重试；
+    传入代理池时每次请求从池中选取代理，代理被封禁或连接失败时换一个代理重试
+
+    Args:
+        url: 请求地址
+        max_retries: 被限流或换代理后的最大重试次数
+        session: 可选的requests.Session
+        pool: 可选的代理池（crawler.proxy_pool.ProxyPool）
+        **kwargs: 传给requests.get的参数
+
+    Returns:
+        requests.Response: 最后一次请求的响应
+    """
+    getter = session.get if session is not None else requests.get
+    use_pool = pool is not None and pool.enabled and 'proxies' not in kwargs
+    proxy = None
+    for attempt in range(max_retries + 1):
+        if use_pool:
+            proxy = pool.acquire(exclude=proxy)
+            kwargs['proxies'] = proxy.requests_proxies
+        try:
+            with rate_limiter.slot(url):
+                response = getter(url, **kwargs)
+        except (requests.exceptions.ProxyError, requests.exceptions.ConnectionError):
+            if not use_pool or attempt == max_retries:
+                raise
+            pool.report_failure(proxy)
+            continue
+        if use_pool:
+            pool.report_status(proxy, response.status_code)
+            # 使用代理时限流针对的是出口IP，换一个代理即可，不必暂停整个站点
+            if response.status_code in (403, 429) and len(pool.proxies) > 1:
+                continue
+        if response.status_code not in THROTTLE_STATUS:
+            return response
+        rate_limiter.report(url, response.status_code, response.headers.get('Retry-After'))
+    return response
@@ -0,0 +1,121 @@
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'        # 可用
+OPEN = 'open'            # 不可用，直接失败
+HALF_OPEN = 'half_open'  # 冷却结束，放行一次试探请求
+
+
+class ServiceHealth:
+    """外部服务的共享健康状态，由真实请求结果和后台探测共同更新，带熔断语义"""
+
+    def __init__(self, name, ttl=300, failure_threshold=3, reset_timeout=60):
+        """
+        Args:
+            name: 服务名称，用于日志
+            ttl: 健康状态的有效期（秒），超过后snapshot中标记为stale；可用时不做后台探测
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多久进入半开状态重试（秒）
+        """
+        self.name = name
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.updated_at = 0.0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._probe_thread = None
+
+    def allow_request(self):
+        """
+        判断是否放行请求：可用时放行；熔断时直接拒绝；半开时只放行一个试探请求
+
+        Returns:
+            bool: 是否放行
+        """
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        """记录一次成功，恢复为可用"""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.name} 已恢复可用")
+            self.state = CLOSED
+            self.failures = 0
+            self.updated_at = time.time()
+            self._trial_running = False
+
+    def record_failure(self):
+        """记录一次失败，连续失败达到阈值或半开试探失败时熔断"""
+        with self._lock:
+            self.failures += 1
+            self.updated_at = time.time()
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"{self.name} 连续失败 {self.failures} 次，暂停访问 {self.reset_timeout} 秒")
+                self.state = OPEN
+                self.opened_at = time.time()
+
+    def needs_probe(self):
+        """只在熔断冷却结束（或已半开）时需要探测，可用时由真实请求的结果更新状态"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.time() - self.opened_at >= self.reset_timeout
+            return self.state == HALF_OPEN
+
+    def snapshot(self):
+        """返回当前状态，便于健康检查接口展示"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'failures': self.failures,
+                'updated_at': self.updated_at,
+                # 超过有效期没有真实请求更新的状态，可能已不准确
+                'stale': time.time() - self.updated_at >= self.ttl,
+            }
+
+    def start_probe(self, probe, interval=30):
+        """
+        启动后台探测线程（只启动一次），仅在熔断冷却结束或半开时调用probe
+
+        Args:
+            probe: 探测函数，返回bool
+            interval: 检查间隔（秒）
+        """
+        with self._lock:
+            if self._probe_thread is not None:
+                return
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, args=(probe, interval), name=f"{self.name}-probe", daemon=True
+            )
+        self._probe_thread.start()
+
+    def _probe_loop(self, probe, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                if self.needs_probe() and self.allow_request():
+                    if probe():
+                        self.record_success()
+                    else:
+                        self.record_failure()
+            except Exception as e:
+                logger.warning(f"{self.name} 探测出错: {e}")
+                self.record_failure()
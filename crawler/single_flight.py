@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """相同key的并发调用只执行一次，其余调用等待并共享其结果（或异常），仅在本进程内生效"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行fn，若相同key的调用正在进行则等待其结果
+
+        Args:
+            key: 可哈希的调用标识
+            fn: 实际执行的函数
+
+        Returns:
+            fn的返回值
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self, key):
+        """相同key的调用是否正在进行"""
+        with self._lock:
+            return key in self._calls
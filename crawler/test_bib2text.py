@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试BibTeX快速解析路径、流式切分条目与bibtexparser的结果一致
+"""
+
+import io
+import os
+import sys
+
+import bibtexparser
+import pytest
+from bibtexparser.bparser import BibTexParser
+from bibtexparser.customization import convert_to_unicode
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler.bib2text import parse_bib, iter_bib_blocks, iter_bib_entries
+
+BIBS = [
+    # DBLP格式的标准条目
+    """@inproceedings{DBLP:conf/nips/VaswaniSPUJGKP17,
+  author       = {Ashish Vaswani and
+                  Noam Shazeer},
+  title        = {Attention is All you Need},
+  booktitle    = {NeurIPS},
+  pages        = {5998--6008},
+  year         = {2017},
+  note         = {{}}
+}""",
+    "@Article{smith2020, Title = {A {B}ayesian Model}, Year = 2020, Journal = {J. Stat. Soft.}}",
+    "@misc{key, title = {Caf{\\'e} Networks}, howpublished = {\\url{https://example.com}}}",
+    # bibtexparser忽略的非标准类型
+    "@software{torch, title = {PyTorch}, year = {2019}, url = {https://pytorch.org}}",
+    "@online{blog, title = {A Blog Post}, year = {2021}}",
+    "@dataset{data, title = {ImageNet}, year = {2009}}",
+    # 快速路径不支持的写法
+    '@article{quoted, title = "Quoted Title", year = {2020}}',
+    "@article{a, title = {One}}\n@article{b, title = {Two}}",
+    "@comment{ignored}",
+    # 重复的字段保留第一个值，没有字段的条目被忽略
+    "@article{dup, title = {First}, Title = {Second}, year = {2020}}",
+    "@article{empty, }",
+]
+
+
+def _bibtexparser_entries(bib):
+    parser = BibTexParser()
+    parser.customization = convert_to_unicode
+    return bibtexparser.loads(bib, parser=parser).entries
+
+
+@pytest.mark.parametrize('bib', BIBS)
+def test_parse_bib_matches_bibtexparser(bib):
+    assert parse_bib(bib) == _bibtexparser_entries(bib)
+
+
+FILES = [
+    # 圆括号包围的条目
+    "@article(a1,\n  title = {Paren (entry)},\n  year = 2020\n)\n\n@article{a2, title={Two}}\n"
+    "@inproceedings{a3,\n  title = {Three}}\n",
+    # 转义的花括号
+    "@article{a2,\n  title = {A \\{ brace},\n  year={2020}\n}\n\n@article{a3,\n  title = {Three}\n}\n",
+    # 括号没有闭合的条目
+    "@article{a1,\n  title = {Broken,\n  year={2020}\n}\n@article{a3,\n  title = {Three}\n}\n",
+    # 字段值中的@、注释和@string
+    "% comment\n@comment{x}\n@misc{m1, note = {mail a@b.com}, title={X}}\n@misc{m2, title={Y}}",
+]
+
+
+@pytest.mark.parametrize('content', FILES)
+def test_iter_bib_entries_matches_bibtexparser(content):
+    entries = [entry for _, entry in iter_bib_entries(io.StringIO(content))]
+    assert [entry['ID'] for entry in entries] == [entry['ID'] for entry in _bibtexparser_entries(content)]
+
+
+@pytest.mark.parametrize('content', FILES)
+def test_iter_bib_blocks_read_size(content):
+    """切分结果与每次读取的字符数无关"""
+    expected = list(iter_bib_blocks(io.StringIO(content)))
+    for read_size in (1, 2, 5, 13):
+        assert list(iter_bib_blocks(io.StringIO(content), read_size=read_size)) == expected
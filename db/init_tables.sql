@@ -54,6 +54,10 @@ CREATE TABLE IF NOT EXISTS public.search_tasks (
     limit_num INTEGER DEFAULT 50,
     status VARCHAR(20) DEFAULT 'pending'
         CHECK (status IN ('pending', 'running', 'completed', 'cancelled', 'error')),
+    scholar_cursor INTEGER DEFAULT 0,  -- 已消费的谷歌学术结果数，扩大搜索时从此处继续
+    fetched_num INTEGER DEFAULT 0,     -- 已从谷歌学术获取的论文数
+    processed_num INTEGER DEFAULT 0,   -- 已增强并入库的论文数
+    message TEXT,                      -- 出错时的错误信息
     created_at TIMESTAMPTZ,
     updated_at TIMESTAMPTZ
 );
@@ -62,20 +66,39 @@ CREATE TABLE IF NOT EXISTS public.search_tasks (
 CREATE TABLE IF NOT EXISTS public.papers (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     title VARCHAR(500) NOT NULL,
+    -- 规范化标题（小写、去掉空白和标点），用于去重
+    title_norm TEXT GENERATED ALWAYS AS (lower(regexp_replace(title, '[^[:alnum:]]+', '', 'g'))) STORED,
     authors TEXT,
     description TEXT,
     pub_year INTEGER,
     num_citations INTEGER DEFAULT 0,
     bib TEXT,
+    bib_hash VARCHAR(64),  -- bib的SHA1，用于按bib查找预先生成的引用
+    ref_apa TEXT,          -- 入库时预先生成的各格式引用
+    ref_mla TEXT,
+    ref_gb7714 TEXT,
     pub_url VARCHAR(1000),
     bib_url VARCHAR(1000),
     citedby_url VARCHAR(1000),
     abstract TEXT,
     keywords TEXT,
     doi VARCHAR(255),
+    -- 规范化DOI（去掉首尾空白、转小写并去掉https://doi.org/等前缀），与crawler.bib2text.normalize_doi一致，用于去重
+    doi_norm TEXT GENERATED ALWAYS AS (
+        regexp_replace(lower(regexp_replace(doi, '^\s+|\s+$', '', 'g')), '^(https?://)?(dx\.)?doi\.org/|^doi:\s*', '')
+    ) STORED,
     pdf_url VARCHAR(1000),
     file_hash VARCHAR(100),
     file_size BIGINT DEFAULT 0,
+    -- 全文检索向量：标题(A) > 关键词(B) > 摘要(C)；english按词干匹配英文，simple按原词匹配其他语言
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(keywords, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(keywords, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(abstract, '')), 'C')
+    ) STORED,
+    embedding VECTOR(384),  -- 标题+摘要的向量（已归一化），维度与EMBEDDING_CONFIG中的模型一致
     created_at TIMESTAMPTZ,
     updated_at TIMESTAMPTZ
 );
@@ -127,12 +150,181 @@ CREATE TRIGGER update_search_results_updated_at
 BEFORE UPDATE ON public.search_results
 FOR EACH ROW EXECUTE FUNCTION update_updated_at();
 
+-- 查找可复用的已完成搜索：条件相同、结果数量足够且在有效期内
+-- search_tasks受RLS限制只能看到自己的任务，此函数以定义者权限执行，跨用户共享结果但只返回session_id
+-- 只匹配实际爬取过的会话（scholar_cursor > 0）：命中缓存时复制出的会话游标为0，不能作为来源，否则有效期会被不断延长
+CREATE OR REPLACE FUNCTION public.find_cached_search(
+    p_keyword TEXT,
+    p_year_low INTEGER,
+    p_year_high INTEGER,
+    p_limit_num INTEGER,
+    p_max_age_seconds INTEGER
+)
+RETURNS UUID AS $$
+    SELECT session_id
+    FROM public.search_tasks
+    WHERE regexp_replace(lower(btrim(keyword)), '\s+', ' ', 'g') = p_keyword
+      AND year_low IS NOT DISTINCT FROM p_year_low
+      AND year_high IS NOT DISTINCT FROM p_year_high
+      AND limit_num >= p_limit_num
+      AND scholar_cursor > 0
+      AND status = 'completed'
+      AND updated_at >= NOW() - make_interval(secs => p_max_age_seconds)
+    ORDER BY updated_at DESC
+    LIMIT 1;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+-- 查找可扩展的已完成搜索：条件相同但结果数量不足，返回最大的一次及其谷歌学术游标
+CREATE OR REPLACE FUNCTION public.find_expandable_search(
+    p_keyword TEXT,
+    p_year_low INTEGER,
+    p_year_high INTEGER,
+    p_limit_num INTEGER,
+    p_max_age_seconds INTEGER
+)
+RETURNS TABLE (session_id UUID, limit_num INTEGER, scholar_cursor INTEGER) AS $$
+    SELECT t.session_id, t.limit_num, t.scholar_cursor
+    FROM public.search_tasks t
+    WHERE regexp_replace(lower(btrim(t.keyword)), '\s+', ' ', 'g') = p_keyword
+      AND t.year_low IS NOT DISTINCT FROM p_year_low
+      AND t.year_high IS NOT DISTINCT FROM p_year_high
+      AND t.limit_num < p_limit_num
+      AND t.scholar_cursor > 0
+      AND t.status = 'completed'
+      AND t.updated_at >= NOW() - make_interval(secs => p_max_age_seconds)
+    ORDER BY t.scholar_cursor DESC, t.updated_at DESC
+    LIMIT 1;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+-- 将重复论文（如预印本与正式版本）的信息合并到已入库论文：只补充为空的字段，不覆盖已有值
+-- papers表的RLS只允许认证用户插入，此函数以定义者权限执行更新；PDF的哈希和大小、bib的哈希和引用随pdf_url、bib一起补充
+CREATE OR REPLACE FUNCTION public.merge_paper_info(
+    p_paper_id UUID,
+    p_fields JSONB
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+    IF auth.uid() IS NULL THEN
+        RAISE EXCEPTION 'merge_paper_info requires an authenticated user';
+    END IF;
+    UPDATE public.papers p SET
+        abstract = COALESCE(NULLIF(p.abstract, ''), p_fields->>'abstract'),
+        keywords = COALESCE(NULLIF(p.keywords, ''), p_fields->>'keywords'),
+        doi = COALESCE(NULLIF(p.doi, ''), p_fields->>'doi'),
+        pub_url = COALESCE(NULLIF(p.pub_url, ''), p_fields->>'pub_url'),
+        pdf_url = COALESCE(NULLIF(p.pdf_url, ''), p_fields->>'pdf_url'),
+        file_hash = CASE WHEN NULLIF(p.pdf_url, '') IS NULL AND p_fields ? 'pdf_url'
+                         THEN COALESCE(p_fields->>'file_hash', p.file_hash) ELSE p.file_hash END,
+        file_size = CASE WHEN NULLIF(p.pdf_url, '') IS NULL AND p_fields ? 'pdf_url'
+                         THEN COALESCE((p_fields->>'file_size')::BIGINT, p.file_size) ELSE p.file_size END,
+        bib = COALESCE(NULLIF(p.bib, ''), p_fields->>'bib'),
+        bib_hash = CASE WHEN NULLIF(p.bib, '') IS NULL AND p_fields ? 'bib'
+                        THEN p_fields->>'bib_hash' ELSE p.bib_hash END,
+        ref_apa = CASE WHEN NULLIF(p.bib, '') IS NULL AND p_fields ? 'bib'
+                       THEN p_fields->>'ref_apa' ELSE p.ref_apa END,
+        ref_mla = CASE WHEN NULLIF(p.bib, '') IS NULL AND p_fields ? 'bib'
+                       THEN p_fields->>'ref_mla' ELSE p.ref_mla END,
+        ref_gb7714 = CASE WHEN NULLIF(p.bib, '') IS NULL AND p_fields ? 'bib'
+                          THEN p_fields->>'ref_gb7714' ELSE p.ref_gb7714 END
+    WHERE p.id = p_paper_id;
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql VOLATILE SECURITY DEFINER SET search_path = public;
+
+-- 论文全文检索，按相关度排序分页
+-- 中文没有分词，包含非ASCII字符时另外用标题三元组索引做模糊匹配，并按相似度参与排序，检索词中的%和_按字面匹配
+-- 只返回schemas.PAPER_COLUMNS中的列，不传输检索向量和语义向量
+DROP FUNCTION IF EXISTS public.search_papers(TEXT, INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION public.search_papers(
+    p_query TEXT,
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    id UUID, title VARCHAR, authors TEXT, description TEXT, pub_year INTEGER, num_citations INTEGER,
+    bib TEXT, bib_hash VARCHAR, ref_apa TEXT, ref_mla TEXT, ref_gb7714 TEXT,
+    pub_url VARCHAR, bib_url VARCHAR, citedby_url VARCHAR, abstract TEXT, keywords TEXT, doi VARCHAR,
+    pdf_url VARCHAR, file_hash VARCHAR, file_size BIGINT, created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ
+) AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('english', p_query) || websearch_to_tsquery('simple', p_query) AS tsq,
+               p_query ~ '[^\x01-\x7F]' AS fuzzy,
+               replace(replace(replace(p_query, '\', '\\'), '%', '\%'), '_', '\_') AS pattern
+    )
+    SELECT p.id, p.title, p.authors, p.description, p.pub_year, p.num_citations,
+           p.bib, p.bib_hash, p.ref_apa, p.ref_mla, p.ref_gb7714,
+           p.pub_url, p.bib_url, p.citedby_url, p.abstract, p.keywords, p.doi,
+           p.pdf_url, p.file_hash, p.file_size, p.created_at, p.updated_at
+    FROM public.papers p, q
+    WHERE p.search_vector @@ q.tsq
+       OR (q.fuzzy AND p.title ILIKE '%' || q.pattern || '%')
+    ORDER BY ts_rank_cd(p.search_vector, q.tsq)
+                 + CASE WHEN q.fuzzy THEN similarity(p.title, p_query) ELSE 0 END DESC,
+             p.num_citations DESC
+    LIMIT p_limit OFFSET p_offset;
+$$ LANGUAGE sql STABLE;
+
+-- 按向量余弦相似度检索论文，可按年份和论文ID集合（如知识库中的论文）过滤
+-- HNSW索引只返回ef_search个候选，过滤条件在其之后才应用：限定论文集合时对集合内的论文精确计算距离；
+-- 只按年份过滤时开启迭代扫描（需要pgvector 0.8及以上），候选被过滤掉后继续扫描索引直到凑够p_limit篇
+CREATE OR REPLACE FUNCTION public.match_papers(
+    p_embedding VECTOR(384),
+    p_limit INTEGER DEFAULT 20,
+    p_year_low INTEGER DEFAULT NULL,
+    p_year_high INTEGER DEFAULT NULL,
+    p_paper_ids UUID[] DEFAULT NULL
+)
+RETURNS TABLE (id UUID, similarity DOUBLE PRECISION) AS $$
+BEGIN
+    IF p_paper_ids IS NOT NULL THEN
+        -- MATERIALIZED使距离在按ID过滤后的行上计算，不走HNSW索引
+        RETURN QUERY
+        WITH candidates AS MATERIALIZED (
+            SELECT p.id, p.embedding <=> p_embedding AS distance
+            FROM public.papers p
+            WHERE p.id = ANY(p_paper_ids)
+              AND p.embedding IS NOT NULL
+              AND (p_year_low IS NULL OR p.pub_year >= p_year_low)
+              AND (p_year_high IS NULL OR p.pub_year <= p_year_high)
+        )
+        SELECT c.id, 1 - c.distance
+        FROM candidates c
+        ORDER BY c.distance
+        LIMIT p_limit;
+    ELSE
+        -- relaxed_order的结果可能略微乱序，取出后再按距离排序
+        RETURN QUERY
+        WITH candidates AS MATERIALIZED (
+            SELECT p.id, p.embedding <=> p_embedding AS distance
+            FROM public.papers p
+            WHERE p.embedding IS NOT NULL
+              AND (p_year_low IS NULL OR p.pub_year >= p_year_low)
+              AND (p_year_high IS NULL OR p.pub_year <= p_year_high)
+            ORDER BY p.embedding <=> p_embedding
+            LIMIT p_limit
+        )
+        SELECT c.id, 1 - c.distance
+        FROM candidates c
+        ORDER BY c.distance;
+    END IF;
+END;
+$$ LANGUAGE plpgsql STABLE
+SET hnsw.iterative_scan = relaxed_order;
+
 -- 索引
 CREATE INDEX IF NOT EXISTS idx_search_tasks_user_id ON public.search_tasks(user_id);
 CREATE INDEX IF NOT EXISTS idx_search_tasks_status ON public.search_tasks(status);
+CREATE INDEX IF NOT EXISTS idx_search_tasks_keyword_norm
+    ON public.search_tasks((regexp_replace(lower(btrim(keyword)), '\s+', ' ', 'g')), updated_at DESC);
 CREATE INDEX IF NOT EXISTS idx_papers_title ON public.papers USING GIN(title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_papers_search_vector ON public.papers USING GIN(search_vector);
+CREATE INDEX IF NOT EXISTS idx_papers_embedding ON public.papers USING hnsw (embedding vector_cosine_ops);
 CREATE INDEX IF NOT EXISTS idx_papers_doi ON public.papers(doi);
-CREATE INDEX IF NOT EXISTS idx_search_results_session_id ON public.search_results(session_id);
+CREATE INDEX IF NOT EXISTS idx_papers_doi_norm ON public.papers(doi_norm);
+CREATE INDEX IF NOT EXISTS idx_papers_bib_hash ON public.papers(bib_hash);
+CREATE INDEX IF NOT EXISTS idx_papers_title_norm ON public.papers(title_norm);
+-- 按会话分页：会话内按result_index顺序扫描，键集分页直接定位
+CREATE INDEX IF NOT EXISTS idx_search_results_session_index ON public.search_results(session_id, result_index);
 CREATE INDEX IF NOT EXISTS idx_search_results_paper_id ON public.search_results(paper_id);
 
 -- RLS 策略
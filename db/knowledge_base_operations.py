@@ -1,5 +1,6 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator
 import logging
+from schemas import PAPER_COLUMNS
 from .supabase_client import SupabaseInitializer
 
 logger = logging.getLogger(__name__)
@@ -7,9 +8,15 @@ logger = logging.getLogger(__name__)
 class KnowledgeBaseOperations:
     """知识库数据库操作类"""
     
-    def __init__(self):
-        self.db_init = SupabaseInitializer()
-        self.supabase = self.db_init.supabase
+    def __init__(self, supabase=None):
+        """
+        Args:
+            supabase: Supabase客户端，如请求用户的已认证客户端，使查询受该用户的RLS权限限制；默认新建匿名客户端
+        """
+        if supabase is None:
+            self.db_init = SupabaseInitializer()
+            supabase = self.db_init.supabase
+        self.supabase = supabase
     
     def create_knowledge_base(self, user_id: str, name: str, description: str = None, is_public: bool = False) -> Optional[str]:
         """新建知识库
@@ -246,13 +253,77 @@ class KnowledgeBaseOperations:
         """获取知识库中的所有论文"""
         try:
             result = self.supabase.table('knowledge_base_papers').select(
-                '*, papers(*)'
+                f'*, papers({PAPER_COLUMNS})'
             ).eq('knowledge_base_id', kb_id).execute()
             return result.data or []
         except Exception as e:
             logger.error(f"获取知识库论文失败: {e}")
             return []
     
+    def can_read_knowledge_base(self, kb_id: str, user_id: Optional[str]) -> bool:
+        """检查用户能否读取知识库：公开的知识库，或用户是其所有者或成员
+
+        Args:
+            kb_id: 知识库ID
+            user_id: 用户ID，未登录时为None
+
+        Returns:
+            bool: 是否可以读取
+        """
+        try:
+            kb_result = self.supabase.table('knowledge_bases').select('user_id,is_public').eq('id', kb_id).execute()
+            if not kb_result.data:
+                return False
+            kb = kb_result.data[0]
+            if kb.get('is_public') or (user_id and kb['user_id'] == user_id):
+                return True
+            if not user_id:
+                return False
+            member_result = self.supabase.table('knowledge_base_members').select('user_id') \
+                .eq('knowledge_base_id', kb_id).eq('user_id', user_id).execute()
+            return bool(member_result.data)
+        except Exception as e:
+            logger.error(f"检查知识库权限失败: {e}")
+            return False
+
+    def get_knowledge_base_paper_ids(self, kb_id: str) -> List[str]:
+        """获取知识库中所有论文的ID"""
+        try:
+            result = self.supabase.table('knowledge_base_papers').select('paper_id').eq('knowledge_base_id', kb_id).execute()
+            return [item['paper_id'] for item in result.data or []]
+        except Exception as e:
+            logger.error(f"获取知识库论文ID失败: {e}")
+            return []
+    
+    def iter_knowledge_base_papers(self, kb_id: str, page_size: int = 1000,
+                                   columns: str = '*') -> Iterator[List[Dict[str, Any]]]:
+        """按关联ID分页遍历知识库中的论文，用于导出
+
+        Args:
+            kb_id: 知识库ID
+            page_size: 每页数量
+            columns: 需要的论文列，不需要向量时应显式列出以免读取embedding和search_vector
+
+        Yields:
+            List[Dict]: 每页的论文，包含添加者added_by
+        """
+        last_id = None
+        while True:
+            query = self.supabase.table('knowledge_base_papers') \
+                .select(f'id,added_by,papers({columns})') \
+                .eq('knowledge_base_id', kb_id) \
+                .order('id') \
+                .limit(page_size)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.execute().data or []
+            papers = [{**row['papers'], 'added_by': row.get('added_by')} for row in rows if row.get('papers')]
+            if papers:
+                yield papers
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1]['id']
+
     def _update_knowledge_base_stats(self, kb_id: str):
         """更新知识库统计信息"""
         try:
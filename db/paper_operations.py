@@ -1,14 +1,43 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterable, Iterator, Tuple
+import itertools
 import logging
 import hashlib
+import re
 import uuid
 
 from config import SUPABASE_CONFIG
+from crawler.bib2text import bib_hash, reference_fields, entry_to_text, normalize_title, normalize_doi
 from crawler.get_pdf import download_single_pdf_content
-from schemas import SearchTask, SearchResult
+from paper_utils.dedup_index import NearDuplicateIndex
+from paper_utils.embedding_index import get_embedder, paper_text
+from schemas import SearchTask, SearchResult, Paper, PAPER_COLUMNS
 
 logger = logging.getLogger(__name__)
 
+# 合并重复论文时，从重复论文补充到保留论文的字段
+MERGE_FIELDS = ('abstract', 'keywords', 'doi', 'bib', 'pub_url', 'pdf_url')
+# 按值批量查询时，单次in过滤中所有值的总长度上限，避免PostgREST请求URL过长
+LOOKUP_MAX_CHARS = 4000
+
+
+def normalize_keyword(keyword: str) -> str:
+    """规范化搜索关键词：转小写、去掉首尾空白并合并连续空白，与find_cached_search一致"""
+    return re.sub(r'\s+', ' ', keyword.strip().lower())
+
+
+def _lookup_batches(values: List[str], max_chars: int = LOOKUP_MAX_CHARS) -> Iterator[List[str]]:
+    """将查询值分批，每批的总长度（含URL编码和分隔符的余量）不超过max_chars"""
+    batch, size = [], 0
+    for value in dict.fromkeys(values):
+        cost = len(value) * 3 + 1
+        if batch and size + cost > max_chars:
+            yield batch
+            batch, size = [], 0
+        batch.append(value)
+        size += cost
+    if batch:
+        yield batch
+
 
 def _calculate_file_hash(pdf_bytes: bytes) -> str:
     """计算文件SHA256哈希值"""
@@ -76,8 +105,23 @@ class PDFStorage:
 class PaperOperations:
     """论文数据库操作类"""
     
-    def __init__(self, supabase):
+    def __init__(self, supabase, search_index=None, vector_index=None, embedder=None, dedup_index=None):
+        """
+        Args:
+            supabase: Supabase客户端，只使用本地索引时可为None
+            search_index: 可选的本地检索索引（paper_utils.bm25_index.BM25Index），
+                传入后关键词检索不再访问数据库，新增和更新的论文同步写入索引
+            vector_index: 可选的本地向量索引（paper_utils.embedding_index.EmbeddingIndex），
+                传入后语义检索不再访问数据库，新增的论文同步写入索引
+            embedder: 向量模型，默认按EMBEDDING_CONFIG创建，未配置时入库不计算向量
+            dedup_index: 可选的近似重复索引（paper_utils.dedup_index.NearDuplicateIndex），
+                传入后入库前按标题、作者和年份查找近似重复的论文，新增的论文同步写入索引
+        """
         self.supabase = supabase
+        self.search_index = search_index
+        self.vector_index = vector_index
+        self.embedder = embedder if embedder is not None else get_embedder()
+        self.dedup_index = dedup_index
 
     def get_paper_by_title_year(self, title: str, pub_year: int) -> Optional[Dict]:
         """根据标题和年份获取论文信息，用于检查重复
@@ -93,7 +137,7 @@ class PaperOperations:
             logger.info(f"检查论文是否存在: {title}, 年份: {pub_year}")
             # 使用ILIKE进行不区分大小写的匹配，并去除标题两端空格
             result = self.supabase.table('papers') \
-                .select('*') \
+                .select(PAPER_COLUMNS) \
                 .ilike('title', title.strip()) \
                 .eq('pub_year', pub_year) \
                 .limit(1) \
@@ -114,13 +158,184 @@ class PaperOperations:
             List[Dict]: 插入的论文数据（包含数据库生成的ID等字段）
         """
         try:
-            result = self.supabase.table('papers').insert(papers_data).execute()
-            # 返回插入的论文数据，包含数据库生成的ID等字段
-            return result.data if result.data else []
+            # 入库时预先生成各格式引用，读取时无需再解析bib
+            for paper in papers_data:
+                if paper.get('bib') and not paper.get('bib_hash'):
+                    paper.update(reference_fields(paper['bib']))
+            if self.supabase is None:
+                inserted = papers_data
+            else:
+                # 配置了向量模型时一并写入论文向量
+                if self.embedder is not None:
+                    missing = [paper for paper in papers_data if paper.get('embedding') is None]
+                    if missing:
+                        vectors = self.embedder.encode([paper_text(paper) for paper in missing])
+                        for paper, vector in zip(missing, vectors):
+                            paper['embedding'] = vector.tolist()
+                result = self.supabase.table('papers').insert(papers_data).execute()
+                # 返回插入的论文数据，包含数据库生成的ID等字段
+                inserted = result.data if result.data else []
+            if self.search_index is not None:
+                self.search_index.add_papers(inserted)
+            if self.vector_index is not None:
+                self.vector_index.add_papers(inserted)
+            if self.dedup_index is not None:
+                self.dedup_index.add_papers(inserted)
+            return inserted
         except Exception as e:
             logger.error(f"批量插入论文失败: {e}")
             return []
 
+    def find_near_duplicate(self, paper: Dict[str, Any]) -> Optional[str]:
+        """在近似重复索引中查找与论文重复的已入库论文，如预印本与正式发表版本
+
+        Args:
+            paper: 论文信息，需包含title，authors、pub_year可选
+
+        Returns:
+            str: 重复论文的ID，未配置索引或没有重复时返回None
+        """
+        if self.dedup_index is None:
+            return None
+        match = self.dedup_index.find_duplicate(paper)
+        if match is None:
+            return None
+        logger.info(f"发现近似重复论文: {paper.get('title')} -> {match[0]}，标题相似度 {match[1]:.2f}")
+        return match[0]
+
+    def merge_paper_info(self, paper_id: str, paper: Dict[str, Any]) -> bool:
+        """将重复论文的信息合并到已入库论文：只补充已入库论文中缺失的字段
+
+        papers表的RLS不允许普通用户更新，通过以定义者权限执行的merge_paper_info函数写入
+
+        Args:
+            paper_id: 保留的论文ID
+            paper: 重复论文的信息
+
+        Returns:
+            bool: 是否有字段被更新
+        """
+        existing = self.get_paper_by_id(paper_id)
+        if not existing:
+            return False
+        update_data = {field: paper[field] for field in MERGE_FIELDS
+                       if paper.get(field) and not existing.get(field)}
+        if not update_data:
+            return False
+        # PDF的哈希和大小随pdf_url一起补充，预先生成的引用随bib一起补充
+        if 'pdf_url' in update_data:
+            update_data.update({field: paper[field] for field in ('file_hash', 'file_size') if paper.get(field)})
+        if 'bib' in update_data:
+            update_data.update(reference_fields(update_data['bib']))
+        try:
+            if self.supabase is not None:
+                result = self.supabase.rpc('merge_paper_info', {
+                    'p_paper_id': paper_id,
+                    'p_fields': update_data,
+                }).execute()
+                if not result.data:
+                    return False
+            self._reindex_paper(paper_id, update_data)
+            return True
+        except Exception as e:
+            logger.error(f"合并论文信息失败: {e}")
+            return False
+
+    def load_dedup_index(self, index, page_size: int = 1000) -> int:
+        """分页读取已入库论文的标题、作者和年份，建立近似重复索引
+
+        Args:
+            index: NearDuplicateIndex实例
+            page_size: 每次读取的论文数量
+
+        Returns:
+            int: 写入索引的论文数量
+        """
+        total = 0
+        for rows in self.iter_papers('id,title,authors,pub_year', page_size):
+            index.add_papers(rows)
+            total += len(rows)
+        return total
+
+    def iter_papers(self, columns: str = '*', page_size: int = 1000,
+                    null_column: Optional[str] = None) -> Iterator[List[Dict]]:
+        """按ID键集分页遍历所有论文，用于建立索引和导出
+
+        Args:
+            columns: 需要的列，必须包含id
+            page_size: 每页数量
+            null_column: 只遍历该列为空的论文，如embedding
+
+        Yields:
+            List[Dict]: 每页的论文
+        """
+        last_id = None
+        while True:
+            query = self.supabase.table('papers').select(columns).order('id').limit(page_size)
+            if null_column is not None:
+                query = query.is_(null_column, 'null')
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.execute().data or []
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1]['id']
+
+    def backfill_embeddings(self, page_size: int = 100) -> int:
+        """为没有向量的已入库论文（如加入embedding列之前入库的论文）计算并写入向量，
+        需要使用有papers表更新权限的客户端（如service role）
+
+        Args:
+            page_size: 每批计算向量的论文数量
+
+        Returns:
+            int: 写入向量的论文数量
+        """
+        if self.embedder is None:
+            raise ValueError("未配置向量模型（EMBEDDING_CONFIG），无法计算论文向量")
+        total = 0
+        for rows in self.iter_papers('id,title,abstract', page_size, null_column='embedding'):
+            vectors = self.embedder.encode([paper_text(row) for row in rows])
+            for row, vector in zip(rows, vectors):
+                row['embedding'] = vector.tolist()
+                self.supabase.table('papers').update({'embedding': row['embedding']}).eq('id', row['id']).execute()
+            if self.vector_index is not None:
+                self.vector_index.add_papers(rows)
+            total += len(rows)
+            logger.info(f"已为 {total} 篇论文补充向量")
+        return total
+
+    def iter_session_papers(self, session_id: str, page_size: int = 1000,
+                            columns: str = '*') -> Iterator[List[Dict]]:
+        """按result_index顺序分页遍历一次搜索的论文，用于导出
+
+        Args:
+            session_id: 搜索会话ID
+            page_size: 每页数量
+            columns: 需要的论文列，不需要向量时应显式列出以免读取embedding和search_vector
+
+        Yields:
+            List[Dict]: 每页的论文，包含其在搜索结果中的result_index
+        """
+        after_index = None
+        while True:
+            query = self.supabase.table('search_results') \
+                .select(f'result_index,papers({columns})') \
+                .eq('session_id', session_id) \
+                .order('result_index') \
+                .limit(page_size)
+            if after_index is not None:
+                query = query.gt('result_index', after_index)
+            rows = query.execute().data or []
+            papers = [{**row['papers'], 'result_index': row['result_index']} for row in rows if row.get('papers')]
+            if papers:
+                yield papers
+            if len(rows) < page_size:
+                break
+            after_index = rows[-1]['result_index']
+
     def update_paper(self, paper_id: str, update_data: Dict[str, Any]) -> bool:
         """更新单篇论文信息
         
@@ -132,12 +347,30 @@ class PaperOperations:
             bool: 是否更新成功
         """
         try:
-            self.supabase.table('papers').update(update_data).eq('id', paper_id).execute()
+            # bib变化时同步更新预先生成的引用
+            if 'bib' in update_data:
+                update_data = {**update_data, **reference_fields(update_data['bib'])}
+            if self.supabase is not None:
+                self.supabase.table('papers').update(update_data).eq('id', paper_id).execute()
+            self._reindex_paper(paper_id, update_data)
             return True
         except Exception as e:
             logger.error(f"更新论文失败: {e}")
             return False
 
+    def _reindex_paper(self, paper_id: str, update_data: Dict[str, Any]):
+        """论文字段更新后同步全文检索索引"""
+        if self.search_index is None:
+            return
+        try:
+            self.search_index.update_paper(paper_id, update_data)
+        except ValueError:
+            # 索引未保存原文，无法与旧字段合并，按数据库中的完整记录重新索引
+            paper = self.get_paper_by_id(paper_id) if self.supabase is not None else None
+            if paper is None:
+                raise
+            self.search_index.add_papers([paper])
+
     def get_paper_by_id(self, paper_id: str) -> Optional[Dict]:
         """根据ID获取论文信息
         
@@ -148,12 +381,146 @@ class PaperOperations:
             dict: 论文信息
         """
         try:
-            result = self.supabase.table('papers').select('*').eq('id', paper_id).execute()
+            result = self.supabase.table('papers').select(PAPER_COLUMNS).eq('id', paper_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"获取论文信息失败: {e}")
             return None
 
+    def get_references_by_bib(self, bib: str) -> Optional[Dict]:
+        """根据bib查找已入库论文预先生成的引用
+
+        Args:
+            bib: BibTeX字符串
+
+        Returns:
+            dict: ref_apa、ref_mla、ref_gb7714字段，未找到则返回None
+        """
+        try:
+            result = self.supabase.table('papers') \
+                .select('ref_apa,ref_mla,ref_gb7714') \
+                .eq('bib_hash', bib_hash(bib)) \
+                .limit(1) \
+                .execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"根据bib获取引用失败: {e}")
+            return None
+
+    def find_existing_papers(self, dois: List[str], title_norms: List[str]) -> Dict[str, str]:
+        """按DOI和规范化标题批量查找已存在的论文，用于导入时去重；分批查询以免超出URL长度限制，
+        查询出错时直接抛出异常，避免去重失效后重复导入
+
+        Args:
+            dois: 规范化后的DOI列表，与papers表的doi_norm列比较
+            title_norms: 规范化后的标题列表
+
+        Returns:
+            Dict[str, str]: {'doi:<doi>' 或 'title:<title_norm>': 论文ID}
+        """
+        existing = {}
+        for column, prefix, values in (('doi_norm', 'doi', dois), ('title_norm', 'title', title_norms)):
+            for batch in _lookup_batches(values):
+                result = self.supabase.table('papers').select(f'id,{column}').in_(column, batch).execute()
+                for row in result.data or []:
+                    existing[f"{prefix}:{row[column]}"] = row['id']
+        return existing
+
+    def import_bib_entries(
+            self,
+            entries: Iterable[Tuple[str, Dict]],
+            style: str = 'apa',
+            chunk_size: int = 200,
+    ) -> Iterator[Dict[str, Any]]:
+        """分块导入BibTeX条目：按DOI/规范化标题以及近似重复去重，新论文批量入库，并返回格式化引用
+
+        Args:
+            entries: (条目原始文本, 条目字典)的可迭代对象，通常来自iter_bib_entries
+            style: 引用格式
+            chunk_size: 每块的条目数，同时也是每次批量插入的上限
+
+        Yields:
+            dict: 每块的结果，包含references、inserted、duplicates，以及缺少DOI和标题而跳过的条目数skipped；
+                新论文入库失败时另含未入库数failed和error
+
+        Raises:
+            Exception: 查询已存在论文失败时抛出，不在去重失效的情况下继续入库
+        """
+        seen = set()
+        # 文件内部的近似重复，如同一篇论文的预印本和正式版本
+        seen_papers = NearDuplicateIndex()
+        entries = iter(entries)
+        while True:
+            chunk = list(itertools.islice(entries, chunk_size))
+            if not chunk:
+                break
+            references = []
+            candidates = []
+            duplicates = skipped = 0
+            for bib, entry in chunk:
+                references.append(entry_to_text(entry, style))
+                keys = []
+                doi = normalize_doi(entry.get('doi'))
+                if doi:
+                    keys.append(f"doi:{doi}")
+                title_norm = normalize_title(entry.get('title'))
+                if title_norm:
+                    keys.append(f"title:{title_norm}")
+                # 既没有DOI也没有标题的条目无法去重，也不能入库
+                if not keys:
+                    skipped += 1
+                    continue
+                # 文件内部重复
+                if any(key in seen for key in keys):
+                    duplicates += 1
+                    continue
+                seen.update(keys)
+                candidates.append((keys, doi, title_norm, bib, entry))
+
+            existing = self.find_existing_papers(
+                [doi for _, doi, _, _, _ in candidates if doi],
+                [title_norm for _, _, title_norm, _, _ in candidates if title_norm],
+            )
+            new_papers = []
+            new_keys = []
+            for keys, doi, _, bib, entry in candidates:
+                if any(key in existing for key in keys):
+                    duplicates += 1
+                    continue
+                year = entry.get('year', '')
+                paper = Paper(
+                    id=str(uuid.uuid4()),
+                    title=entry.get('title', '').strip(),
+                    authors=re.sub(r'\s+', ' ', entry['author']) if entry.get('author') else None,
+                    pub_year=int(year) if year.isdigit() else None,
+                    bib=bib,
+                    pub_url=entry.get('url'),
+                    doi=doi or None,
+                ).__dict__
+                if seen_papers.find_duplicate(paper) or self.find_near_duplicate(paper):
+                    duplicates += 1
+                    continue
+                seen_papers.add_papers([paper])
+                paper.update(reference_fields(bib, [entry]))
+                new_papers.append(paper)
+                new_keys.extend(keys)
+
+            inserted = self.batch_insert_papers(new_papers) if new_papers else []
+            result = {
+                'references': references,
+                'inserted': len(inserted),
+                'duplicates': duplicates,
+                'skipped': skipped,
+            }
+            if len(inserted) != len(new_papers):
+                # 入库失败的论文不算已导入，文件后面的相同条目仍可再次尝试入库
+                seen.difference_update(new_keys)
+                seen_papers.remove_papers([paper['id'] for paper in new_papers])
+                result['failed'] = len(new_papers) - len(inserted)
+                result['error'] = f'导入论文失败: 写入 {len(new_papers)} 篇论文，成功 {len(inserted)} 篇'
+                logger.error(result['error'])
+            yield result
+
     def insert_search_results(
             self,
             papers_id: List,
@@ -197,59 +564,55 @@ class PaperOperations:
             self,
             session_id: str,
             page: int = 1,
-            page_size: int = 20
+            page_size: int = 20,
+            after_index: Optional[int] = None,
+            with_count: bool = True
     ) -> tuple[List[Dict], Dict]:
-        """根据搜索会话ID获取论文列表
+        """根据搜索会话ID获取论文列表，一次请求按result_index顺序返回本页论文和总数
         
         Args:
             session_id: 搜索会话ID
-            page: 页码
+            page: 页码，after_index为空时按偏移量分页
             page_size: 每页数量
+            after_index: 上一页最后一篇的result_index，传入时从其之后取一页（键集分页），
+                翻到很深的页也不必跳过前面的行
+            with_count: 是否同时统计总数，连续翻页时可只在第一页统计
             
         Returns:
-            tuple: (论文列表, 分页信息)
+            tuple: (论文列表, 分页信息)，分页信息中的next_index可作为下一页的after_index
         """
         try:
-            # 计算偏移量
-            offset = (page - 1) * page_size
-            
-            # 查询搜索结果总数
-            count_result = self.supabase.table('search_results') \
-                .select('count', count='exact') \
-                .eq('session_id', session_id) \
-                .execute()
-            
-            total_count = count_result.count if hasattr(count_result, 'count') else 0
-            
-            # 查询论文数据
-            result = self.supabase.table('search_results') \
-                .select('paper_id,result_index') \
+            # 通过外键嵌入papers，排序、分页和计数在同一次请求中完成；只取返回给前端的列，不读取向量
+            query = self.supabase.table('search_results') \
+                .select(f'result_index,papers({PAPER_COLUMNS})', count='exact' if with_count else None) \
                 .eq('session_id', session_id) \
-                .order('result_index') \
-                .range(offset, offset + page_size - 1) \
-                .execute()
-            
-            # 获取论文ID列表
-            paper_ids = [item['paper_id'] for item in result.data] if result.data else []
+                .order('result_index')
+            if after_index is not None:
+                query = query.gt('result_index', after_index).limit(page_size)
+            else:
+                offset = (page - 1) * page_size
+                query = query.range(offset, offset + page_size - 1)
+            result = query.execute()
             
-            # 查询论文详细信息
-            papers_data = []
-            if paper_ids:
-                papers_result = self.supabase.table('papers') \
-                    .select('*') \
-                    .in_('id', paper_ids) \
-                    .execute()
-                papers_data = papers_result.data
+            rows = result.data or []
+            papers_data = [row['papers'] for row in rows if row.get('papers')]
+            next_index = rows[-1]['result_index'] if len(rows) == page_size else None
             
             # 构建分页信息
-            total_pages = (total_count + page_size - 1) // page_size
+            total_count = (result.count or 0) if with_count else None
+            total_pages = (total_count + page_size - 1) // page_size if with_count else None
+            if with_count and after_index is None:
+                has_next = page < total_pages
+            else:
+                has_next = next_index is not None
             pagination = {
                 'current_page': page,
                 'page_size': page_size,
                 'total_count': total_count,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
+                'has_next': has_next,
+                'has_prev': page > 1 if after_index is None else True,
+                'next_index': next_index if has_next else None
             }
             
             return papers_data, pagination
@@ -259,24 +622,17 @@ class PaperOperations:
 
     def save_task_to_db(self, task):
         """
-        将任务信息保存到数据库
+        将任务信息保存到数据库，按session_id一次upsert，已存在则更新
         
         Args:
             task: 搜索任务对象
         """
         try:
-            # 检查任务是否已存在
-            result = self.supabase.table('search_tasks').select('*').eq('session_id', task.session_id).execute()
-            user_id_str = str(task.user_id) if task.user_id else None
-            task_data = task.__dict__
-            if result.data:
-                # 更新现有任务
-                self.supabase.table('search_tasks').update(task_data).eq('session_id', task.session_id).execute()
-            else:
-                # 插入新任务
-                if user_id_str is None:
-                    raise ValueError("用户ID不能为空，无法创建搜索任务")
-                self.supabase.table('search_tasks').insert(task_data).execute()
+            if task.user_id is None:
+                raise ValueError("用户ID不能为空，无法保存搜索任务")
+            # created_at由触发器在插入时设置，不随更新覆盖
+            task_data = {key: value for key, value in task.__dict__.items() if key != 'created_at'}
+            self.supabase.table('search_tasks').upsert(task_data, on_conflict='session_id').execute()
         except Exception as e:
             logger.error(f"保存任务到数据库失败: {e}")
             raise e
@@ -303,34 +659,206 @@ class PaperOperations:
                     limit_num=task_data['limit_num'],
                     user_id=task_data['user_id'],
                     status=task_data['status'],
+                    scholar_cursor=task_data.get('scholar_cursor') or 0,
+                    fetched_num=task_data.get('fetched_num') or 0,
+                    processed_num=task_data.get('processed_num') or 0,
+                    message=task_data.get('message'),
                 )
                 return task
         except Exception as e:
             logger.error(f"从数据库加载任务失败: {e}")
         return None
 
-    def search_papers_by_keyword(self, keyword: str) -> List[Dict]:
-        """根据关键词模糊匹配papers表中的论文标题
+    def find_cached_session(
+            self,
+            keyword: str,
+            year_low: Optional[int],
+            year_high: Optional[int],
+            limit_num: int,
+            max_age: int,
+    ) -> Optional[str]:
+        """查找条件相同、结果数量足够且在有效期内实际爬取完成的搜索会话，跨用户共享，
+        命中缓存时复制出的会话不作为来源
+
+        Args:
+            keyword: 搜索关键词，忽略大小写和多余空白
+            year_low: 最早年份
+            year_high: 最晚年份
+            limit_num: 需要的论文数量
+            max_age: 有效期（秒）
+
+        Returns:
+            str: 可复用的session_id，未找到则返回None
+        """
+        try:
+            result = self.supabase.rpc('find_cached_search', {
+                'p_keyword': normalize_keyword(keyword),
+                'p_year_low': year_low,
+                'p_year_high': year_high,
+                'p_limit_num': limit_num,
+                'p_max_age_seconds': int(max_age),
+            }).execute()
+            return result.data or None
+        except Exception as e:
+            logger.error(f"查找搜索缓存失败: {e}")
+            return None
+
+    def find_expandable_session(
+            self,
+            keyword: str,
+            year_low: Optional[int],
+            year_high: Optional[int],
+            limit_num: int,
+            max_age: int,
+    ) -> Optional[Dict]:
+        """查找条件相同但论文数量少于limit_num的已完成搜索，用于只爬取增量部分
+
+        Args:
+            keyword: 搜索关键词，忽略大小写和多余空白
+            year_low: 最早年份
+            year_high: 最晚年份
+            limit_num: 需要的论文数量
+            max_age: 有效期（秒）
+
+        Returns:
+            dict: session_id、limit_num、scholar_cursor，未找到则返回None
+        """
+        try:
+            result = self.supabase.rpc('find_expandable_search', {
+                'p_keyword': normalize_keyword(keyword),
+                'p_year_low': year_low,
+                'p_year_high': year_high,
+                'p_limit_num': limit_num,
+                'p_max_age_seconds': int(max_age),
+            }).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"查找可扩展的搜索失败: {e}")
+            return None
+
+    def get_session_paper_ids(self, session_id: str, limit: Optional[int] = None) -> List[str]:
+        """按result_index顺序获取搜索会话的论文ID
+
+        Args:
+            session_id: 搜索会话ID
+            limit: 最多返回的数量
+
+        Returns:
+            List[str]: 论文ID列表
+        """
+        query = self.supabase.table('search_results') \
+            .select('paper_id') \
+            .eq('session_id', session_id) \
+            .order('result_index')
+        if limit:
+            query = query.limit(limit)
+        result = query.execute()
+        return [item['paper_id'] for item in result.data] if result.data else []
+
+    def get_papers_by_ids(self, paper_ids: List[str], columns: str = PAPER_COLUMNS) -> List[Dict]:
+        """根据ID列表批量获取论文信息（不保证顺序）
+
+        Args:
+            paper_ids: 论文ID列表
+            columns: 需要的列
+
+        Returns:
+            List[Dict]: 论文信息列表
+        """
+        if not paper_ids:
+            return []
+        result = self.supabase.table('papers').select(columns).in_('id', paper_ids).execute()
+        return result.data or []
+
+    def search_papers(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """在papers表中全文检索标题、关键词和摘要，按相关度排序
+        
+        Args:
+            query: 检索词，支持websearch语法（"短语"、or、-排除）
+            limit: 返回数量
+            offset: 跳过的数量
+            
+        Returns:
+            List[Dict]: 按相关度排序的论文列表
+        """
+        result = self.supabase.rpc('search_papers', {
+            'p_query': query,
+            'p_limit': limit,
+            'p_offset': offset,
+        }).execute()
+        return result.data or []
+
+    def semantic_search(
+            self,
+            text: str,
+            limit: int = 20,
+            year_low: Optional[int] = None,
+            year_high: Optional[int] = None,
+            paper_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """按语义相似度检索论文，可输入一段文字
+        
+        Args:
+            text: 查询文本，如用户粘贴的段落
+            limit: 返回数量
+            year_low: 最早年份
+            year_high: 最晚年份
+            paper_ids: 只在这些论文中检索，如某个知识库中的论文
+            
+        Returns:
+            List[Dict]: 按相似度降序的论文列表，每篇论文带有similarity字段
+        """
+        if self.vector_index is not None:
+            matches = self.vector_index.search(text, k=limit, year_low=year_low, year_high=year_high,
+                                               paper_ids=paper_ids)
+        else:
+            if self.embedder is None:
+                raise ValueError("未配置向量模型（EMBEDDING_CONFIG），无法进行语义检索")
+            embedding = self.embedder.encode([text])[0]
+            result = self.supabase.rpc('match_papers', {
+                'p_embedding': embedding.tolist(),
+                'p_limit': limit,
+                'p_year_low': year_low,
+                'p_year_high': year_high,
+                'p_paper_ids': paper_ids,
+            }).execute()
+            matches = [(row['id'], row['similarity']) for row in result.data or []]
+        if not matches:
+            return []
+
+        if self.supabase is not None:
+            columns = 'id,title,authors,pub_year,abstract,keywords,doi,pub_url,pdf_url,num_citations'
+            papers = {paper['id']: paper for paper in self.get_papers_by_ids([m[0] for m in matches], columns)}
+        elif self.search_index is not None:
+            papers = {paper_id: self.search_index.get_paper(paper_id) for paper_id, _ in matches}
+        else:
+            papers = {paper_id: {'id': paper_id} for paper_id, _ in matches}
+        return [{**papers[paper_id], 'similarity': similarity}
+                for paper_id, similarity in matches if papers.get(paper_id)]
+
+    def search_papers_by_keyword(self, keyword: str, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """根据关键词检索papers表中的论文，无关键词时返回最新的论文
         
         Args:
             keyword: 搜索关键词
+            limit: 返回数量
+            offset: 跳过的数量
             
         Returns:
             List[Dict]: 匹配的论文列表
         """
         try:
-            # 构建查询条件，只模糊匹配标题
+            # 配置了本地索引时直接在索引中检索
+            if self.search_index is not None:
+                return self.search_index.search_papers(keyword, limit=limit, offset=offset)
+            # 有关键词时使用全文检索，否则按入库时间倒序
             if keyword:
-                result = (self.supabase.table('papers')
-                         .select('*')
-                         .ilike('title', f'%{keyword}%')
-                         .order('created_at', desc=True)
-                         .execute())
-            else:
-                result = (self.supabase.table('papers')
-                         .select('*')
-                         .order('created_at', desc=True)
-                         .execute())
+                return self.search_papers(keyword, limit=limit, offset=offset)
+            result = (self.supabase.table('papers')
+                     .select(PAPER_COLUMNS)
+                     .order('created_at', desc=True)
+                     .range(offset, offset + limit - 1)
+                     .execute())
             
             papers_data = result.data if result.data else []
             return papers_data
@@ -338,3 +866,12 @@ class PaperOperations:
         except Exception as e:
             logger.error(f"根据关键词搜索论文失败: {e}")
             raise e
+
+
+if __name__ == '__main__':
+    # 为没有向量的已入库论文补充向量：python -m db.paper_operations
+    from db.supabase_client import SupabaseInitializer
+
+    logging.basicConfig(level=logging.INFO)
+    count = PaperOperations(SupabaseInitializer().supabase_admin).backfill_embeddings()
+    print(f"共为 {count} 篇论文补充向量")
@@ -0,0 +1,113 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 搜索任务允许的状态转换，completed/error/cancelled为终止状态
+TASK_TRANSITIONS = {
+    'pending': {'running', 'completed', 'error', 'cancelled'},
+    'running': {'completed', 'error', 'cancelled'},
+    'completed': set(),
+    'error': set(),
+    'cancelled': set(),
+}
+FINAL_STATUSES = {'completed', 'error', 'cancelled'}
+# 进度更新合并写入数据库的间隔（秒）
+PROGRESS_FLUSH_INTERVAL = 2.0
+
+
+class TaskTracker:
+    """搜索任务的状态机：校验状态转换，每次转换立即写库一次，进度更新按时间间隔合并写入"""
+
+    def __init__(self, paper_ops, task, flush_interval=PROGRESS_FLUSH_INTERVAL):
+        """
+        Args:
+            paper_ops: PaperOperations实例
+            task: 搜索任务对象
+            flush_interval: 进度写库的最小间隔（秒）
+        """
+        self.paper_ops = paper_ops
+        self.task = task
+        self.flush_interval = flush_interval
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.task.status in FINAL_STATUSES
+
+    def transition(self, status, **fields):
+        """
+        切换任务状态并立即保存，同时写入尚未保存的进度
+
+        Args:
+            status: 目标状态
+            **fields: 需要一并更新的任务字段，如scholar_cursor、message
+
+        Raises:
+            ValueError: 不允许从当前状态切换到目标状态
+            Exception: 保存失败时抛出，任务状态和字段恢复为转换前的值
+        """
+        with self._lock:
+            if status not in TASK_TRANSITIONS.get(self.task.status, set()):
+                raise ValueError(f"任务状态不能从 {self.task.status} 变为 {status}")
+            previous = {key: getattr(self.task, key) for key in ('status', *fields)}
+            self.task.status = status
+            for key, value in fields.items():
+                setattr(self.task, key, value)
+            self._cancel_timer()
+            try:
+                self._flush()
+            except Exception:
+                # 保存失败时恢复原状态，任务不会被当作已结束，调用方仍可再转换为error
+                for key, value in previous.items():
+                    setattr(self.task, key, value)
+                raise
+
+    def start(self):
+        self.transition('running')
+
+    def complete(self, **fields):
+        self.transition('completed', **fields)
+
+    def fail(self, message=None):
+        self.transition('error', message=message)
+
+    def cancel(self):
+        self.transition('cancelled')
+
+    def update(self, **counters):
+        """
+        更新进度计数（如fetched_num、processed_num），不立即写库，
+        而是在flush_interval秒后合并写入一次；任务结束后的更新将被忽略
+        """
+        with self._lock:
+            if self.finished:
+                return
+            for key, value in counters.items():
+                setattr(self.task, key, value)
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+            if not self._dirty or self.finished:
+                return
+            try:
+                self._flush()
+            except Exception as e:
+                logger.warning(f"保存任务进度失败: {self.task.session_id}, 错误: {e}")
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _flush(self):
+        self.paper_ops.save_task_to_db(self.task)
+        self._dirty = False
@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+import logging
+import threading
+from array import array
+
+import numpy as np
+
+from paper_utils.embedding_index import EmbeddingIndex, HashingEmbedder, save_array, _normalize, SEARCH_CHUNK_ROWS
+
+logger = logging.getLogger(__name__)
+
+# 默认检索的倒排列表数量，越大召回率越高、速度越慢
+DEFAULT_NPROBE = 16
+# 向量数量达到该值后第一次检索时在后台训练聚类中心，训练完成前仍精确检索；更少时精确检索已经足够快
+AUTO_TRAIN_SIZE = 50000
+# 过滤后剩余的向量不超过该数量时直接精确检索（如按知识库过滤）
+EXACT_SEARCH_SIZE = 20000
+# 训练聚类中心时每个中心平均使用的样本数
+TRAIN_SAMPLES_PER_LIST = 40
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """
+    球面k-means：按余弦相似度分配，中心归一化
+
+    Args:
+        vectors: 已归一化的训练向量
+        n_clusters: 聚类数量
+        iterations: 迭代次数
+
+    Returns:
+        np.ndarray: (n_clusters, dim)的聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_lists(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+        # 空的聚类重新随机选取中心
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def assign_lists(vectors, centroids, rows=None, chunk=SEARCH_CHUNK_ROWS):
+    """
+    将向量分配到最相似的聚类中心，分块计算以限制内存占用
+
+    Args:
+        vectors: 向量矩阵
+        centroids: 聚类中心
+        rows: 只分配这些行，默认全部
+
+    Returns:
+        np.ndarray: 每个向量的中心编号
+    """
+    n = len(vectors) if rows is None else len(rows)
+    labels = np.empty(n, dtype=np.int32)
+    for start in range(0, n, chunk):
+        part = vectors[start:start + chunk] if rows is None else vectors[rows[start:start + chunk]]
+        labels[start:start + chunk] = np.argmax(part @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex(EmbeddingIndex):
+    """
+    倒排文件（IVF）近似最近邻索引：向量按聚类中心分到倒排列表，检索时只计算最相似的nprobe个列表。
+    新增的向量直接分配到已有的列表，无需重新训练；保存时按列表顺序重排向量，加载后以mmap方式读取连续的列表
+    """
+    ROW_ARRAYS = EmbeddingIndex.ROW_ARRAYS + (('assignments', -1),)
+
+    def __init__(self, embedder, dim=None, nlist=None, nprobe=DEFAULT_NPROBE, auto_train_size=AUTO_TRAIN_SIZE):
+        """
+        Args:
+            embedder: 向量模型，需提供encode(texts)方法
+            dim: 向量维度，默认取embedder.dim
+            nlist: 倒排列表数量，默认为4*sqrt(向量数)
+            nprobe: 检索的倒排列表数量
+            auto_train_size: 向量数量达到该值后在后台自动训练，为None时只能手动调用train()
+        """
+        super().__init__(embedder, dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.auto_train_size = auto_train_size
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.centroids = None
+        self._lists = None
+        self._train_lock = threading.Lock()
+        self._train_thread = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self, iterations=10, seed=0):
+        """
+        用当前的向量训练聚类中心，并重新分配所有向量；数据量比训练时增长很多后可再次调用。
+        聚类和分配在索引锁之外计算，训练期间检索和添加不受阻塞，期间新增的向量最后再分配
+        """
+        with self._train_lock:
+            with self._lock:
+                # 已写入的行不会再被修改（更新论文时追加新行），扩容替换数组后旧数组中的内容仍然有效
+                vectors, size = self.vectors, self._size
+                live = np.flatnonzero(self.valid[:size])
+            if not len(live):
+                return
+            nlist = self.nlist or int(np.clip(4 * np.sqrt(len(live)), 1, 65536))
+            nlist = min(nlist, len(live))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(live, min(len(live), nlist * TRAIN_SAMPLES_PER_LIST), replace=False))
+            start = time.perf_counter()
+            centroids = spherical_kmeans(np.asarray(vectors[sample]), nlist, iterations, seed)
+            labels = assign_lists(vectors, centroids, live)
+            with self._lock:
+                self.assignments[:self._size] = -1
+                self.assignments[live] = labels
+                added = np.arange(size, self._size)
+                if len(added):
+                    self.assignments[added] = assign_lists(self.vectors, centroids, added)
+                self.centroids = centroids
+                self._build_lists()
+            logger.info(f"IVF索引训练完成: {len(live)} 个向量, {nlist} 个列表, {time.perf_counter() - start:.1f} 秒")
+
+    def _train_in_background(self):
+        """在后台线程中训练，已有训练在进行时不重复启动"""
+        if self._train_thread is not None and self._train_thread.is_alive():
+            return
+
+        def run():
+            try:
+                self.train()
+            except Exception as e:
+                logger.error(f"IVF索引训练失败: {e}", exc_info=True)
+
+        self._train_thread = threading.Thread(target=run, name='ivf-train', daemon=True)
+        self._train_thread.start()
+
+    def _build_lists(self):
+        rows = np.flatnonzero(self.assignments[:self._size] >= 0)
+        order = rows[np.argsort(self.assignments[rows], kind='stable')]
+        bounds = np.cumsum(np.bincount(self.assignments[rows], minlength=len(self.centroids)))
+        self._lists = []
+        for chunk in np.split(order, bounds[:-1]):
+            rows_array = array('q')
+            rows_array.frombytes(chunk.astype(np.int64).tobytes())
+            self._lists.append(rows_array)
+
+    def _append(self, papers, vectors):
+        with self._lock:
+            super()._append(papers, vectors)
+            if self.trained:
+                # 新增的向量直接加入最相似的列表
+                rows = np.arange(self._size - len(papers), self._size)
+                labels = assign_lists(self.vectors, self.centroids, rows)
+                self.assignments[rows] = labels
+                for row, label in zip(rows.tolist(), labels.tolist()):
+                    self._lists[label].append(row)
+
+    def _top_k(self, query_vectors, mask, k):
+        if not self.trained and self.auto_train_size and len(self) >= self.auto_train_size:
+            self._train_in_background()
+        if not self.trained or mask.sum() <= EXACT_SEARCH_SIZE:
+            return super()._top_k(query_vectors, mask, k)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(query_vectors @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        results = []
+        for query, lists in zip(query_vectors, probes):
+            rows = np.concatenate([np.frombuffer(self._lists[i], dtype=np.int64) for i in lists])
+            rows = rows[mask[rows]]
+            scores = self.vectors[rows] @ query
+            if len(rows) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            order = np.argsort(-scores)
+            results.append([(self.ids[rows[i]], float(scores[i])) for i in order])
+        return results
+
+    def save(self, path):
+        """
+        保存索引：未训练时与EmbeddingIndex相同；训练后去掉已删除的向量，并按倒排列表顺序重排，
+        加载后每个列表在mmap文件中是连续的
+        """
+        with self._lock:
+            if not self.trained:
+                super().save(path)
+                return
+            os.makedirs(path, exist_ok=True)
+            live = np.flatnonzero(self.valid[:self._size])
+            order = live[np.argsort(self.assignments[live], kind='stable')]
+            tmp_path = os.path.join(path, 'vectors.tmp.npy')
+            out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(len(order), self.dim))
+            for start in range(0, len(order), SEARCH_CHUNK_ROWS):
+                out[start:start + SEARCH_CHUNK_ROWS] = self.vectors[order[start:start + SEARCH_CHUNK_ROWS]]
+            out.flush()
+            del out
+            os.replace(tmp_path, os.path.join(path, 'vectors.npy'))
+            save_array(os.path.join(path, 'years.npy'), self.years[order])
+            save_array(os.path.join(path, 'valid.npy'), np.ones(len(order), dtype=bool))
+            save_array(os.path.join(path, 'assignments.npy'), self.assignments[order])
+            save_array(os.path.join(path, 'centroids.npy'), self.centroids)
+            with open(os.path.join(path, 'ids.txt'), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(self.ids[i] for i in order))
+
+    @classmethod
+    def load(cls, path, embedder, use_mmap=True, nprobe=DEFAULT_NPROBE):
+        """
+        加载索引，use_mmap时向量矩阵以只读mmap方式按需读取
+
+        Returns:
+            IVFIndex: 索引
+        """
+        index = super().load(path, embedder, use_mmap)
+        index.nprobe = nprobe
+        index.assignments = np.full(index._size, -1, dtype=np.int32)
+        if os.path.exists(os.path.join(path, 'centroids.npy')):
+            index.centroids = np.load(os.path.join(path, 'centroids.npy'))
+            index.nlist = len(index.centroids)
+            index.assignments = np.load(os.path.join(path, 'assignments.npy'))
+            index._build_lists()
+        return index
+
+
+def _synthetic_vectors(num_docs, dim, latent_dim=64, n_topics=200, noise=1.0, seed=0):
+    """
+    生成近似真实论文向量分布的合成向量：主题在低维子空间中相互重叠，方差随维度衰减，
+    叠加所有向量共有的偏移方向和各向同性噪声，不相关向量的平均余弦相似度约为0.2
+    """
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.standard_normal((dim, latent_dim)))[0].T.astype(np.float32)
+    scales = (1 / np.sqrt(1 + np.arange(latent_dim))).astype(np.float32)
+    common = _normalize(rng.standard_normal((1, dim)))[0] * 1.5
+    topics = rng.standard_normal((n_topics, latent_dim)).astype(np.float32) * scales
+    labels = rng.integers(0, n_topics, num_docs)
+    vectors = np.empty((num_docs, dim), dtype=np.float32)
+    for start in range(0, num_docs, SEARCH_CHUNK_ROWS):
+        end = min(start + SEARCH_CHUNK_ROWS, num_docs)
+        latent = topics[labels[start:end]] + rng.standard_normal((end - start, latent_dim), dtype=np.float32) * scales
+        noise_part = rng.standard_normal((end - start, dim), dtype=np.float32) * (noise / np.sqrt(dim))
+        vectors[start:end] = _normalize(latent @ basis + common + noise_part)
+    return vectors
+
+
+if __name__ == '__main__':
+    # 基准测试：python -m paper_utils.ann_index [向量数量]，对比精确检索的召回率和延迟
+    import tempfile
+
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    dim, k, num_queries = 384, 10, 200
+    vectors = _synthetic_vectors(num_docs, dim)
+    rng = np.random.default_rng(1)
+    queries = _normalize(vectors[rng.choice(num_docs, num_queries, replace=False)]
+                         + rng.standard_normal((num_queries, dim), dtype=np.float32) * (0.5 / np.sqrt(dim)))
+
+    index = IVFIndex(HashingEmbedder(dim), auto_train_size=None)
+    papers = [{'id': str(i), 'pub_year': 2000 + i % 25} for i in range(num_docs)]
+    index._append(papers, vectors)
+    start = time.perf_counter()
+    index.train()
+    print(f"训练: {num_docs} 个向量, {len(index.centroids)} 个列表, {time.perf_counter() - start:.1f} 秒")
+
+    def timed(fn):
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(fn(query[None, :])[0])
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return results, sum(latencies) / len(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+    exact, mean, p95 = timed(lambda q: EmbeddingIndex._top_k(index, q, np.ones(num_docs, dtype=bool), k))
+    print(f"精确检索: 平均 {mean:.2f} ms, P95 {p95:.2f} ms")
+    truth = [{paper_id for paper_id, _ in result} for result in exact]
+    for nprobe in (4, 8, 16, 32, 64):
+        index.nprobe = nprobe
+        approx, mean, p95 = timed(lambda q: index.search_vectors(q, k))
+        recall = np.mean([len(truth[i] & {paper_id for paper_id, _ in result}) / k for i, result in enumerate(approx)])
+        print(f"IVF nprobe={nprobe}: recall@{k} {recall:.3f}, 平均 {mean:.2f} ms, P95 {p95:.2f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index.save(tmp_dir)
+        start = time.perf_counter()
+        loaded = IVFIndex.load(tmp_dir, HashingEmbedder(dim))
+        print(f"mmap加载: {time.perf_counter() - start:.2f} 秒")
+        loaded.add_papers([{'id': 'new', 'embedding': queries[0]}])
+        print(f"加载后增量插入并检索: {loaded.search_vectors(queries[:1], 1)[0]}")
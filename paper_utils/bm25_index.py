@@ -0,0 +1,615 @@
+import os
+import re
+import sys
+import json
+import math
+import itertools
+import mmap
+import time
+import shutil
+import tempfile
+import threading
+import logging
+from array import array
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 英文和数字按词切分，中文按连续汉字切分后再切成相邻两字
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[一-鿿]+')
+# 各字段的词频权重：标题和关键词中的词比摘要中的词更重要
+FIELD_WEIGHTS = (('title', 2), ('keywords', 2), ('abstract', 1))
+INDEXED_FIELDS = tuple(field for field, _ in FIELD_WEIGHTS)
+# 段数超过该值时合并为一个段
+MAX_SEGMENTS = 8
+K1 = 1.2
+B = 0.75
+MAX_TF = np.iinfo(np.uint16).max
+
+
+def tokenize(text):
+    """
+    将文本切分为检索词：英文、数字转小写后按词切分，中文按相邻两字切分（只有一个字时保留单字）
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        list: 检索词列表
+    """
+    tokens = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if word[0] >= '一' and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _field_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(v) for v in value)
+    return str(value)
+
+
+class Segment:
+    """
+    不可变的索引段：词表、按词排列的倒排表（文档号+词频）、文档长度、论文ID以及可选的论文原文。
+    保存到磁盘后倒排表以mmap方式加载，删除只在deleted中标记，合并段时才真正移除
+    """
+
+    def __init__(self, terms, offsets, docs, tfs, doc_len, ids, doc_offsets=None, doc_data=None, deleted=None):
+        self.terms = terms
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.ids = ids
+        self.doc_offsets = doc_offsets
+        self.doc_data = doc_data
+        self.deleted = deleted if deleted is not None else np.zeros(len(ids), dtype=bool)
+        self.name = None
+        self._file = None
+
+    @property
+    def n_docs(self):
+        return len(self.ids)
+
+    def postings(self, term):
+        """返回term的(文档号数组, 词频数组)，不存在时返回None"""
+        i = self.term_index.get(term)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def doc_freq(self, term):
+        i = self.term_index.get(term)
+        return 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+
+    def get_doc(self, docnum):
+        """读取第docnum篇论文的原文，未保存原文时返回None"""
+        if self.doc_data is None:
+            return None
+        return json.loads(self.doc_data[self.doc_offsets[docnum]:self.doc_offsets[docnum + 1]])
+
+    @classmethod
+    def build(cls, vocab, post_term, post_doc, post_tf, doc_len, ids, docs_json=None):
+        """
+        由(词编号, 文档号, 词频)三元组构建索引段，三元组需按文档号递增排列
+
+        Args:
+            vocab: 词表，词编号即其下标
+            post_term, post_doc, post_tf: 三元组数组
+            doc_len: 各文档的长度
+            ids: 各文档的论文ID
+            docs_json: 各文档原文的JSON字节串，可选
+        """
+        order = sorted(range(len(vocab)), key=vocab.__getitem__)
+        rank = np.empty(len(vocab), dtype=np.uint32)
+        rank[order] = np.arange(len(vocab), dtype=np.uint32)
+        term_rank = rank[np.asarray(post_term, dtype=np.uint32)]
+        # 稳定排序：同一个词内仍按文档号递增
+        by_term = np.argsort(term_rank, kind='stable')
+        counts = np.bincount(term_rank, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        doc_offsets = doc_data = None
+        if docs_json is not None:
+            doc_offsets = np.zeros(len(docs_json) + 1, dtype=np.int64)
+            np.cumsum([len(doc) for doc in docs_json], out=doc_offsets[1:])
+            doc_data = b''.join(docs_json)
+        return cls(
+            terms=[vocab[i] for i in order],
+            offsets=offsets,
+            docs=np.asarray(post_doc, dtype=np.uint32)[by_term],
+            tfs=np.asarray(post_tf, dtype=np.uint16)[by_term],
+            doc_len=np.asarray(doc_len, dtype=np.uint32),
+            ids=list(ids),
+            doc_offsets=doc_offsets,
+            doc_data=doc_data,
+        )
+
+    def save(self, path):
+        """将索引段写入目录path"""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'terms.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.terms))
+        with open(os.path.join(path, 'ids.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.ids))
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+        np.save(os.path.join(path, 'docs.npy'), self.docs)
+        np.save(os.path.join(path, 'tfs.npy'), self.tfs)
+        np.save(os.path.join(path, 'doc_len.npy'), self.doc_len)
+        self.save_deleted(path)
+        if self.doc_data is not None:
+            np.save(os.path.join(path, 'doc_offsets.npy'), self.doc_offsets)
+            with open(os.path.join(path, 'docs.jsonl'), 'wb') as f:
+                f.write(self.doc_data)
+
+    def save_deleted(self, path):
+        np.save(os.path.join(path, 'deleted.npy'), self.deleted)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        从目录path加载索引段，use_mmap时倒排表和原文以mmap方式按需读取
+
+        Returns:
+            Segment: 索引段
+        """
+        mmap_mode = 'r' if use_mmap else None
+
+        def read_lines(name):
+            with open(os.path.join(path, name), encoding='utf-8') as f:
+                content = f.read()
+            return content.split('\n') if content else []
+
+        doc_offsets = doc_data = doc_file = None
+        if os.path.exists(os.path.join(path, 'docs.jsonl')):
+            doc_offsets = np.load(os.path.join(path, 'doc_offsets.npy'))
+            doc_file = open(os.path.join(path, 'docs.jsonl'), 'rb')
+            if use_mmap and os.path.getsize(doc_file.name) > 0:
+                doc_data = mmap.mmap(doc_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                doc_data = doc_file.read()
+        segment = cls(
+            terms=read_lines('terms.txt'),
+            offsets=np.load(os.path.join(path, 'offsets.npy')),
+            docs=np.load(os.path.join(path, 'docs.npy'), mmap_mode=mmap_mode),
+            tfs=np.load(os.path.join(path, 'tfs.npy'), mmap_mode=mmap_mode),
+            doc_len=np.load(os.path.join(path, 'doc_len.npy')),
+            ids=read_lines('ids.txt'),
+            doc_offsets=doc_offsets,
+            doc_data=doc_data,
+            # 删除标记会被修改，不使用mmap
+            deleted=np.load(os.path.join(path, 'deleted.npy')),
+        )
+        segment.name = os.path.basename(os.path.normpath(path))
+        segment._file = doc_file
+        return segment
+
+    def close(self):
+        if isinstance(self.doc_data, mmap.mmap):
+            self.doc_data.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class BM25Index:
+    """
+    论文的BM25倒排索引，覆盖标题、摘要和关键词，不依赖数据库，可作为search_papers_by_keyword的后端。
+
+    新增的论文先写入内存缓冲区，检索前生成新的索引段；删除只做标记；段数过多时自动合并。
+    索引可保存到目录并以mmap方式加载。
+    """
+
+    def __init__(self, path=None, store_docs=True, k1=K1, b=B, max_segments=MAX_SEGMENTS):
+        """
+        Args:
+            path: 索引目录，save()时写入该目录
+            store_docs: 是否保存论文原文，保存后检索可直接返回论文信息
+            k1, b: BM25参数
+            max_segments: 段数超过该值时合并
+        """
+        self.path = path
+        self.store_docs = store_docs
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.segments = []
+        # 论文ID -> (所在的段，缓冲区中为None, 文档号)
+        self._locations = {}
+        self._live_docs = 0
+        self._total_len = 0
+        self._lock = threading.RLock()
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self._buf_vocab = {}
+        self._buf_term = array('I')
+        self._buf_doc = array('I')
+        self._buf_tf = array('H')
+        self._buf_len = array('I')
+        self._buf_ids = []
+        self._buf_docs = []
+        self._buf_deleted = set()
+
+    def __len__(self):
+        return self._live_docs
+
+    def __contains__(self, paper_id):
+        return paper_id in self._locations
+
+    def add_papers(self, papers):
+        """
+        添加或更新论文，已存在的论文ID会先删除旧版本
+
+        Args:
+            papers: 论文字典或Paper对象的可迭代对象，需包含id
+        """
+        with self._lock:
+            for paper in papers:
+                if not isinstance(paper, dict):
+                    paper = paper.__dict__
+                paper_id = str(paper['id'])
+                self._remove(paper_id)
+
+                counts = Counter()
+                for field, weight in FIELD_WEIGHTS:
+                    for token in tokenize(_field_text(paper.get(field))):
+                        counts[token] += weight
+                docnum = len(self._buf_ids)
+                for term, tf in counts.items():
+                    term_id = self._buf_vocab.setdefault(term, len(self._buf_vocab))
+                    self._buf_term.append(term_id)
+                    self._buf_doc.append(docnum)
+                    self._buf_tf.append(min(tf, MAX_TF))
+                doc_len = sum(counts.values())
+                self._buf_len.append(doc_len)
+                self._buf_ids.append(paper_id)
+                if self.store_docs:
+                    self._buf_docs.append(json.dumps(paper, ensure_ascii=False, default=str).encode('utf-8'))
+                self._locations[paper_id] = (None, docnum)
+                self._live_docs += 1
+                self._total_len += doc_len
+
+    def remove_papers(self, paper_ids):
+        """删除论文，返回实际删除的数量"""
+        with self._lock:
+            return sum(self._remove(str(paper_id)) for paper_id in paper_ids)
+
+    def _remove(self, paper_id):
+        location = self._locations.pop(paper_id, None)
+        if location is None:
+            return False
+        segment, docnum = location
+        if segment is None:
+            self._buf_deleted.add(docnum)
+            doc_len = self._buf_len[docnum]
+        else:
+            segment.deleted[docnum] = True
+            doc_len = int(segment.doc_len[docnum])
+        self._live_docs -= 1
+        self._total_len -= doc_len
+        return True
+
+    def update_paper(self, paper_id, fields):
+        """
+        更新论文的部分字段：不涉及索引字段时检索结果不变，只更新保存的原文；
+        涉及索引字段时与保存的原文合并后重新索引
+
+        Args:
+            paper_id: 论文ID
+            fields: 更新的字段
+
+        Raises:
+            ValueError: 涉及索引字段，但无法读取原文合并且fields中缺少部分索引字段
+        """
+        paper_id = str(paper_id)
+        with self._lock:
+            paper = self.get_paper(paper_id)
+            if not any(field in fields for field in INDEXED_FIELDS):
+                if paper is not None:
+                    paper.update(fields)
+                    self.add_papers([paper])
+                return
+            if paper is None:
+                missing = [field for field in INDEXED_FIELDS if field not in fields]
+                if missing:
+                    raise ValueError(f"论文 {paper_id} 没有保存原文，更新索引字段时需提供完整的 {', '.join(missing)}")
+                paper = {'id': paper_id}
+            paper.update(fields)
+            self.add_papers([paper])
+
+    def get_paper(self, paper_id):
+        """按ID读取保存的论文原文，不存在或未保存原文时返回None"""
+        with self._lock:
+            location = self._locations.get(str(paper_id))
+            if location is None:
+                return None
+            segment, docnum = location
+            if segment is None:
+                return json.loads(self._buf_docs[docnum]) if self.store_docs else None
+            return segment.get_doc(docnum)
+
+    def refresh(self):
+        """将缓冲区中的论文生成新的索引段，使其可被检索；段数过多时合并"""
+        with self._lock:
+            if not self._buf_ids:
+                return
+            segment = Segment.build(
+                sorted(self._buf_vocab, key=self._buf_vocab.get),
+                self._buf_term, self._buf_doc, self._buf_tf, self._buf_len, self._buf_ids,
+                self._buf_docs if self.store_docs else None,
+            )
+            for docnum in self._buf_deleted:
+                segment.deleted[docnum] = True
+            for docnum, paper_id in enumerate(segment.ids):
+                if docnum not in self._buf_deleted:
+                    self._locations[paper_id] = (segment, docnum)
+            self.segments.append(segment)
+            self._reset_buffer()
+            if len(self.segments) > self.max_segments:
+                self.merge()
+
+    def merge(self):
+        """将所有段合并为一个段，并真正移除已删除的论文"""
+        with self._lock:
+            if len(self.segments) < 2 and not any(seg.deleted.any() for seg in self.segments):
+                return
+            vocab = sorted(set().union(*(seg.terms for seg in self.segments)))
+            vocab_index = {term: i for i, term in enumerate(vocab)}
+            post_term, post_doc, post_tf, doc_len, ids, docs_json = [], [], [], [], [], []
+            base = 0
+            for seg in self.segments:
+                live = ~seg.deleted
+                remap = np.cumsum(live, dtype=np.int64) - 1 + base
+                term_ids = np.array([vocab_index[term] for term in seg.terms], dtype=np.uint32)
+                seg_term = np.repeat(term_ids, np.diff(seg.offsets))
+                docs = np.asarray(seg.docs)
+                keep = live[docs]
+                post_term.append(seg_term[keep])
+                post_doc.append(remap[docs[keep]])
+                post_tf.append(np.asarray(seg.tfs)[keep])
+                doc_len.append(seg.doc_len[live])
+                live_docnums = np.flatnonzero(live)
+                ids.extend(seg.ids[i] for i in live_docnums)
+                if self.store_docs:
+                    docs_json.extend(bytes(seg.doc_data[seg.doc_offsets[i]:seg.doc_offsets[i + 1]])
+                                     for i in live_docnums)
+                base += len(live_docnums)
+
+            post_term = np.concatenate(post_term)
+            post_doc = np.concatenate(post_doc)
+            post_tf = np.concatenate(post_tf)
+            # Segment.build要求三元组按文档号递增
+            order = np.argsort(post_doc, kind='stable')
+            merged = Segment.build(
+                vocab, post_term[order], post_doc[order], post_tf[order],
+                np.concatenate(doc_len), ids, docs_json if self.store_docs else None,
+            )
+            for seg in self.segments:
+                seg.close()
+            self.segments = [merged]
+            for docnum, paper_id in enumerate(merged.ids):
+                self._locations[paper_id] = (merged, docnum)
+
+    def search(self, query, limit=20, offset=0):
+        """
+        BM25检索
+
+        Args:
+            query (str): 检索词
+            limit (int): 返回数量
+            offset (int): 跳过的数量
+
+        Returns:
+            list: [(论文ID, 得分)]，按得分降序
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        k = offset + limit
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            self.refresh()
+            if not self._live_docs:
+                return []
+            n_docs = self._live_docs
+            # 文档长度全为0时avgdl为0，此时长度归一化不起作用
+            avgdl = self._total_len / n_docs or 1.0
+            # 文档频率只统计未删除的文档，与n_docs一致，否则删除后df可能大于N使IDF为负
+            matched = []
+            df = Counter()
+            for seg in self.segments:
+                live = ~seg.deleted
+                if not live.any():
+                    continue
+                has_deleted = not live.all()
+                for term in terms:
+                    postings = seg.postings(term)
+                    if postings is None:
+                        continue
+                    docs, tfs = postings
+                    if has_deleted:
+                        keep = live[docs]
+                        docs, tfs = docs[keep], tfs[keep]
+                    if len(docs):
+                        matched.append((seg, term, docs, tfs))
+                        df[term] += len(docs)
+            idf = {term: math.log(1 + (n_docs - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+            hits = []
+            for seg, group in itertools.groupby(matched, key=lambda item: item[0]):
+                scores = np.zeros(seg.n_docs, dtype=np.float32)
+                norm = self.k1 * (1 - self.b + self.b * seg.doc_len / avgdl)
+                for _, term, docs, tfs in group:
+                    tfs = tfs.astype(np.float32)
+                    # 同一个词的文档号互不相同，可以直接累加
+                    scores[docs] += idf[term] * tfs * (self.k1 + 1) / (tfs + norm[docs])
+                candidates = np.flatnonzero(scores)
+                if len(candidates) > k:
+                    candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+                hits.extend((float(scores[i]), seg.ids[i]) for i in candidates)
+
+        hits.sort(key=lambda hit: -hit[0])
+        return [(paper_id, score) for score, paper_id in hits[offset:k]]
+
+    def search_papers(self, query, limit=20, offset=0):
+        """
+        检索并返回论文原文，按相关度排序；无检索词时按添加顺序返回最新的论文
+
+        Returns:
+            List[Dict]: 论文列表
+        """
+        if not self.store_docs:
+            raise ValueError("索引未保存论文原文，请使用search()获取论文ID")
+        if query and query.strip():
+            paper_ids = [paper_id for paper_id, _ in self.search(query, limit, offset)]
+        else:
+            with self._lock:
+                self.refresh()
+                latest = (seg.ids[docnum] for seg in reversed(self.segments)
+                          for docnum in np.flatnonzero(~seg.deleted)[::-1])
+                paper_ids = list(itertools.islice(latest, offset, offset + limit))
+        return [paper for paper in (self.get_paper(paper_id) for paper_id in paper_ids) if paper]
+
+    def save(self, path=None):
+        """
+        保存索引：新生成的段写入各自的目录，已保存的段只更新删除标记，最后更新清单文件
+
+        Args:
+            path: 索引目录，默认使用初始化时的path
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("未指定索引目录")
+        with self._lock:
+            self.refresh()
+            os.makedirs(path, exist_ok=True)
+            saved_here = self.path == path
+            for i, seg in enumerate(self.segments):
+                if seg.name is not None and saved_here:
+                    seg.save_deleted(os.path.join(path, seg.name))
+                    continue
+                name = f'seg_{time.time_ns():x}_{i}'
+                seg.save(os.path.join(path, name))
+                seg.name = name
+            manifest = {
+                'segments': [seg.name for seg in self.segments],
+                'store_docs': self.store_docs,
+                'k1': self.k1,
+                'b': self.b,
+            }
+            tmp_path = os.path.join(path, 'index.json.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, os.path.join(path, 'index.json'))
+            # 清理合并后不再使用的段
+            for name in os.listdir(path):
+                if name.startswith('seg_') and name not in manifest['segments']:
+                    shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+            self.path = path
+
+    @classmethod
+    def load(cls, path, use_mmap=True, max_segments=MAX_SEGMENTS):
+        """
+        从目录加载索引
+
+        Args:
+            path: 索引目录
+            use_mmap: 倒排表和原文是否以mmap方式按需读取
+
+        Returns:
+            BM25Index: 索引
+        """
+        with open(os.path.join(path, 'index.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        index = cls(path, store_docs=manifest['store_docs'], k1=manifest['k1'], b=manifest['b'],
+                    max_segments=max_segments)
+        for name in manifest['segments']:
+            seg = Segment.load(os.path.join(path, name), use_mmap=use_mmap)
+            index.segments.append(seg)
+            live = ~seg.deleted
+            index._live_docs += int(live.sum())
+            index._total_len += int(seg.doc_len[live].sum())
+            for docnum in np.flatnonzero(live):
+                index._locations[seg.ids[docnum]] = (seg, int(docnum))
+        return index
+
+    def close(self):
+        with self._lock:
+            for seg in self.segments:
+                seg.close()
+
+
+def _synthetic_corpus(num_docs, vocab_size=50000, seed=0, chunk=10000):
+    """生成合成论文：词频服从Zipf分布，标题10词、关键词3词、摘要40词"""
+    rng = np.random.default_rng(seed)
+    words = np.array([f'w{i:x}' for i in range(vocab_size)])
+    probs = 1.0 / np.arange(1, vocab_size + 1) ** 1.05
+    probs /= probs.sum()
+    for start in range(0, num_docs, chunk):
+        n = min(chunk, num_docs - start)
+        tokens = words[rng.choice(vocab_size, size=(n, 53), p=probs)]
+        for i in range(n):
+            row = tokens[i]
+            yield {
+                'id': str(start + i),
+                'title': ' '.join(row[:10]),
+                'keywords': ' '.join(row[10:13]),
+                'abstract': ' '.join(row[13:]),
+            }
+
+
+if __name__ == '__main__':
+    # 基准测试：python -m paper_utils.bm25_index [论文数量]，默认100万篇合成论文
+    # 对比对象为标题ilike '%关键词%'的顺序扫描（在进程内执行，不含网络开销，对ilike有利）
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    index = BM25Index(store_docs=False)
+    titles = []
+    start = time.perf_counter()
+    batch = []
+    for paper in _synthetic_corpus(num_docs):
+        titles.append(paper['title'].lower())
+        batch.append(paper)
+        if len(batch) == 10000:
+            index.add_papers(batch)
+            batch = []
+    index.add_papers(batch)
+    index.refresh()
+    print(f"建立索引: {num_docs} 篇论文, {time.perf_counter() - start:.1f} 秒")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        index.save(tmp_dir)
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(tmp_dir) for name in names)
+        print(f"保存索引: {size / 2 ** 20:.1f} MB, {time.perf_counter() - start:.1f} 秒")
+        start = time.perf_counter()
+        index = BM25Index.load(tmp_dir)
+        print(f"mmap加载索引: {time.perf_counter() - start:.1f} 秒")
+
+        rng = np.random.default_rng(1)
+        queries = [f'w{i:x}' for i in rng.integers(100, 5000, size=10)] + \
+                  [f'w{i:x} w{j:x}' for i, j in rng.integers(100, 5000, size=(10, 2))]
+
+        def run(label, fn):
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                fn(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            print(f"{label}: 平均 {sum(latencies) / len(latencies):.1f} ms, "
+                  f"P95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms")
+
+        run("BM25 top20", lambda query: index.search(query, limit=20))
+        run("ilike顺序扫描", lambda query: [i for i, title in enumerate(titles) if query in title][:20])
+        index.close()
@@ -0,0 +1,352 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import threading
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from crawler.bib2text import normalize_title
+
+logger = logging.getLogger(__name__)
+
+# MinHash签名长度，分为BANDS段做LSH，每段ROWS个值；候选阈值约为(1/BANDS)^(1/ROWS)≈0.5
+NUM_PERM = 64
+BANDS = 16
+# 标题按字符SHINGLE_SIZE-gram切分，对大小写、标点和个别词的增删不敏感
+SHINGLE_SIZE = 3
+# 标题相似度达到该值即视为重复（作者明显不同时除外）
+TITLE_THRESHOLD = 0.9
+# 标题相似度达到该值且作者重合时视为重复，如预印本与正式发表版本标题略有不同
+TITLE_AUTHOR_THRESHOLD = 0.6
+AUTHOR_THRESHOLD = 0.5
+# 预印本通常比正式发表早一年左右
+MAX_YEAR_GAP = 1
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def title_shingles(title):
+    """规范化标题的字符n-gram集合，规范化方式与papers表的title_norm列一致"""
+    norm = normalize_title(title)
+    if len(norm) <= SHINGLE_SIZE:
+        return {norm} if norm else set()
+    return {norm[i:i + SHINGLE_SIZE] for i in range(len(norm) - SHINGLE_SIZE + 1)}
+
+
+def author_keys(authors):
+    """
+    作者姓名中长度不小于3的词，用于比较两篇论文的作者是否重合；
+    兼容谷歌学术的列表/缩写格式（J Devlin, MW Chang）和BibTeX格式（Devlin, Jacob and Chang, Ming-Wei）
+
+    Returns:
+        frozenset: 小写的姓名词
+    """
+    if not authors:
+        return frozenset()
+    if not isinstance(authors, str):
+        authors = ' '.join(authors)
+    return frozenset(word for word in re.findall(r'\w+', authors.lower()) if len(word) >= 3 and not word.isdigit())
+
+
+def _to_dict(paper):
+    return paper if isinstance(paper, dict) else paper.__dict__
+
+
+def _year(value):
+    """发表年份转为整数，缺失或无法解析时为0"""
+    value = str(value or '').strip()
+    return int(value) if value.isdigit() else 0
+
+
+class MinHasher:
+    """MinHash签名：shingle先做crc32，再用NUM_PERM个multiply-shift哈希函数取最小值，跨进程结果稳定"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # multiply-shift哈希要求乘数为奇数
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def signature(self, shingles):
+        """
+        计算shingle集合的签名
+
+        Returns:
+            np.ndarray: (num_perm,)的uint32数组，空集合时全为最大值
+        """
+        if not shingles:
+            return np.full(self.num_perm, 0xFFFFFFFF, dtype=np.uint32)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # uint64乘法按2^64取模，取高32位作为哈希值
+        values = (hashes[:, None] * self.a + self.b) >> np.uint64(32)
+        return (values & _MASK32).min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    论文近似重复检测：标题shingle的MinHash签名按段分桶（LSH），只与同桶的论文比较，
+    再结合年份和作者判断是否为同一篇论文（如预印本与正式发表版本）。线程安全，支持增量添加和删除
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        """
+        Args:
+            num_perm: MinHash签名长度
+            bands: LSH分段数，需整除num_perm；段数越多召回越高、候选越多
+            seed: 哈希函数的随机种子，保存后加载时沿用
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm必须是bands的整数倍")
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.seed = seed
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self.ids = []
+        self.years = []
+        self.authors = []
+        self.valid = []
+        self._rows = {}
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, paper_id):
+        return str(paper_id) in self._rows
+
+    def _band_keys(self, signature):
+        return [hash(signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+    def _reserve(self, n):
+        capacity = len(self.signatures)
+        if n <= capacity:
+            return
+        signatures = np.zeros((max(n, capacity * 2, 1024), self.hasher.num_perm), dtype=np.uint32)
+        signatures[:self._size] = self.signatures[:self._size]
+        self.signatures = signatures
+
+    def add_papers(self, papers):
+        """
+        添加或更新论文，需包含id和title，authors、pub_year可选；没有标题的论文被忽略
+
+        Args:
+            papers: 论文字典或Paper对象的列表
+        """
+        papers = [_to_dict(paper) for paper in papers]
+        entries = [(paper, self.hasher.signature(title_shingles(paper.get('title')))) for paper in papers
+                   if paper.get('id') and normalize_title(paper.get('title'))]
+        with self._lock:
+            self.remove_papers([paper['id'] for paper, _ in entries])
+            self._reserve(self._size + len(entries))
+            for paper, signature in entries:
+                row = self._size
+                self.signatures[row] = signature
+                self.ids.append(str(paper['id']))
+                self.years.append(_year(paper.get('pub_year')))
+                self.authors.append(author_keys(paper.get('authors')))
+                self.valid.append(True)
+                self._rows[str(paper['id'])] = row
+                for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                    bucket[key].append(row)
+                self._size += 1
+
+    def remove_papers(self, paper_ids):
+        """删除论文，其所在的桶在下次查询时跳过"""
+        with self._lock:
+            for paper_id in paper_ids:
+                row = self._rows.pop(str(paper_id), None)
+                if row is not None:
+                    self.valid[row] = False
+
+    def _candidates(self, signature):
+        rows = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            rows.update(bucket.get(key, ()))
+        return [row for row in rows if self.valid[row]]
+
+    def _match(self, row, signature, year, authors):
+        """
+        判断已有论文row与给定论文是否重复
+
+        Returns:
+            float: 标题相似度（估计的Jaccard系数），不重复时为None
+        """
+        other_year = self.years[row]
+        if year and other_year and abs(year - other_year) > MAX_YEAR_GAP:
+            return None
+        similarity = float(np.mean(self.signatures[row] == signature))
+        other_authors = self.authors[row]
+        if authors and other_authors:
+            overlap = len(authors & other_authors) / min(len(authors), len(other_authors))
+        else:
+            overlap = None
+        if similarity >= TITLE_THRESHOLD and overlap != 0:
+            return similarity
+        if similarity >= TITLE_AUTHOR_THRESHOLD and overlap is not None and overlap >= AUTHOR_THRESHOLD:
+            return similarity
+        return None
+
+    def find_duplicates(self, paper, limit=5):
+        """
+        查找与给定论文重复的已有论文
+
+        Args:
+            paper: 论文字典或Paper对象，需包含title
+            limit: 最多返回的数量
+
+        Returns:
+            List[Tuple[str, float]]: (论文ID, 标题相似度)，按相似度降序，不包含论文自身
+        """
+        paper = _to_dict(paper)
+        if not normalize_title(paper.get('title')):
+            return []
+        signature = self.hasher.signature(title_shingles(paper.get('title')))
+        year = _year(paper.get('pub_year'))
+        authors = author_keys(paper.get('authors'))
+        paper_id = str(paper['id']) if paper.get('id') else None
+        matches = []
+        with self._lock:
+            for row in self._candidates(signature):
+                if self.ids[row] == paper_id:
+                    continue
+                similarity = self._match(row, signature, year, authors)
+                if similarity is not None:
+                    matches.append((self.ids[row], similarity))
+        matches.sort(key=lambda item: -item[1])
+        return matches[:limit]
+
+    def find_duplicate(self, paper):
+        """
+        Returns:
+            Tuple[str, float]: 最相似的重复论文(ID, 标题相似度)，没有重复时返回None
+        """
+        matches = self.find_duplicates(paper, limit=1)
+        return matches[0] if matches else None
+
+    def duplicate_groups(self):
+        """
+        找出索引中所有的重复论文组，用于清理已入库的重复数据；组内按入库顺序排列，
+        第一篇通常作为保留的论文
+
+        Returns:
+            List[List[str]]: 每组至少两篇论文的ID
+        """
+        with self._lock:
+            parent = list(range(self._size))
+
+            def find(row):
+                while parent[row] != row:
+                    parent[row] = parent[parent[row]]
+                    row = parent[row]
+                return row
+
+            for row in range(self._size):
+                if not self.valid[row]:
+                    continue
+                signature = self.signatures[row]
+                for other in self._candidates(signature):
+                    if other < row and find(other) != find(row) and \
+                            self._match(other, signature, self.years[row], self.authors[row]) is not None:
+                        parent[find(row)] = find(other)
+            groups = defaultdict(list)
+            for row in range(self._size):
+                if self.valid[row]:
+                    groups[find(row)].append(self.ids[row])
+            return [group for group in groups.values() if len(group) > 1]
+
+    def save(self, path):
+        """保存到目录，已删除的论文不写入"""
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            live = [row for row in range(self._size) if self.valid[row]]
+            np.save(os.path.join(path, 'signatures.npy'), self.signatures[live])
+            with open(os.path.join(path, 'papers.jsonl'), 'w', encoding='utf-8') as f:
+                for row in live:
+                    f.write(json.dumps({'id': self.ids[row], 'pub_year': self.years[row],
+                                        'authors': sorted(self.authors[row])}, ensure_ascii=False) + '\n')
+            with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'num_perm': self.hasher.num_perm, 'bands': self.bands, 'seed': self.seed}, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        从目录加载，桶在加载时重建
+
+        Returns:
+            NearDuplicateIndex: 索引
+        """
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(meta['num_perm'], meta['bands'], meta['seed'])
+        signatures = np.load(os.path.join(path, 'signatures.npy'))
+        with open(os.path.join(path, 'papers.jsonl'), encoding='utf-8') as f:
+            papers = [json.loads(line) for line in f if line.strip()]
+        index.signatures = signatures
+        for row, (paper, signature) in enumerate(zip(papers, signatures)):
+            index.ids.append(paper['id'])
+            index.years.append(paper['pub_year'])
+            index.authors.append(frozenset(paper['authors']))
+            index.valid.append(True)
+            index._rows[paper['id']] = row
+            for bucket, key in zip(index._buckets, index._band_keys(signature)):
+                bucket[key].append(row)
+        index._size = len(papers)
+        return index
+
+
+if __name__ == '__main__':
+    # 基准测试：python -m paper_utils.dedup_index [论文数量]，对比LSH查重与逐一比较所有标题
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+    vocab = [''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz'), rng.integers(3, 10))) for _ in range(20000)]
+    surnames = [w.capitalize() for w in vocab[:5000]]
+    papers = [{
+        'id': str(i),
+        'title': ' '.join(rng.choice(vocab, rng.integers(5, 12))),
+        'authors': ', '.join(rng.choice(surnames, 3)),
+        'pub_year': int(rng.integers(2000, 2025)),
+    } for i in range(num_docs)]
+
+    index = NearDuplicateIndex()
+    start = time.perf_counter()
+    index.add_papers(papers)
+    print(f"建立索引: {num_docs} 篇论文, {time.perf_counter() - start:.1f} 秒")
+
+    # 模拟预印本/正式版本：改大小写和标点、增删一个词、年份相差一年，作者顺序不同
+    variants = []
+    for paper in papers[:1000]:
+        words = paper['title'].split()
+        if rng.random() < 0.5:
+            words = words + [vocab[int(rng.integers(len(vocab)))]]
+        else:
+            words = words[:-1]
+        variants.append({
+            'title': ' '.join(words).title() + '.',
+            'authors': ' and '.join(reversed(paper['authors'].split(', '))),
+            'pub_year': paper['pub_year'] + 1,
+        })
+    unrelated = [{'title': ' '.join(rng.choice(vocab, 8)), 'authors': 'Someone Else', 'pub_year': 2020}
+                 for _ in range(1000)]
+
+    start = time.perf_counter()
+    found = sum((index.find_duplicate(v) or ('',))[0] == papers[i]['id'] for i, v in enumerate(variants))
+    false_positive = sum(index.find_duplicate(p) is not None for p in unrelated)
+    elapsed = (time.perf_counter() - start) * 1000 / (len(variants) + len(unrelated))
+    print(f"LSH查重: 召回 {found / len(variants):.3f}, 误报 {false_positive / len(unrelated):.3f}, 平均 {elapsed:.3f} ms/篇")
+
+    all_shingles = [title_shingles(p['title']) for p in papers]
+    start = time.perf_counter()
+    for v in variants[:20]:
+        shingles = title_shingles(v['title'])
+        max(len(shingles & other) / len(shingles | other) for other in all_shingles)
+    elapsed = (time.perf_counter() - start) * 1000 / 20
+    print(f"逐一比较: 平均 {elapsed:.1f} ms/篇")
@@ -0,0 +1,317 @@
+import os
+import sys
+import time
+import zlib
+import threading
+import logging
+
+import numpy as np
+
+import config
+from paper_utils.bm25_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 向量检索配置，旧的config.py中没有该项时不启用
+EMBEDDING_CONFIG = getattr(config, 'EMBEDDING_CONFIG', {})
+DEFAULT_EMBEDDING_MODEL = 'paraphrase-multilingual-MiniLM-L12-v2'
+# 与papers.embedding列的维度一致
+DEFAULT_EMBEDDING_DIM = 384
+# 相似度矩阵按该行数分块计算，限制内存占用
+SEARCH_CHUNK_ROWS = 65536
+
+
+def paper_text(paper):
+    """用于计算向量的论文文本：标题+摘要"""
+    return f"{paper.get('title') or ''}. {paper.get('abstract') or ''}".strip()
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """本地sentence-transformers模型，默认使用支持中英文的多语言模型"""
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, device=None, batch_size=64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("使用本地向量模型需要安装sentence-transformers") from e
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+
+    def encode(self, texts):
+        """
+        计算文本向量
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dim)的float32矩阵，已归一化
+        """
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return vectors.astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """不依赖模型的哈希向量：检索词按哈希映射到固定维度，适合离线环境和测试，只能匹配字面相同的词"""
+
+    def __init__(self, dim=DEFAULT_EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in tokenize(text):
+                h = zlib.crc32(token.encode('utf-8'))
+                vectors[i, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+EMBEDDERS = {
+    'sentence_transformers': lambda cfg: SentenceTransformerEmbedder(cfg.get('model', DEFAULT_EMBEDDING_MODEL)),
+    'hashing': lambda cfg: HashingEmbedder(cfg.get('dim', DEFAULT_EMBEDDING_DIM)),
+}
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """
+    按EMBEDDING_CONFIG创建共享的向量模型（只加载一次），未配置backend时返回None
+
+    Returns:
+        向量模型，需提供dim属性和encode(texts)方法
+    """
+    global _embedder
+    backend = EMBEDDING_CONFIG.get('backend')
+    if not backend:
+        return None
+    with _embedder_lock:
+        if _embedder is None:
+            if backend not in EMBEDDERS:
+                raise ValueError(f"不支持的向量模型: {backend}，支持: {', '.join(EMBEDDERS)}")
+            _embedder = EMBEDDERS[backend](EMBEDDING_CONFIG)
+        return _embedder
+
+
+def save_array(path, array):
+    """先写临时文件再替换，避免覆盖正以mmap方式读取的同名文件"""
+    tmp_path = path[:-len('.npy')] + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingIndex:
+    """
+    论文向量的内存索引：归一化后的float32矩阵，分块矩阵乘法做批量top-k余弦检索，
+    支持按年份和论文ID集合（如知识库中的论文）过滤
+    """
+    # 按行存储的数组及其填充值，扩容时一起增长
+    ROW_ARRAYS = (('vectors', 0), ('years', 0), ('valid', False))
+
+    def __init__(self, embedder, dim=None):
+        """
+        Args:
+            embedder: 向量模型，需提供encode(texts)方法
+            dim: 向量维度，默认取embedder.dim
+        """
+        self.embedder = embedder
+        self.dim = dim or embedder.dim
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.years = np.zeros(0, dtype=np.int32)
+        self.valid = np.zeros(0, dtype=bool)
+        self.ids = []
+        self._rows = {}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, paper_id):
+        return paper_id in self._rows
+
+    def _reserve(self, n):
+        """扩容到至少能容纳n行，容量按倍数增长"""
+        capacity = len(self.vectors)
+        if n <= capacity:
+            return
+        capacity = max(n, capacity * 2, 1024)
+        for name, fill in self.ROW_ARRAYS:
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add_papers(self, papers, batch_size=256):
+        """
+        添加或更新论文向量；论文中已有embedding时直接使用，否则按批计算
+
+        Args:
+            papers: 论文字典或Paper对象的列表，需包含id
+            batch_size: 每批计算向量的论文数量
+        """
+        papers = [paper if isinstance(paper, dict) else paper.__dict__ for paper in papers]
+        for start in range(0, len(papers), batch_size):
+            batch = papers[start:start + batch_size]
+            missing = [i for i, paper in enumerate(batch) if paper.get('embedding') is None]
+            vectors = np.zeros((len(batch), self.dim), dtype=np.float32)
+            if missing:
+                vectors[missing] = self.embedder.encode([paper_text(batch[i]) for i in missing])
+            for i, paper in enumerate(batch):
+                if i not in missing:
+                    vectors[i] = parse_vector(paper['embedding'])
+            self._append(batch, _normalize(vectors))
+
+    def _append(self, papers, vectors):
+        with self._lock:
+            self.remove_papers([paper['id'] for paper in papers])
+            start = self._size
+            self._reserve(start + len(papers))
+            self.vectors[start:start + len(papers)] = vectors
+            self.years[start:start + len(papers)] = [int(paper.get('pub_year') or 0) for paper in papers]
+            self.valid[start:start + len(papers)] = True
+            for i, paper in enumerate(papers):
+                paper_id = str(paper['id'])
+                self.ids.append(paper_id)
+                self._rows[paper_id] = start + i
+            self._size += len(papers)
+
+    def remove_papers(self, paper_ids):
+        """删除论文向量（只做标记），返回实际删除的数量"""
+        removed = 0
+        with self._lock:
+            for paper_id in paper_ids:
+                row = self._rows.pop(str(paper_id), None)
+                if row is not None:
+                    self.valid[row] = False
+                    removed += 1
+        return removed
+
+    def search(self, queries, k=20, year_low=None, year_high=None, paper_ids=None):
+        """
+        批量top-k余弦检索
+
+        Args:
+            queries: 查询文本或文本列表（如用户粘贴的段落）
+            k: 每个查询返回的数量
+            year_low, year_high: 发表年份范围，年份未知的论文在设置范围时被排除
+            paper_ids: 只在这些论文中检索，如某个知识库中的论文
+
+        Returns:
+            list: 每个查询一个[(论文ID, 相似度)]列表，按相似度降序；传入单个文本时只返回一个列表
+        """
+        single = isinstance(queries, str)
+        texts = [queries] if single else list(queries)
+        results = self.search_vectors(self.embedder.encode(texts), k, year_low, year_high, paper_ids)
+        return results[0] if single else results
+
+    def search_vectors(self, query_vectors, k=20, year_low=None, year_high=None, paper_ids=None):
+        """
+        与search相同，但直接传入查询向量
+
+        Args:
+            query_vectors: (查询数, dim)的矩阵
+
+        Returns:
+            list: 每个查询一个[(论文ID, 相似度)]列表，按相似度降序
+        """
+        query_vectors = _normalize(query_vectors)
+        with self._lock:
+            mask = self.valid[:self._size].copy()
+            if year_low is not None:
+                mask &= self.years[:self._size] >= year_low
+            if year_high is not None:
+                mask &= (self.years[:self._size] <= year_high) & (self.years[:self._size] > 0)
+            if paper_ids is not None:
+                allowed = np.zeros(self._size, dtype=bool)
+                allowed[[self._rows[pid] for pid in map(str, paper_ids) if pid in self._rows]] = True
+                mask &= allowed
+            return self._top_k(query_vectors, mask, k)
+
+    def _top_k(self, query_vectors, mask, k):
+        best_scores = np.full((len(query_vectors), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(query_vectors), 0), dtype=np.int64)
+        for start in range(0, self._size, SEARCH_CHUNK_ROWS):
+            end = min(start + SEARCH_CHUNK_ROWS, self._size)
+            rows = np.flatnonzero(mask[start:end]) + start
+            if not len(rows):
+                continue
+            scores = query_vectors @ self.vectors[rows].T
+            # 与之前分块的结果合并后保留前k个
+            scores = np.concatenate([best_scores, scores], axis=1)
+            candidates = np.concatenate([best_rows, np.broadcast_to(rows, (len(query_vectors), len(rows)))], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                candidates = np.take_along_axis(candidates, top, axis=1)
+            best_scores, best_rows = scores, candidates
+        order = np.argsort(-best_scores, axis=1)
+        return [[(self.ids[best_rows[q, i]], float(best_scores[q, i])) for i in order[q]]
+                for q in range(len(query_vectors))]
+
+    def save(self, path):
+        """保存向量矩阵和论文ID，向量矩阵可用mmap方式加载"""
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            save_array(os.path.join(path, 'vectors.npy'), self.vectors[:self._size])
+            save_array(os.path.join(path, 'years.npy'), self.years[:self._size])
+            save_array(os.path.join(path, 'valid.npy'), self.valid[:self._size])
+            with open(os.path.join(path, 'ids.txt'), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(self.ids))
+
+    @classmethod
+    def load(cls, path, embedder, use_mmap=True):
+        """
+        加载索引，use_mmap时向量矩阵以只读mmap方式按需读取，之后新增论文时再复制到内存
+
+        Returns:
+            EmbeddingIndex: 索引
+        """
+        vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r' if use_mmap else None)
+        index = cls(embedder, dim=vectors.shape[1])
+        index.vectors = vectors
+        index.years = np.load(os.path.join(path, 'years.npy'))
+        index.valid = np.load(os.path.join(path, 'valid.npy'))
+        with open(os.path.join(path, 'ids.txt'), encoding='utf-8') as f:
+            content = f.read()
+        index.ids = content.split('\n') if content else []
+        index._size = len(index.ids)
+        index._rows = {paper_id: row for row, paper_id in enumerate(index.ids) if index.valid[row]}
+        return index
+
+
+def parse_vector(value):
+    """解析向量：pgvector通过接口返回的是'[0.1,0.2,...]'形式的字符串"""
+    if isinstance(value, str):
+        return np.array(value.strip('[]').split(','), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+if __name__ == '__main__':
+    # 基准测试：python -m paper_utils.embedding_index [论文数量]，随机向量，批量查询
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = np.random.default_rng(0)
+    index = EmbeddingIndex(HashingEmbedder())
+    vectors = _normalize(rng.standard_normal((num_docs, DEFAULT_EMBEDDING_DIM), dtype=np.float32))
+    start = time.perf_counter()
+    for i in range(0, num_docs, 50000):
+        n = min(50000, num_docs - i)
+        index._append([{'id': str(i + j), 'pub_year': 2000 + (i + j) % 25} for j in range(n)], vectors[i:i + n])
+    print(f"添加 {num_docs} 个向量: {time.perf_counter() - start:.1f} 秒")
+
+    queries = ['large language model summarization'] * 32
+    start = time.perf_counter()
+    index.search(queries, k=20)
+    print(f"32个查询批量top20: {(time.perf_counter() - start) * 1000:.1f} ms")
+    start = time.perf_counter()
+    index.search(queries[0], k=20, year_low=2020)
+    print(f"单个查询top20（按年份过滤）: {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -1,65 +1,373 @@
 import pandas as pd
+import numpy as np
 import os
+import re
 
+# 每次读取的行数，内存占用与该值成正比
+DEFAULT_CHUNK_SIZE = 100_000
+# 默认在标题和摘要中匹配
+DEFAULT_COLUMNS = ('title', 'abstract')
+# 字面关键词达到该数量且安装了pyahocorasick时，用Aho-Corasick自动机一次扫描匹配所有关键词
+AHO_CORASICK_MIN_TERMS = 8
+# 与paper_export一致：这些扩展名按Arrow IPC文件读写
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+# 读取CSV时按整数处理的列（与paper_export导出的类型一致），其余列一律按字符串读取
+INTEGER_COLUMNS = ('pub_year', 'num_citations', 'file_size', 'result_index')
 
-def filter_papers_by_keyword(input_file, keyword, output_file=None):
+_TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|/((?:\\.|[^/\\])*)/|([^\s()"]+))')
+_OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+def parse_query(query):
     """
-    从CSV文件中过滤出标题包含特定关键词的记录
-    
+    解析布尔检索式，运算符需大写，相邻的词默认为AND，优先级NOT > AND > OR
+
+    例如: summar AND ("large language model" OR llm) NOT survey
+    双引号表示短语，/.../表示正则表达式，其余为关键词；匹配均不区分大小写
+
     参数:
-        input_file: 输入CSV文件路径
-        keyword: 需要包含的关键词，不区分大小写
-        output_file: 输出CSV文件路径，默认为None时自动生成
-    
+        query: 检索式字符串
+
+    返回:
+        (语法树, 检索词列表)，语法树节点为('term', 检索词序号)、('not', 节点)、
+        ('and', [节点...])、('or', [节点...])，检索词为('literal', 小写文本)或('regex', 表达式)
+    """
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = _TOKEN_PATTERN.match(query, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"无法解析检索式: {query[pos:]}")
+        pos = match.end()
+        lparen, rparen, phrase, regex, word = match.groups()
+        if lparen:
+            tokens.append(('(', None))
+        elif rparen:
+            tokens.append((')', None))
+        elif phrase is not None:
+            tokens.append(('literal', phrase.lower()))
+        elif regex is not None:
+            re.compile(regex)
+            tokens.append(('regex', regex))
+        elif word in _OPERATORS:
+            tokens.append((word, None))
+        elif word:
+            tokens.append(('literal', word.lower()))
+
+    terms = []
+    term_index = {}
+    pos = 0
+
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == 'OR':
+            take()
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and():
+        nodes = [parse_not()]
+        while peek() not in (None, ')', 'OR'):
+            if peek() == 'AND':
+                take()
+            nodes.append(parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_not():
+        if peek() == 'NOT':
+            take()
+            return ('not', parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        kind = peek()
+        if kind == '(':
+            take()
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError("检索式括号不匹配")
+            take()
+            return node
+        if kind in ('literal', 'regex'):
+            term = take()
+            if not term[1]:
+                raise ValueError("检索词不能为空")
+            if term not in term_index:
+                term_index[term] = len(terms)
+                terms.append(term)
+            return ('term', term_index[term])
+        raise ValueError(f"检索式在第 {pos + 1} 个词处不完整")
+
+    if not tokens:
+        raise ValueError("检索式为空")
+    tree = parse_or()
+    if pos != len(tokens):
+        raise ValueError("检索式括号不匹配")
+    return tree, terms
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配器：对一批文本一次性计算每个检索词是否出现，再按布尔语法树向量化求值。
+    字面关键词较多时使用Aho-Corasick自动机（需安装pyahocorasick）一遍扫描匹配全部关键词，
+    否则每个关键词用pandas的向量化字符串匹配
+    """
+
+    def __init__(self, query):
+        """
+        参数:
+            query: 布尔检索式，或关键词列表（任意一个出现即匹配）
+        """
+        if isinstance(query, str):
+            self.tree, self.terms = parse_query(query)
+        else:
+            self.terms = list(dict.fromkeys(('literal', keyword.lower()) for keyword in query if keyword))
+            if not self.terms:
+                raise ValueError("关键词列表为空")
+            self.tree = ('or', [('term', i) for i in range(len(self.terms))])
+        self.literals = [i for i, (kind, _) in enumerate(self.terms) if kind == 'literal']
+        self.regexes = {i: re.compile(value, re.IGNORECASE) for i, (kind, value) in enumerate(self.terms)
+                        if kind == 'regex'}
+        self.automaton = None
+        if len(self.literals) >= AHO_CORASICK_MIN_TERMS:
+            try:
+                import ahocorasick
+            except ImportError:
+                ahocorasick = None
+            if ahocorasick is not None:
+                self.automaton = ahocorasick.Automaton()
+                for i in self.literals:
+                    self.automaton.add_word(self.terms[i][1], i)
+                self.automaton.make_automaton()
+
+    def term_hits(self, texts):
+        """
+        计算每条文本中各检索词是否出现
+
+        参数:
+            texts: 文本Series
+
+        返回:
+            (文本数, 检索词数)的布尔矩阵
+        """
+        texts = texts.fillna('').astype(str)
+        hits = np.zeros((len(texts), len(self.terms)), dtype=bool)
+        if self.literals:
+            lowered = texts.str.lower()
+            if self.automaton is not None:
+                for row, text in enumerate(lowered):
+                    for _, i in self.automaton.iter(text):
+                        hits[row, i] = True
+            else:
+                for i in self.literals:
+                    hits[:, i] = lowered.str.contains(self.terms[i][1], regex=False).to_numpy(dtype=bool)
+        for i, pattern in self.regexes.items():
+            hits[:, i] = texts.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+        return hits
+
+    def match(self, texts):
+        """
+        返回:
+            每条文本是否满足检索式的布尔数组
+        """
+        return self._evaluate(self.tree, self.term_hits(texts))
+
+    def _evaluate(self, node, hits):
+        kind, value = node
+        if kind == 'term':
+            return hits[:, value]
+        if kind == 'not':
+            return ~self._evaluate(value, hits)
+        results = [self._evaluate(child, hits) for child in value]
+        return np.logical_and.reduce(results) if kind == 'and' else np.logical_or.reduce(results)
+
+
+def _stable_dtypes(chunk):
+    """
+    统一每块的列类型，保证写入Parquet时每块的结构一致，且不会因为后面的块中出现非数字的值而中途出错：
+    CSV按字符串读取，已知的整数列转为可空整数，无法解析为整数的值记为空
+    """
+    for column in INTEGER_COLUMNS:
+        if column in chunk.columns:
+            values = pd.to_numeric(chunk[column], errors='coerce')
+            chunk[column] = values.where(values % 1 == 0).astype('Int64')
+    return chunk
+
+
+def iter_paper_chunks(input_file, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    分块读取论文数据，支持CSV、Parquet和Arrow
+
+    参数:
+        input_file: 输入文件路径，扩展名为.parquet/.arrow等时按paper_export导出的格式读取
+        chunksize: 每块的行数
+
+    返回:
+        DataFrame的迭代器
+    """
+    if input_file.endswith(('.parquet',) + ARROW_EXTENSIONS):
+        from paper_utils.paper_export import iter_record_batches
+        for batch in iter_record_batches(input_file, batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+    for chunk in pd.read_csv(input_file, chunksize=chunksize, dtype='string'):
+        yield _stable_dtypes(chunk)
+
+
+class ChunkWriter:
+    """按块追加写入CSV、Parquet或Arrow文件，扩展名为.arrow/.feather/.ipc时写Arrow，Parquet和Arrow需要安装pyarrow"""
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        if output_file.endswith(ARROW_EXTENSIONS):
+            self.format = 'arrow'
+        elif output_file.endswith('.parquet'):
+            self.format = 'parquet'
+        else:
+            self.format = 'csv'
+        self._writer = None
+        self._schema = None
+        self._started = False
+
+    def write(self, chunk):
+        if self.format == 'csv':
+            chunk.to_csv(self.output_file, mode='a' if self._started else 'w', header=not self._started, index=False)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.format == 'arrow':
+                    self._writer = pa.ipc.new_file(self.output_file, self._schema)
+                else:
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.output_file, self._schema)
+            self._writer.write_table(table)
+        self._started = True
+
+    def abort(self):
+        """出错时关闭并删除已写入的部分文件"""
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        if (self._started or self._writer is not None) and os.path.exists(self.output_file):
+            os.remove(self.output_file)
+        self._writer = None
+
+    def close(self, columns=None):
+        """关闭文件；没有写入任何数据时仍按columns输出只有表头的文件"""
+        if not self._started:
+            self.write(pd.DataFrame(columns=columns or []))
+        if self._writer is not None:
+            self._writer.close()
+
+
+def filter_papers(input_file, query, output_file=None, columns=DEFAULT_COLUMNS, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    分块流式过滤论文，内存占用只与chunksize有关，可处理数GB的导出文件
+
+    参数:
+        input_file: 输入文件路径（CSV、Parquet或Arrow）
+        query: 布尔检索式（见parse_query），或关键词列表（任意一个出现即保留）
+        output_file: 输出文件路径，扩展名为.parquet时输出Parquet，为.arrow/.feather/.ipc时输出Arrow，
+            默认为None时自动生成与输入文件格式相同的文件
+        columns: 参与匹配的列，默认标题和摘要，输入文件中不存在的列被忽略，但必须包含title
+        chunksize: 每块的行数
+
     返回:
         输出文件路径
     """
-    # 检查输入文件是否存在
     if not os.path.exists(input_file):
         print(f"错误：文件 {input_file} 不存在")
         return None
-    
-    # 读取CSV文件
     try:
-        data = pd.read_csv(input_file)
-    except Exception as e:
-        print(f"读取文件时出错: {e}")
+        matcher = KeywordMatcher(query)
+    except ValueError as e:
+        print(f"检索式错误: {e}")
         return None
-        
-    # 检查是否包含title列
-    if "title" not in data.columns:
-        print("错误：输入文件必须包含title列")
+
+    if output_file is None:
+        file_name, file_ext = os.path.splitext(input_file)
+        output_file = f"{file_name}_filtered{file_ext}"
+
+    writer = None
+    total = kept = 0
+    try:
+        for chunk in iter_paper_chunks(input_file, chunksize):
+            if writer is None:
+                # 检查是否包含title列
+                if "title" not in chunk.columns:
+                    print("错误：输入文件必须包含title列")
+                    return None
+                writer = ChunkWriter(output_file)
+                header = list(chunk.columns)
+            match_columns = [column for column in columns if column in chunk.columns]
+            texts = chunk[match_columns[0]].fillna('').astype(str)
+            for column in match_columns[1:]:
+                texts = texts + '\n' + chunk[column].fillna('').astype(str)
+            filtered = chunk[matcher.match(texts)]
+            total += len(chunk)
+            kept += len(filtered)
+            if len(filtered):
+                writer.write(filtered)
+    except Exception as e:
+        print(f"过滤文件时出错: {e}")
+        # 不保留只写了一部分的输出文件
+        if writer is not None:
+            writer.abort()
+            writer = None
         return None
-    
-    # 按标题关键词过滤
-    print(f"原始数据记录数: {len(data)}")
-    
-    # 将关键词转为小写进行不区分大小写的匹配
-    keyword_lower = keyword.lower()
-    
-    # 过滤掉不包含关键词的记录
-    filtered_data = data[data["title"].str.lower().str.contains(keyword_lower, na=False)]
-    
-    print(f"过滤后记录数: {len(filtered_data)}")
-    print(f"删除了 {len(data) - len(filtered_data)} 条不包含关键词 '{keyword}' 的记录")
-    
+    finally:
+        if writer is not None:
+            writer.close(header)
+
+    print(f"原始数据记录数: {total}")
+    print(f"过滤后记录数: {kept}")
+    print(f"过滤后的数据已保存到 {output_file}")
+    return output_file
+
+
+def filter_papers_by_keyword(input_file, keyword, output_file=None):
+    """
+    从CSV文件中过滤出标题包含特定关键词的记录
+
+    参数:
+        input_file: 输入CSV文件路径
+        keyword: 需要包含的关键词，不区分大小写
+        output_file: 输出CSV文件路径，默认为None时自动生成
+
+    返回:
+        输出文件路径
+    """
     # 如果没有指定输出文件，则生成默认输出文件名
     if output_file is None:
         file_name, file_ext = os.path.splitext(input_file)
         output_file = f"{file_name}_with_{keyword}{file_ext}"
-    
-    # 保存过滤后的数据
-    filtered_data.to_csv(output_file, index=False)
-    print(f"过滤后的数据已保存到 {output_file}")
-    
-    return output_file
+    return filter_papers(input_file, [keyword], output_file, columns=('title',))
 
 
 if __name__ == "__main__":
-    # 设置默认关键词
-    keyword = "summar"
-    
-    input_file = 'data/summarization_llm_new_20250512.csv'
-    # 执行过滤
-    result_file = filter_papers_by_keyword(input_file, keyword)
-    
\ No newline at end of file
+    import sys
+
+    # 用法: python -m paper_utils.filter_papers 输入文件 检索式 [输出文件]
+    # 例如: python -m paper_utils.filter_papers papers.csv 'summar AND (llm OR "language model") NOT survey' out.parquet
+    if len(sys.argv) >= 3:
+        filter_papers(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    else:
+        # 设置默认关键词
+        keyword = "summar"
+
+        input_file = 'data/summarization_llm_new_20250512.csv'
+        # 执行过滤
+        result_file = filter_papers_by_keyword(input_file, keyword)
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 大模型回复缓存配置，旧的config.py中没有该项或path为空时不启用
+LLM_CACHE_CONFIG = getattr(config, 'LLM_CACHE_CONFIG', {})
+# 默认缓存有效期（秒）
+DEFAULT_TTL = 30 * 24 * 3600
+
+
+def cache_key(model, messages, **params):
+    """
+    请求内容的SHA256：模型、全部消息（含系统提示词和少样本示例）和其他影响回复的参数，
+    字段顺序不影响结果
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    payload = json.dumps({'model': model, 'messages': messages, 'params': params},
+                         ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    以请求内容哈希为键的大模型回复缓存，保存在本地SQLite中，多个进程可共享同一文件；
+    只缓存成功的回复，超过有效期的记录视为不存在
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        """
+        Args:
+            path: SQLite文件路径
+            ttl: 有效期（秒），为None时永不过期
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL模式下读写互不阻塞，适合多个分类脚本同时使用
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, model, messages, **params):
+        """
+        Returns:
+            str: 缓存的回复，不存在或已过期时返回None
+        """
+        key = cache_key(model, messages, **params)
+        with self._lock:
+            row = self._conn.execute('SELECT response, created_at FROM llm_responses WHERE key = ?',
+                                     (key,)).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, model, messages, response, **params):
+        """保存回复，相同请求的旧记录被覆盖"""
+        if response is None:
+            return
+        key = cache_key(model, messages, **params)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO llm_responses (key, model, response, created_at) '
+                               'VALUES (?, ?, ?, ?)', (key, model, response, time.time()))
+            self._conn.commit()
+
+    def purge(self):
+        """
+        删除过期的记录
+
+        Returns:
+            int: 删除的记录数
+        """
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM llm_responses WHERE created_at < ?',
+                                        (time.time() - self.ttl,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM llm_responses').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """
+    按LLM_CACHE_CONFIG创建进程内共享的缓存，未配置path时返回None
+
+    Returns:
+        LLMCache: 缓存
+    """
+    global _cache
+    path = LLM_CACHE_CONFIG.get('path')
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(path, LLM_CACHE_CONFIG.get('ttl', DEFAULT_TTL))
+            removed = _cache.purge()
+            if removed:
+                logger.info(f"清理过期的大模型回复缓存 {removed} 条")
+        return _cache
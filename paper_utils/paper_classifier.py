@@ -1,40 +1,356 @@
+import asyncio
+import json
+import os
+import re
+import random
+import logging
+
 import pandas as pd
 from tqdm import tqdm
 import openai
 
+import config
+from crawler.rate_limiter import parse_retry_after
+from paper_utils.llm_cache import cache_key, get_llm_cache
+
+logger = logging.getLogger(__name__)
 
-client = openai.OpenAI(
-    api_key="None",
-    base_url="http://10.8.27.22:30000/v1"
+# 分类使用的模型服务，旧的config.py中没有该项时使用默认值
+LLM_CONFIG = getattr(config, 'OPENAI_CONFIG', {})
+DEFAULT_MODEL = LLM_CONFIG.get('model', 'gpt-3.5-turbo')
+# 同时进行中的请求数
+MAX_CONCURRENCY = 16
+# 被限流、连接失败或服务端出错时的重试次数和退避时间（秒），退避时间按指数增长并加随机抖动
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# 每完成多少篇论文写一次检查点
+CHECKPOINT_EVERY = 100
+# 批量模式追加在系统提示词后的输出格式要求
+BATCH_INSTRUCTION = (
+    "\nYou will be given several numbered articles. Classify each article independently and "
+    "output only a JSON object mapping each article number to its label, e.g. {\"1\": \"0\", \"2\": \"1\"}."
 )
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def create_async_client():
+    """创建异步客户端，重试由chat_completion负责，关闭SDK自带的重试"""
+    return openai.AsyncOpenAI(
+        api_key=LLM_CONFIG.get('api_key', 'None'),
+        base_url=LLM_CONFIG.get('base_url'),
+        max_retries=0,
+    )
 
 
 def query_builder(title, abstract):
     return "title: '{}'\nabstract: '{}'\n".format(title, abstract)
 
 
-def classify_papers(test, train, task, prompt):
-    if not task in test.columns:
+def _retry_delay(error, attempt):
+    """服务端返回Retry-After时按其等待（不超过BACKOFF_MAX），否则指数退避"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        return min(parse_retry_after(retry_after), BACKOFF_MAX)
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1)
+
+
+async def chat_completion(client, messages, model=DEFAULT_MODEL, max_retries=MAX_RETRIES, cache=None):
+    """
+    调用一次对话补全，被限流、连接失败或服务端出错时退避重试；
+    相同模型和消息的回复从缓存读取，不再请求模型，缓存的SQLite读写在线程中执行，不阻塞事件循环
+
+    Args:
+        client: openai.AsyncOpenAI实例
+        messages: 对话消息
+        model: 模型名称
+        max_retries: 最大重试次数
+        cache: 回复缓存（paper_utils.llm_cache.LLMCache），默认使用按LLM_CACHE_CONFIG创建的共享缓存，
+            为False时不使用缓存
+
+    Returns:
+        str: 模型回复的内容
+    """
+    if cache is None:
+        cache = get_llm_cache()
+    elif cache is False:
+        cache = None
+    if cache is not None:
+        content = await asyncio.to_thread(cache.get, model, messages)
+        if content is not None:
+            return content
+    for attempt in range(max_retries + 1):
+        try:
+            chat = await client.chat.completions.create(model=model, messages=messages)
+            content = chat.choices[0].message.content
+            if cache is not None:
+                await asyncio.to_thread(cache.set, model, messages, content)
+            return content
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_delay(e, attempt)
+            logger.warning(f"请求失败，{delay:.1f} 秒后第 {attempt + 1} 次重试: {e}")
+            await asyncio.sleep(delay)
+
+
+class Checkpoint:
+    """分类结果的检查点：按JSON Lines追加写入，中断后重新运行时从中恢复已完成的论文"""
+
+    def __init__(self, path, task, every=CHECKPOINT_EVERY, fingerprint=None):
+        """
+        Args:
+            path: 检查点文件路径，为None时不保存
+            task: 分类任务名，同一文件可保存多个任务的结果
+            every: 每积累多少条结果写入一次
+            fingerprint: 提示词和模型的哈希，只恢复相同提示词和模型下的结果，修改提示词后重新分类
+        """
+        self.path = path
+        self.task = task
+        self.every = every
+        self.fingerprint = fingerprint
+        self._buffer = []
+
+    def load(self):
+        """
+        Returns:
+            dict: {行索引: (标题, 标签)}
+        """
+        results = {}
+        if not self.path or not os.path.exists(self.path):
+            return results
+        complete = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                complete += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('task') == self.task and record.get('fingerprint') == self.fingerprint:
+                    results[record['index']] = (record.get('title'), record['label'])
+        # 去掉写入到一半中断的最后一行，之后的结果从新的一行开始追加
+        if complete < os.path.getsize(self.path):
+            os.truncate(self.path, complete)
+        return results
+
+    def add(self, index, title, label):
+        if not self.path:
+            return
+        self._buffer.append({'task': self.task, 'fingerprint': self.fingerprint, 'index': index, 'title': title,
+                             'label': label})
+        if len(self._buffer) >= self.every:
+            self.flush()
+
+    def flush(self):
+        if not self.path or not self._buffer:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for record in self._buffer:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._buffer = []
+
+
+def _restore(test, task, checkpoint):
+    """用检查点中的结果填充尚未分类的行，标题不一致（文件已变化）的行忽略"""
+    restored = 0
+    for index, (title, label) in checkpoint.load().items():
+        if index in test.index and pd.isna(test.at[index, task]) and str(test.at[index, 'title']) == str(title):
+            test.at[index, task] = label
+            restored += 1
+    if restored:
+        logger.info(f"从检查点恢复 {restored} 条 {task} 分类结果")
+
+
+def batch_query_builder(papers):
+    """
+    多篇论文的请求内容，按从1开始的编号列出
+
+    Args:
+        papers: (标题, 摘要)列表
+    """
+    return "\n".join(f"[{i}]\n" + query_builder(title, abstract) for i, (title, abstract) in enumerate(papers, 1))
+
+
+def parse_batch_labels(content, size):
+    """
+    解析批量分类的JSON回复，如{"1": "0", "2": "1"}，兼容```json代码块和数组形式
+
+    Args:
+        content: 模型回复
+        size: 本批论文数量
+
+    Returns:
+        dict: {编号(从1开始): 标签字符串}，只包含格式正确的编号，无法解析时为空
+    """
+    content = (content or '').strip()
+    match = re.search(r'[\[{].*[\]}]', content, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    if isinstance(data, list):
+        data = {str(i): value for i, value in enumerate(data, 1)} if len(data) == size else {}
+    if not isinstance(data, dict):
+        return {}
+    labels = {}
+    for key, value in data.items():
+        key = str(key).strip('[] ')
+        if not key.isdigit() or not 1 <= int(key) <= size or value is None or isinstance(value, (dict, list)):
+            continue
+        labels[int(key)] = value if isinstance(value, str) else json.dumps(value)
+    return labels
+
+
+def _batch_history(prompt, train, task, batch_size):
+    """批量模式的提示词：要求按编号输出JSON，少样本示例按批量格式给出"""
+    history = [{"role": "system", "content": prompt + BATCH_INSTRUCTION}]
+    if train is not None and len(train):
+        for start in range(0, len(train), batch_size):
+            rows = range(start, min(start + batch_size, len(train)))
+            history += [
+                {"role": "user", "content": batch_query_builder(
+                    [(train["title"][i], train["abstract"][i]) for i in rows])},
+                {"role": "assistant", "content": json.dumps(
+                    {str(n): str(train[task][i]) for n, i in enumerate(rows, 1)}, ensure_ascii=False)},
+            ]
+    return history
+
+
+async def classify_papers_async(test, train, task, prompt, model=DEFAULT_MODEL, concurrency=MAX_CONCURRENCY,
+                                checkpoint_path=None, checkpoint_every=CHECKPOINT_EVERY, client=None,
+                                batch_size=1, cache=None):
+    """
+    并发分类论文，最多concurrency个请求同时进行，结果写入test[task]
+
+    Args:
+        test: 待分类的论文，需包含title和abstract列，task列已有值的行跳过
+        train: 可选的少样本示例，需包含title、abstract和task列
+        task: 分类任务名，即结果列名
+        prompt: 系统提示词
+        model: 模型名称
+        concurrency: 同时进行的请求数
+        checkpoint_path: 检查点文件路径，中断后以相同参数重新运行即可继续，提示词或模型变化后之前的结果不再恢复
+        checkpoint_every: 每完成多少篇论文写一次检查点
+        client: 可选的openai.AsyncOpenAI实例，默认按OPENAI_CONFIG创建
+        batch_size: 每个请求包含的论文数量，大于1时要求模型按编号输出JSON，
+            少样本示例和提示词只需发送一次；回复中缺失或无法解析的论文改为单篇请求
+        cache: 回复缓存，默认使用共享缓存，为False时不使用；相同提示词下已分类过的论文
+            （包括其他文件中的同一篇论文）直接使用缓存的回复
+
+    Returns:
+        pd.DataFrame: 填充了分类结果的test
+    """
+    if task not in test.columns:
         test[task] = None
+    test[task] = test[task].astype(object)
+    if cache is None:
+        cache = get_llm_cache()
+        # 未配置共享缓存时为False，传给chat_completion后不再查找
+        if cache is None:
+            cache = False
     history = [{"role": "system", "content": prompt}]
     if train is not None:
         for i in range(len(train)):
             history += ([{"role": "user", "content": query_builder(train["title"][i], train["abstract"][i])},
                          {"role": "assistant", "content": str(train[task][i])}])
-    for i in tqdm(range(len(test))):
-        if pd.isna(test[task][i]):
+    # 提示词（含少样本示例）和模型的哈希，检查点中只恢复与本次相同的结果
+    checkpoint = Checkpoint(checkpoint_path, task, checkpoint_every, fingerprint=cache_key(model, history)[:16])
+    _restore(test, task, checkpoint)
+    batch_history = _batch_history(prompt, train, task, batch_size) if batch_size > 1 else None
+
+    pending = [index for index in test.index if pd.isna(test.at[index, task])]
+    queue = asyncio.Queue()
+    for start in range(0, len(pending), batch_size):
+        queue.put_nowait(pending[start:start + batch_size])
+    progress = tqdm(total=len(pending), desc=task)
+    stats = {'failures': 0, 'fallbacks': 0}
+
+    def save(index, title, label):
+        test.at[index, task] = label
+        checkpoint.add(index, title, label)
+        progress.update(1)
+
+    async def classify_one(client, index):
+        title, abstract = test.at[index, "title"], test.at[index, "abstract"]
+        messages = history + [{"role": "user", "content": query_builder(title, abstract)}]
+        try:
+            label = await chat_completion(client, messages, model, cache=cache)
+        except Exception as e:
+            # 失败的论文不写入检查点，下次运行时重新分类
+            stats['failures'] += 1
+            logger.error(f"分类失败: {title}, 错误: {e}")
+            progress.update(1)
+        else:
+            save(index, title, label)
+
+    async def classify_batch(client, indices):
+        papers = [(test.at[index, "title"], test.at[index, "abstract"]) for index in indices]
+        messages = batch_history + [{"role": "user", "content": batch_query_builder(papers)}]
+        try:
+            labels = parse_batch_labels(await chat_completion(client, messages, model, cache=cache), len(indices))
+        except Exception as e:
+            logger.warning(f"批量分类失败，改为逐篇分类: {e}")
+            labels = {}
+        missing = []
+        for n, (index, (title, _)) in enumerate(zip(indices, papers), 1):
+            if n in labels:
+                save(index, title, labels[n])
+            else:
+                missing.append(index)
+        if missing:
+            stats['fallbacks'] += len(missing)
+            for index in missing:
+                await classify_one(client, index)
+
+    async def worker(client):
+        while True:
             try:
-                messages = history + [{"role": "user", "content": query_builder(test["title"][i], test["abstract"][i])}]
-                chat = client.chat.completions.create(model="gpt-3.5-turbo", messages=messages)
-                label = chat.choices[0].message.content
-            except Exception as e:
-                label = None
-                print(e)
-            test.loc[i, task] = label
+                indices = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if len(indices) == 1:
+                await classify_one(client, indices[0])
+            else:
+                await classify_batch(client, indices)
+
+    own_client = client is None
+    client = client or create_async_client()
+    try:
+        await asyncio.gather(*(worker(client) for _ in range(max(1, min(concurrency, queue.qsize())))))
+    finally:
+        checkpoint.flush()
+        progress.close()
+        if own_client:
+            await client.close()
+    if cache is not False:
+        logger.info(f"{task}: 回复缓存累计命中 {cache.hits} 次，未命中 {cache.misses} 次")
+    if stats['fallbacks']:
+        logger.info(f"{task}: {stats['fallbacks']} 篇论文的批量结果缺失或无法解析，已逐篇分类")
+    if stats['failures']:
+        logger.warning(f"{task}: {stats['failures']} 篇论文分类失败，重新运行可继续")
     return test
 
 
+def classify_papers(test, train, task, prompt, **kwargs):
+    """
+    classify_papers_async的同步入口，参数相同
+
+    Returns:
+        pd.DataFrame: 填充了分类结果的test
+    """
+    return asyncio.run(classify_papers_async(test, train, task, prompt, **kwargs))
+
+
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
 
     PREFIX = "You are an expert in NLP. Please classify the article according to its title and abstract. "
     PROMPT = {
@@ -50,12 +366,14 @@ if __name__ == '__main__':
     }
     SUFFIX = "No need for explanation."
 
-
-    sum_test = pd.read_csv("data/evaluation_summarization_llm_all.csv")
+    input_file = "data/evaluation_summarization_llm_all.csv"
+    sum_test = pd.read_csv(input_file)
     # sum_train = pd.read_csv(f"data/LLM_train.csv")
     for task in PROMPT:
         prompt = PREFIX + PROMPT[task] + SUFFIX
-        sum_test = classify_papers(sum_test, None, task, prompt)
+        # 每个请求分类10篇论文，提示词只发送一次
+        sum_test = classify_papers(sum_test, None, task, prompt, checkpoint_path=input_file + ".checkpoint.jsonl",
+                                   batch_size=10)
 
     # for task in PROMPT:
     #     prompt = PREFIX + PROMPT[task] + SUFFIX
@@ -64,4 +382,4 @@ if __name__ == '__main__':
     #         sum_test = classify_papers(sum_test, None, task, prompt)
     #     else:
     #         sum_test = classify_papers(sum_test, sum_train, task, prompt)
-    sum_test.to_csv("data/evaluation_summarization_llm_all.csv", index=False)
+    sum_test.to_csv(input_file, index=False)
@@ -0,0 +1,301 @@
+import os
+import sys
+import time
+import logging
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from paper_utils.embedding_index import DEFAULT_EMBEDDING_DIM, parse_vector
+
+logger = logging.getLogger(__name__)
+
+# 每次从数据库读取并写入一个批次的论文数量
+DEFAULT_BATCH_SIZE = 1000
+# papers表导出的列及类型；title_norm、search_vector等生成列不导出，导入时由数据库重新生成
+PAPER_FIELDS = [
+    ('id', pa.string()),
+    ('title', pa.string()),
+    ('authors', pa.string()),
+    ('description', pa.string()),
+    ('pub_year', pa.int32()),
+    ('num_citations', pa.int32()),
+    ('bib', pa.string()),
+    ('bib_hash', pa.string()),
+    ('ref_apa', pa.string()),
+    ('ref_mla', pa.string()),
+    ('ref_gb7714', pa.string()),
+    ('pub_url', pa.string()),
+    ('bib_url', pa.string()),
+    ('citedby_url', pa.string()),
+    ('abstract', pa.string()),
+    ('keywords', pa.string()),
+    ('doi', pa.string()),
+    ('pdf_url', pa.string()),
+    ('file_hash', pa.string()),
+    ('file_size', pa.int64()),
+    ('created_at', pa.timestamp('us', tz='UTC')),
+    ('updated_at', pa.timestamp('us', tz='UTC')),
+]
+# 导入时不写入的列：时间戳由触发器生成，其余为导出时附加的列
+IMPORT_EXCLUDED = {'created_at', 'updated_at', 'result_index', 'added_by'}
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+
+def paper_schema(include_embedding=False, extra_fields=()):
+    """
+    论文导出文件的列类型
+
+    Args:
+        include_embedding: 是否包含论文向量，类型为定长float32列表
+        extra_fields: 附加在最前面的列，如搜索结果的result_index
+
+    Returns:
+        pa.Schema: 列类型
+    """
+    fields = list(extra_fields) + PAPER_FIELDS
+    if include_embedding:
+        fields.append(('embedding', pa.list_(pa.float32(), DEFAULT_EMBEDDING_DIM)))
+    return pa.schema(fields)
+
+
+def _parse_timestamp(value):
+    if not value or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def rows_to_batch(rows, schema):
+    """
+    将数据库返回的论文字典转换为Arrow批次：解析时间戳和pgvector字符串，忽略schema之外的字段
+
+    Returns:
+        pa.RecordBatch: 类型与schema一致的批次
+    """
+    columns = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        if pa.types.is_timestamp(field.type):
+            values = [_parse_timestamp(value) for value in values]
+        elif pa.types.is_fixed_size_list(field.type):
+            values = [parse_vector(value).tolist() if value is not None else None for value in values]
+        columns.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class PaperWriter:
+    """按批次写入Parquet或Arrow IPC文件，扩展名为.arrow/.feather/.ipc时写Arrow，否则写Parquet"""
+
+    def __init__(self, path, schema, compression='zstd'):
+        """
+        Args:
+            path: 输出文件路径
+            schema: 列类型，见paper_schema
+            compression: 压缩算法
+        """
+        self.path = path
+        self.schema = schema
+        self.count = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith(ARROW_EXTENSIONS):
+            self._writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+        else:
+            self._writer = pq.ParquetWriter(path, schema, compression=compression)
+
+    def write_rows(self, rows):
+        """写入一批论文字典"""
+        if not rows:
+            return
+        self._writer.write_batch(rows_to_batch(rows, self.schema))
+        self.count += len(rows)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def export_batches(batches, path, schema):
+    """
+    将论文批次流式写入文件，内存占用只与批次大小有关
+
+    Args:
+        batches: 论文字典列表的迭代器，如PaperOperations.iter_papers
+        path: 输出文件路径
+        schema: 列类型
+
+    Returns:
+        dict: success、message、path、count
+    """
+    start = time.perf_counter()
+    try:
+        with PaperWriter(path, schema) as writer:
+            for rows in batches:
+                writer.write_rows(rows)
+        message = f"导出 {writer.count} 篇论文到 {path}，用时 {time.perf_counter() - start:.1f} 秒"
+        logger.info(message)
+        return {'success': True, 'message': message, 'path': path, 'count': writer.count}
+    except Exception as e:
+        logger.error(f"导出论文失败: {e}")
+        return {'success': False, 'message': f'导出论文失败: {str(e)}', 'path': path, 'count': 0}
+
+
+def export_papers(paper_ops, path, include_embedding=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    导出papers表的全部论文
+
+    Args:
+        paper_ops: PaperOperations实例
+        path: 输出文件路径
+        include_embedding: 是否导出论文向量
+        batch_size: 每批读取和写入的论文数量
+
+    Returns:
+        dict: success、message、path、count
+    """
+    schema = paper_schema(include_embedding)
+    columns = ','.join(schema.names)
+    return export_batches(paper_ops.iter_papers(columns, batch_size), path, schema)
+
+
+def export_session(paper_ops, session_id, path, include_embedding=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    按结果顺序导出一次搜索的论文，附加result_index列
+
+    Returns:
+        dict: success、message、path、count
+    """
+    schema = paper_schema(include_embedding, [('result_index', pa.int32())])
+    columns = ','.join(paper_schema(include_embedding).names)
+    return export_batches(paper_ops.iter_session_papers(session_id, batch_size, columns), path, schema)
+
+
+def export_knowledge_base(kb_ops, kb_id, path, include_embedding=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    导出知识库中的论文，附加添加者added_by列
+
+    Args:
+        kb_ops: KnowledgeBaseOperations实例
+
+    Returns:
+        dict: success、message、path、count
+    """
+    schema = paper_schema(include_embedding, [('added_by', pa.string())])
+    columns = ','.join(paper_schema(include_embedding).names)
+    return export_batches(kb_ops.iter_knowledge_base_papers(kb_id, batch_size, columns), path, schema)
+
+
+def iter_record_batches(path, columns=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    按批次读取导出文件，只读取需要的列
+
+    Args:
+        path: Parquet或Arrow文件路径
+        columns: 需要的列，默认全部
+        batch_size: Parquet每批的行数，Arrow文件按写入时的批次返回
+
+    Yields:
+        pa.RecordBatch: 论文批次
+    """
+    if path.endswith(ARROW_EXTENSIONS):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                yield batch.select(columns) if columns else batch
+    else:
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns)
+
+
+def read_papers(path, columns=None):
+    """
+    读取论文数据为DataFrame，供离线分析使用；Parquet和Arrow只读取需要的列，
+    CSV和Excel按原方式读取
+
+    Args:
+        path: 文件路径
+        columns: 需要的列，默认全部
+
+    Returns:
+        pd.DataFrame: 论文数据
+    """
+    if path.endswith(ARROW_EXTENSIONS):
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        return (table.select(columns) if columns else table).to_pandas()
+    if path.endswith('.parquet'):
+        return pq.read_table(path, columns=columns).to_pandas()
+    import pandas as pd
+    if path.endswith(('.xlsx', '.xls')):
+        return pd.read_excel(path, usecols=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def import_papers(paper_ops, path, batch_size=500):
+    """
+    将导出文件中的论文按批次导入papers表，已存在的ID跳过
+
+    Args:
+        paper_ops: PaperOperations实例
+        path: Parquet或Arrow文件路径
+        batch_size: 每批写入的论文数量
+
+    Returns:
+        dict: success、message、inserted、skipped
+    """
+    inserted = skipped = 0
+    try:
+        for batch in iter_record_batches(path, batch_size=batch_size):
+            rows = [{key: value for key, value in row.items() if key not in IMPORT_EXCLUDED and value is not None}
+                    for row in batch.to_pylist()]
+            ids = [row['id'] for row in rows if row.get('id')]
+            existing = {paper['id'] for paper in paper_ops.get_papers_by_ids(ids, 'id')}
+            new_papers = [row for row in rows if row.get('id') not in existing]
+            skipped += len(rows) - len(new_papers)
+            if new_papers:
+                # batch_insert_papers出错时只记录日志并返回空列表，按返回数量判断是否全部写入
+                result = paper_ops.batch_insert_papers(new_papers)
+                inserted += len(result)
+                if len(result) != len(new_papers):
+                    message = f'导入论文失败: 写入 {len(new_papers)} 篇论文，成功 {len(result)} 篇'
+                    logger.error(message)
+                    return {'success': False, 'message': message, 'inserted': inserted, 'skipped': skipped}
+    except Exception as e:
+        logger.error(f"导入论文失败: {e}")
+        return {'success': False, 'message': f'导入论文失败: {str(e)}', 'inserted': inserted, 'skipped': skipped}
+    return {'success': True, 'message': f'导入 {inserted} 篇论文，跳过已存在的 {skipped} 篇',
+            'inserted': inserted, 'skipped': skipped}
+
+
+if __name__ == '__main__':
+    # 用法:
+    #   python -m paper_utils.paper_export papers 输出文件 [--embedding]
+    #   python -m paper_utils.paper_export session 搜索会话ID 输出文件
+    #   python -m paper_utils.paper_export kb 知识库ID 输出文件
+    #   python -m paper_utils.paper_export import 输入文件
+    from db.knowledge_base_operations import KnowledgeBaseOperations
+    from db.paper_operations import PaperOperations
+    from db.supabase_client import SupabaseInitializer
+
+    logging.basicConfig(level=logging.INFO)
+    args = [arg for arg in sys.argv[1:] if arg != '--embedding']
+    include_embedding = '--embedding' in sys.argv
+    paper_ops = PaperOperations(SupabaseInitializer().supabase)
+    if args[0] == 'papers':
+        result = export_papers(paper_ops, args[1], include_embedding)
+    elif args[0] == 'session':
+        result = export_session(paper_ops, args[1], args[2], include_embedding)
+    elif args[0] == 'kb':
+        result = export_knowledge_base(KnowledgeBaseOperations(), args[1], args[2], include_embedding)
+    elif args[0] == 'import':
+        result = import_papers(paper_ops, args[1])
+    else:
+        raise SystemExit(f"未知命令: {args[0]}")
+    print(result['message'])
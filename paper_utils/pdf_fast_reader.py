@@ -6,8 +6,70 @@ E-mail  : jin@smail.swufe.edu.cn
 """
 import re
 import copy
+import itertools
 import fitz
 from io import BytesIO
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+REFERENCE_HEADINGS = {"references", "reference", "bibliography"}
+
+
+@dataclass
+class PDFSection:
+    """流式解析得到的一个章节"""
+    heading: Optional[str]  # 章节标题，首个章节（标题、作者等）为None
+    text: str
+    page_start: int  # 起始页码，从1开始
+    page_end: int
+    start: int = 0  # 在PDFParseResult.text中的起止偏移，仅parse时填写
+    end: int = 0
+
+
+@dataclass
+class PDFParseResult:
+    """一次解析得到的结构化结果，供引文网络、问答等功能复用"""
+    sections: List[PDFSection] = field(default_factory=list)  # 全部章节（含参考文献与附录），按原文顺序
+    references: List[str] = field(default_factory=list)  # 拆分后的参考文献条目
+    references_index: Optional[int] = None  # 参考文献章节在sections中的位置
+    text: str = ""  # 全文，章节以"# 标题"开头
+
+    @property
+    def body(self) -> List[PDFSection]:
+        """参考文献之前的正文章节"""
+        if self.references_index is None:
+            return self.sections
+        return self.sections[:self.references_index]
+
+    @property
+    def appendix(self) -> List[PDFSection]:
+        """参考文献之后的附录章节"""
+        if self.references_index is None:
+            return []
+        return self.sections[self.references_index + 1:]
+
+    @property
+    def body_text(self) -> str:
+        """正文部分的文本，相当于REMOVE_APPENDIX时去掉参考文献的结果"""
+        if self.references_index is None:
+            return self.text
+        return self.text[:self.sections[self.references_index].start].strip()
+
+
+def _lookahead(iterable):
+    """
+        逐个返回元素，并标记其是否为最后一个
+        yield: (元素, 是否最后一个)
+    """
+    it = iter(iterable)
+    try:
+        prev = next(it)
+    except StopIteration:
+        return
+    for item in it:
+        yield prev, False
+        prev = item
+    yield prev, True
 
 
 class PDFFastReader:
@@ -22,82 +84,105 @@ class PDFFastReader:
         self.itxt = 0  # Index 0 文本
         self.ifont = 1  # Index 1 字体大小
         self.ibbox = 2  # Index 2 文本框大小
+        self.ipage = 4  # Index 4 页码
         self.REMOVE_FSIZE_PERCENT = REMOVE_FSIZE_PERCENT
         self.REMOVE_APPENDIX = REMOVE_APPENDIX
         self.REMOVE_PATTERN = re.compile(STOP_WORDS, re.I)
         self.fp = fp
         self.content = content
 
+    def _open_doc(self, fp=None, content=None):
+        if content is not None:
+            # 从字节内容读取PDF
+            return fitz.open(stream=BytesIO(content), filetype="pdf")
+        if fp is not None:
+            # 从文件路径读取PDF
+            return fitz.open(fp)
+        # 默认从初始化时提供的fp或content读取
+        if self.content is not None:
+            return fitz.open(stream=BytesIO(self.content), filetype="pdf")
+        return fitz.open(self.fp)
+
+    def iter_pages(self, fp=None, content=None, fsize_all=None):
+        """
+            逐页获得pdf的行，只缓存一页
+            fsize_all: 字体大小统计，边读边累加，可由调用方传入以获得正文字体
+            yield: (页码, 该页每一行[文本,字体,位置和大小,元数据,页码])
+        """
+        if fsize_all is None:
+            fsize_all = {}
+        doc = self._open_doc(fp, content)
+        try:
+            page_lines = None
+            for page in doc:
+                # 去除页码
+                if page_lines and page_lines[-1][self.itxt].isdigit():
+                    page_lines.pop(-1)
+                if page_lines is not None:
+                    yield page_lines_no, page_lines
+                page_lines_no = page.number + 1
+                page_lines = []
+                text_areas = page.get_text("dict")
+                for block in text_areas["blocks"]:
+                    if "lines" in block:
+                        for line in block["lines"]:
+                            txt = "".join([i["text"] for i in line["spans"]])
+                            if len(txt) == 0:
+                                continue
+                            font_size = {}
+                            for span in line["spans"]:
+                                font_size[span["size"]] = fsize_all.setdefault(span["size"], 0) + len(span["text"])
+                                fsize_all[span["size"]] = font_size.setdefault(span["size"], 0) + len(span["text"])
+                            pf = max(font_size, key=font_size.get)
+                            page_lines.append([txt, pf, line["bbox"], line, page_lines_no])
+            if page_lines is not None:
+                yield page_lines_no, page_lines
+        finally:
+            doc.close()
+
     def read_lines(self, fp=None, content=None):
         """
             获得pdf的每一行
-            return: (每一行包括[文本,字体,位置和大小,元数据], 正文字体大小)
+            return: (每一行包括[文本,字体,位置和大小,元数据,页码], 正文字体大小)
         """
-        if content is not None:
-            # 从字节内容读取PDF
-            doc = fitz.open(stream=BytesIO(content), filetype="pdf")
-        elif fp is not None:
-            # 从文件路径读取PDF
-            doc = fitz.open(fp)
-        else:
-            # 默认从初始化时提供的fp或content读取
-            if self.content is not None:
-                doc = fitz.open(stream=BytesIO(self.content), filetype="pdf")
-            else:
-                doc = fitz.open(self.fp)
-        
         meta_line = []
         fsize_all = {}
-        for page in doc:
-            # 去除页码
-            if meta_line and meta_line[-1][self.itxt].isdigit():
-                meta_line.pop(-1)
-            text_areas = page.get_text("dict")
-            for block in text_areas["blocks"]:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        txt = "".join([i["text"] for i in line["spans"]])
-                        if len(txt) == 0:
-                            continue
-                        font_size = {}
-                        for span in line["spans"]:
-                            font_size[span["size"]] = fsize_all.setdefault(span["size"], 0) + len(span["text"])
-                            fsize_all[span["size"]] = font_size.setdefault(span["size"], 0) + len(span["text"])
-                        pf = max(font_size, key=font_size.get)
-                        meta_line.append([txt, pf, line["bbox"], line])
+        for _, page_lines in self.iter_pages(fp, content, fsize_all):
+            meta_line.extend(page_lines)
         # 主字体
         main_fsize = max(fsize_all, key=fsize_all.get)
-        doc.close()
         return meta_line, main_fsize
 
-    def get_section(self, meta_line, main_fsize):
+    def iter_raw_sections(self, meta_line, main_fsize):
         """
-            获得论文的每一章节
-            return:每一章节的列表
+            逐行划分章节，每得到一个完整章节即返回，meta_line可以是生成器
+            yield: (章节文本列表, 起始页, 结束页)
         """
         fsize_threshold = main_fsize * self.REMOVE_FSIZE_PERCENT
-        meta_sec = []
         sec = []
+        page_start = page_end = None
+        prev = None
         # 去除停用词
-        meta_line = [line for line in meta_line if not re.findall(self.REMOVE_PATTERN, line[self.itxt]) and
-                     not line[self.ifont] <= fsize_threshold]
-        for i, line in enumerate(meta_line):
-            if i == 0:
+        meta_line = (line for line in meta_line if not re.findall(self.REMOVE_PATTERN, line[self.itxt]) and
+                     not line[self.ifont] <= fsize_threshold)
+        for line, is_last in _lookahead(meta_line):
+            last, prev = prev, line
+            if last is None:
                 sec.append(line[self.itxt])
-                continue
-            if fsize_threshold and line[self.ifont] <= fsize_threshold:
+                page_start = page_end = line[self.ipage]
                 continue
             if line[self.itxt] == "Abstract":
-                meta_sec.append(copy.deepcopy(sec))
+                yield copy.deepcopy(sec), page_start, page_end
                 sec = ["\n# " + line[self.itxt]]
+                page_start = page_end = line[self.ipage]
                 continue
-            if line[self.ibbox][0] > meta_line[i - 1][self.ibbox][0] * 1.5:
+            if line[self.ibbox][0] > last[self.ibbox][0] * 1.5:
                 continue
             # 上下两段字体相差小，即正文段落
-            fsize_gap = (line[self.ifont] - meta_line[i - 1][self.ifont]) / max(line[self.ifont], meta_line[i - 1][self.ifont])
+            fsize_gap = (line[self.ifont] - last[self.ifont]) / max(line[self.ifont], last[self.ifont])
             if abs(fsize_gap) < 0.02:
                 # 长单词换行时会以-分割，故去掉每行末尾的-并与下一行衔接
-                if meta_line[i - 1][self.itxt].endswith("-"):
+                if last[self.itxt].endswith("-"):
                     sec[-1] = sec[-1][:-1]
                 else:
                     sec[-1] += " "
@@ -105,19 +190,110 @@ class PDFFastReader:
                 # bbox: ((左上角坐标)，(右下角坐标))
                 # 不同段落，或图表标题
                 if line[self.itxt].endswith(".") and \
-                        (meta_line[i - 1][self.itxt] != "NEW_BLOCK") and \
+                        (last[self.itxt] != "NEW_BLOCK") and \
                         (line[self.ibbox][2] - line[self.ibbox][0]) < (
-                        meta_line[i - 1][self.ibbox][2] - meta_line[i - 1][self.ibbox][0]) * 0.7:
+                        last[self.ibbox][2] - last[self.ibbox][0]) * 0.7:
                     sec[-1] += "\n"
+                page_end = line[self.ipage]
             else:
                 # 单行且字体大且比上一行大，视作标题，加入#前缀
-                if (i + 1 < len(meta_line)) and meta_line[i][self.ifont] > main_fsize and fsize_gap > 0:
-                    meta_sec.append(copy.deepcopy(sec))
+                if not is_last and line[self.ifont] > main_fsize and fsize_gap > 0:
+                    yield copy.deepcopy(sec), page_start, page_end
                     sec = ["\n# " + line[self.itxt]]
+                    page_start = line[self.ipage]
                 else:
                     sec.append("\n" + line[self.itxt])
-        meta_sec.append(copy.deepcopy(sec))
-        return meta_sec
+                page_end = line[self.ipage]
+        yield copy.deepcopy(sec), page_start, page_end
+
+    def get_section(self, meta_line, main_fsize):
+        """
+            获得论文的每一章节
+            return:每一章节的列表
+        """
+        return [sec for sec, _, _ in self.iter_raw_sections(meta_line, main_fsize)]
+
+    def iter_raw_sections_from(self, fp=None, content=None, fsize_pages=3):
+        """
+            流式读取pdf并划分章节
+            fsize_pages: 用前几页估计正文字体大小，之后逐页解析
+            yield: (章节文本列表, 起始页, 结束页)
+        """
+        fsize_all = {}
+        pages = self.iter_pages(fp, content, fsize_all)
+        try:
+            head = list(itertools.islice(pages, fsize_pages))
+            if not fsize_all:
+                return
+            main_fsize = max(fsize_all, key=fsize_all.get)
+            meta_line = itertools.chain.from_iterable(page_lines for _, page_lines in itertools.chain(head, pages))
+            for sec, page_start, page_end in self.iter_raw_sections(meta_line, main_fsize):
+                if sec:
+                    yield sec, page_start, page_end
+        finally:
+            pages.close()
+
+    def iter_sections(self, fp=None, content=None, fsize_pages=3):
+        """
+            流式解析pdf，每解析出一个章节即返回，无需等待整篇文档处理完毕，也不在内存中保存全文
+            fsize_pages: 用前几页估计正文字体大小，之后逐页解析
+            yield: PDFSection
+        """
+        for sec, page_start, page_end in self.iter_raw_sections_from(fp, content, fsize_pages):
+            yield self.to_section(sec, page_start, page_end)
+            if self.REMOVE_APPENDIX and sec[0].lower() == "\n# references":
+                break
+
+    def parse(self, fp=None, content=None, fsize_pages=3):
+        """
+            一次解析得到结构化结果：章节（标题、页码、偏移）以及拆分后的参考文献，
+            不受REMOVE_APPENDIX影响，附录章节同样保留
+            return: PDFParseResult
+        """
+        result = PDFParseResult()
+        blocks = []
+        offset = 0
+        for sec, page_start, page_end in self.iter_raw_sections_from(fp, content, fsize_pages):
+            section = self.to_section(sec, page_start, page_end)
+            block = f"# {section.heading}\n{section.text}" if section.heading else section.text
+            section.start = offset
+            section.end = offset + len(block)
+            offset = section.end + 1
+            blocks.append(block)
+            if result.references_index is None and section.heading and \
+                    section.heading.lower() in REFERENCE_HEADINGS:
+                result.references_index = len(result.sections)
+                result.references = self.split_references(section.text)
+            result.sections.append(section)
+        result.text = "\n".join(blocks)
+        return result
+
+    @staticmethod
+    def split_references(text):
+        """
+            将参考文献章节拆分为条目，依次尝试[1]编号、1.编号和按行拆分
+        """
+        if re.search(r"^\[\d{1,3}\]", text.strip()):
+            items = re.split(r"\s*(?=\[\d{1,3}\]\s)", text)
+        elif re.match(r"^\d{1,3}\.\s", text.strip()):
+            items = re.split(r"\n(?=\d{1,3}\.\s)", text)
+        else:
+            items = text.split("\n")
+        items = [re.sub(r"\s+", " ", item).strip() for item in items]
+        return [item for item in items if len(item) > 10]
+
+    def to_section(self, sec, page_start, page_end):
+        """
+            将章节文本列表整理为PDFSection
+        """
+        heading = None
+        if sec[0].startswith("\n# "):
+            heading = sec[0][len("\n# "):].strip()
+            sec = sec[1:]
+        text = " ".join(sec).strip()
+        text = re.sub(r'\s\n', '\n', text)
+        text = re.sub(r'\n+', '\n', text)
+        return PDFSection(heading=heading, text=text, page_start=page_start, page_end=page_end)
 
     def get_text(self, meta_sec):
         """
@@ -179,6 +355,14 @@ if __name__ == '__main__':
     pr = PDFFastReader(fp)
     txt = pr.forward(abstract_only=True)
     print(txt)
+
+    # 流式解析：每解析出一个章节即可交给下游处理
+    for section in pr.iter_sections():
+        print(section.heading, section.page_start, section.page_end, len(section.text))
+
+    # 结构化解析：章节与参考文献一次得到
+    result = pr.parse()
+    print([section.heading for section in result.body], len(result.references))
     
     # 新增的基于字节内容的使用方式示例（需要先有content）
     # content = main_download_pdf_contents("Attention Is All You Need", "https://arxiv.org/abs/1706.03762")
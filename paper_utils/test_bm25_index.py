@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25索引的回归测试：删除后的IDF、部分字段更新后的检索结果
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paper_utils.bm25_index import BM25Index
+
+PAPERS = [
+    {'id': '1', 'title': 'attention is all you need', 'abstract': 'transformer attention'},
+    {'id': '2', 'title': 'attention based recurrent model', 'abstract': 'attention for translation'},
+    {'id': '3', 'title': 'convolutional attention network', 'abstract': 'image classification'},
+    {'id': '4', 'title': 'graph neural network', 'abstract': 'message passing'},
+]
+
+
+@pytest.mark.parametrize('store_docs', [True, False])
+def test_search_after_remove(store_docs):
+    """删除论文后仍按未删除的文档计算IDF，得分为正且顺序与重建的索引一致"""
+    index = BM25Index(store_docs=store_docs)
+    index.add_papers(PAPERS)
+    index.refresh()
+    index.remove_papers(['2'])
+    hits = index.search('attention')
+    assert [paper_id for paper_id, _ in hits] == ['1', '3']
+    assert all(score > 0 for _, score in hits)
+
+    rebuilt = BM25Index(store_docs=store_docs)
+    rebuilt.add_papers([paper for paper in PAPERS if paper['id'] != '2'])
+    assert hits == pytest.approx(rebuilt.search('attention'))
+
+
+def test_search_after_remove_all():
+    index = BM25Index()
+    index.add_papers(PAPERS[:1])
+    index.refresh()
+    index.remove_papers(['1'])
+    assert index.search('attention') == []
+    index.add_papers([{'id': '5', 'title': ''}])
+    assert index.search('attention') == []
+
+
+def test_update_non_indexed_field():
+    """只更新PDF等非索引字段时论文仍可被检索"""
+    for store_docs in (True, False):
+        index = BM25Index(store_docs=store_docs)
+        index.add_papers(PAPERS)
+        index.update_paper('1', {'pdf_url': 'https://example.com/1.pdf'})
+        assert '1' in [paper_id for paper_id, _ in index.search('transformer')]
+
+
+def test_update_indexed_field():
+    index = BM25Index(store_docs=True)
+    index.add_papers(PAPERS)
+    index.update_paper('1', {'abstract': 'sequence modeling'})
+    assert index.search('transformer') == []
+    assert '1' in [paper_id for paper_id, _ in index.search('attention')]
+    assert index.get_paper('1')['title'] == PAPERS[0]['title']
+
+    index = BM25Index(store_docs=False)
+    index.add_papers(PAPERS)
+    with pytest.raises(ValueError):
+        index.update_paper('1', {'abstract': 'sequence modeling'})
+    index.update_paper('1', {'title': 'attention', 'keywords': None, 'abstract': 'sequence modeling'})
+    assert index.search('transformer') == []
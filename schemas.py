@@ -34,6 +34,10 @@ class Paper:
     pub_year: Optional[int] = None
     num_citations: int = 0
     bib: Optional[str] = None
+    bib_hash: Optional[str] = None
+    ref_apa: Optional[str] = None
+    ref_mla: Optional[str] = None
+    ref_gb7714: Optional[str] = None
     pub_url: Optional[str] = None
     bib_url: Optional[str] = None
     citedby_url: Optional[str] = None
@@ -46,6 +50,14 @@ class Paper:
     updated_at: Optional[datetime] = None
 
 
+# Columns of the papers table returned by the API. The generated search columns
+# (title_norm, doi_norm, search_vector) and the embedding are only used inside the database.
+PAPER_COLUMNS = (
+    'id,title,authors,description,pub_year,num_citations,bib,bib_hash,ref_apa,ref_mla,ref_gb7714,'
+    'pub_url,bib_url,citedby_url,abstract,keywords,doi,pdf_url,file_hash,file_size,created_at,updated_at'
+)
+
+
 @dataclass
 class SearchTask:
     """Search task information for tracking progress and status."""
@@ -56,6 +68,10 @@ class SearchTask:
     year_high: Optional[int] = None
     limit_num: int = 20
     status: str = "pending"
+    scholar_cursor: int = 0
+    fetched_num: int = 0
+    processed_num: int = 0
+    message: Optional[str] = None
     created_at: Optional[datetime] = None
 
 